@@ -0,0 +1,133 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+from config.settings import TEMPLATES_DIR
+from config.mappings import DEBIT_MAPPING_PAYD, CREDIT_MAPPING_PEYD, DEBIT_MAPPING_COMPLETED
+
+# Образец выгрузки: из него берутся схема, ширина строк и распределения
+SEED_FILE = os.path.join(TEMPLATES_DIR, 'completed.csv')
+
+# Все провайдеры из config.mappings
+PROVIDERS = sorted(set(DEBIT_MAPPING_PAYD) | set(CREDIT_MAPPING_PEYD) | set(DEBIT_MAPPING_COMPLETED))
+
+# Форматы колонки Completed и их доли: основной формат выгрузки и примеси
+COMPLETED_FORMATS = [
+    ('%d/%m/%Y %H:%M:%S', 0.85),
+    ('%Y-%m-%d %H:%M:%S', 0.10),
+    ('%d.%m.%Y %H:%M:%S', 0.05),
+]
+
+# Доля строк с ненулевым Additionall Fee (как в образце)
+ADDITIONAL_FEE_SHARE = 0.23
+
+# Доля имен с запятой или кавычкой, которые пишутся в кавычках
+QUOTED_NAME_SHARE = 0.02
+
+PERIOD_START = pd.Timestamp('2025-01-01')
+PERIOD_SECONDS = 31 * 24 * 3600
+
+CHUNK_ROWS = 100000
+
+
+def load_seed(seed_file=SEED_FILE):
+    """Читает образец без преобразования значений, чтобы широкие колонки переносились как есть."""
+    return pd.read_csv(seed_file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+
+
+def provider_weights(seed):
+    """Частоты провайдеров из образца; провайдеры, которых там нет, получают небольшую долю."""
+    counts = seed['Payment Provider'].value_counts()
+    weights = np.array([counts.get(provider, 0) for provider in PROVIDERS], dtype=float)
+    weights = np.maximum(weights, weights.sum() * 0.005)
+    return weights / weights.sum()
+
+
+def format_paid(timestamps):
+    """Форматирует даты Paid как в выгрузке: 1/31/25 19:50 (без ведущих нулей в дате)."""
+    return (timestamps.month.astype(str) + '/' + timestamps.day.astype(str) + '/'
+            + timestamps.strftime('%y %H:%M'))
+
+
+def format_completed(timestamps, rng):
+    """Форматирует даты Completed, смешивая несколько форматов."""
+    formats = [date_format for date_format, _ in COMPLETED_FORMATS]
+    shares = [share for _, share in COMPLETED_FORMATS]
+    choice = rng.choice(len(formats), size=len(timestamps), p=shares)
+    result = np.empty(len(timestamps), dtype=object)
+    for index, date_format in enumerate(formats):
+        mask = choice == index
+        result[mask] = np.asarray(timestamps[mask].strftime(date_format), dtype=object)
+    return result
+
+
+def build_names(seed, size, rng):
+    """Имена из образца, часть из них с запятой или кавычками."""
+    names = seed['Name'].to_numpy(dtype=object)[rng.integers(0, len(seed), size)]
+    quoted = rng.random(size) < QUOTED_NAME_SHARE
+    names[quoted] = [f'{name}, "Ltd"' for name in names[quoted]]
+    return names
+
+
+def build_amounts(size, rng):
+    """Суммы с распределением как в образце: Total = Reseller + Net с точностью до центов."""
+    fval = np.round(np.exp(rng.normal(7.0, 1.2, size)).clip(100, 100000), 2)
+    total = np.round(fval * rng.uniform(0.08, 0.2, size), 2)
+    reseller = np.round(total * rng.uniform(0.2, 0.4, size), 2)
+    net = np.round(total - reseller, 2)
+    fee = np.where(rng.random(size) < ADDITIONAL_FEE_SHARE,
+                   np.round(np.exp(rng.normal(3.7, 1.1, size)).clip(1, 2000), 2), np.nan)
+    return fval, total, reseller, net, fee
+
+
+def build_chunk(seed, start, size, rng, weights):
+    """Строит часть синтетической выгрузки в схеме образца.
+    Колонки, которые не участвуют в обработке, копируются из случайных строк образца,
+    поэтому ширина строк (включая Meta) остается реалистичной."""
+    chunk = seed.iloc[rng.integers(0, len(seed), size)].reset_index(drop=True)
+
+    providers = np.asarray(PROVIDERS, dtype=object)[rng.choice(len(PROVIDERS), size=size, p=weights)]
+    chunk['Order'] = [f'BE{number:08d}' for number in range(start + 1, start + size + 1)]
+    chunk['Name'] = build_names(seed, size, rng)
+    chunk['Payment Provider'] = providers
+    chunk['Payment Method'] = np.where(providers == 'wire_transfer', 'wire_transfer', 'CC / APM')
+
+    paid = PERIOD_START + pd.to_timedelta(rng.integers(0, PERIOD_SECONDS, size), unit='s')
+    completed = paid + pd.to_timedelta(rng.integers(60, 3 * 24 * 3600, size), unit='s')
+    chunk['Paid'] = format_paid(paid)
+    chunk['Completed'] = format_completed(completed, rng)
+
+    fval, total, reseller, net, fee = build_amounts(size, rng)
+    chunk['Fval EUR'] = fval
+    chunk['Total Fee EUR'] = total
+    chunk['Reseller\nFee EUR'] = reseller
+    chunk['Net\nFee EUR'] = net
+    chunk['Additionall Fee'] = fee
+    return chunk
+
+
+def generate(rows, output_file, seed=0, seed_file=SEED_FILE, chunk_rows=CHUNK_ROWS):
+    """Создает синтетическую выгрузку из rows строк. При одинаковом seed файл совпадает побайтно.
+    :return: Путь к созданному файлу."""
+    source = load_seed(seed_file)
+    rng = np.random.default_rng(seed)
+    weights = provider_weights(source)
+    with open(output_file, 'w', encoding='utf-8', newline='') as handle:
+        # Пустая выгрузка все равно содержит строку заголовков
+        for start in range(0, max(rows, 1), chunk_rows):
+            chunk = build_chunk(source, start, min(chunk_rows, rows - start), rng, weights)
+            chunk.to_csv(handle, index=False, header=start == 0)
+    return output_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Генерация синтетической выгрузки для бенчмарков')
+    parser.add_argument('rows', type=int, help='Количество строк')
+    parser.add_argument('output', help='Путь к выходному файлу')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    generate(args.rows, args.output, seed=args.seed)
+
+
+if __name__ == '__main__':
+    main()
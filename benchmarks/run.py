@@ -0,0 +1,148 @@
+# Бенчмарк генерации отчетов.
+#
+# Запуск из корня репозитория:
+#     python -m benchmarks.run                      # 1k, 100k и 1M строк
+#     python -m benchmarks.run --rows 1000 100000   # выбранные размеры
+#     python -m benchmarks.run --update-golden      # записать эталонные хэши
+#
+# Каждая функция запускается в отдельном процессе, поэтому пиковая память (ru_maxrss)
+# относится только к ней. Выходные файлы сравниваются с эталонными хэшами из golden.json.
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import resource
+import importlib
+import subprocess
+from config.settings import BASE_DIR
+from benchmarks.generate import generate
+
+BENCH_DIR = os.path.join(BASE_DIR, 'benchmarks')
+DATA_DIR = os.path.join(BENCH_DIR, 'data')
+GOLDEN_FILE = os.path.join(BENCH_DIR, 'golden.json')
+
+DEFAULT_ROWS = [1000, 100000, 1000000]
+
+# Проверяемые функции: модуль.функция(input_file, output_file)
+TARGETS = [
+    'payd.process_jdt',
+    'payd.process_ojdt',
+    'completed.process_jdt',
+    'completed.process_ojdt',
+]
+
+
+def file_sha256(path):
+    """Хэш файла, читаемого блоками."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def input_path(rows, seed):
+    return os.path.join(DATA_DIR, f'input_{rows}_{seed}.csv')
+
+
+def prepare_input(rows, seed, regenerate=False):
+    """Создает синтетическую выгрузку, если ее еще нет."""
+    path = input_path(rows, seed)
+    if regenerate or not os.path.exists(path):
+        print(f'Генерация {rows} строк -> {path}', flush=True)
+        generate(rows, path, seed=seed)
+    return path
+
+
+def run_target(target, input_file, output_file):
+    """Выполняет функцию в текущем процессе и возвращает время и пиковую память."""
+    module_name, function_name = target.split('.')
+    function = getattr(importlib.import_module(f'processing.{module_name}'), function_name)
+    started = time.perf_counter()
+    asyncio.run(function(input_file, output_file))
+    seconds = time.perf_counter() - started
+    # На Linux ru_maxrss в килобайтах
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'seconds': seconds, 'peak_rss_mb': peak_kb / 1024}
+
+
+def measure(target, input_file, output_file):
+    """Запускает функцию в отдельном процессе."""
+    completed = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.run', '--worker', target, input_file, output_file],
+        cwd=BASE_DIR, capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(f'{target} завершился с ошибкой:\n{completed.stderr}')
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def load_golden():
+    if not os.path.exists(GOLDEN_FILE):
+        return {}
+    with open(GOLDEN_FILE, encoding='utf-8') as handle:
+        return json.load(handle)
+
+
+def save_golden(golden):
+    with open(GOLDEN_FILE, 'w', encoding='utf-8') as handle:
+        json.dump(golden, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def check_golden(golden, key, digest, update):
+    """Сравнивает хэш с эталоном (или записывает его при update)."""
+    if update:
+        golden[key] = digest
+        return 'записан'
+    expected = golden.get(key)
+    if expected is None:
+        return 'нет эталона'
+    return 'OK' if expected == digest else 'ОТЛИЧАЕТСЯ'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк генерации JDT/OJDT отчетов')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--targets', nargs='+', default=TARGETS, choices=TARGETS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--regenerate', action='store_true', help='Пересоздать входные файлы')
+    parser.add_argument('--update-golden', action='store_true', help='Записать хэши результатов как эталон')
+    parser.add_argument('--worker', nargs=3, metavar=('TARGET', 'INPUT', 'OUTPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_target(*args.worker)))
+        return
+
+    os.makedirs(DATA_DIR, exist_ok=True)
+    golden = load_golden()
+    failed = False
+    print(f"{'строк':>9} {'функция':<24} {'сек':>8} {'строк/сек':>11} {'RSS, МБ':>8}  эталон")
+    for rows in args.rows:
+        input_file = prepare_input(rows, args.seed, args.regenerate)
+        # Эталон выхода имеет смысл только для того же входного файла
+        input_status = check_golden(golden, f'{rows}/{args.seed}/input', file_sha256(input_file),
+                                    args.update_golden)
+        if input_status == 'ОТЛИЧАЕТСЯ':
+            print(f'{rows:>9} входной файл отличается от эталонного, проверьте генератор')
+            failed = True
+        for target in args.targets:
+            output_file = os.path.join(DATA_DIR, f'output_{rows}_{args.seed}_{target}.csv')
+            result = measure(target, input_file, output_file)
+            status = check_golden(golden, f'{rows}/{args.seed}/{target}', file_sha256(output_file),
+                                  args.update_golden)
+            failed = failed or status == 'ОТЛИЧАЕТСЯ'
+            rate = rows / result['seconds'] if result['seconds'] else 0
+            print(f"{rows:>9} {target:<24} {result['seconds']:>8.2f} {rate:>11.0f} "
+                  f"{result['peak_rss_mb']:>8.0f}  {status}", flush=True)
+
+    if args.update_golden:
+        save_golden(golden)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
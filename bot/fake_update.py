@@ -0,0 +1,50 @@
+# Отправка тестового обновления в локально запущенный бот в режиме webhook:
+#     BOT_MODE=webhook python main.py
+#     python -m bot.fake_update /start
+#     python -m bot.fake_update /stats --url http://127.0.0.1:8080/webhook
+import time
+import json
+import asyncio
+import argparse
+import aiohttp
+from config.settings import ADMIN_ID, WEBHOOK_PATH, WEBHOOK_SECRET, WEB_PORT
+
+
+def build_update(text, user_id=ADMIN_ID, update_id=None):
+    """Собирает обновление Telegram с текстовым сообщением от пользователя user_id."""
+    update_id = update_id or int(time.time())
+    user = {"id": user_id, "is_bot": False, "first_name": "Test", "username": "test_user"}
+    message = {
+        "message_id": update_id,
+        "date": int(time.time()),
+        "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+        "from": user,
+        "text": text,
+    }
+    if text.startswith('/'):
+        # Без entities aiogram не распознает команду
+        message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"update_id": update_id, "message": message}
+
+
+async def post_update(url, update, secret=WEBHOOK_SECRET):
+    """Отправляет обновление на вебхук так же, как это делает Telegram."""
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, json=update, headers=headers) as response:
+            return response.status, await response.text()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Отправка тестового обновления на локальный вебхук')
+    parser.add_argument('text', help='Текст сообщения, например /start')
+    parser.add_argument('--url', default=f'http://127.0.0.1:{WEB_PORT}{WEBHOOK_PATH}')
+    parser.add_argument('--user-id', type=int, default=ADMIN_ID)
+    args = parser.parse_args()
+    update = build_update(args.text, user_id=args.user_id)
+    status, body = asyncio.run(post_update(args.url, update))
+    print(status, body or json.dumps(update, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
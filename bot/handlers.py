@@ -1,18 +1,41 @@
 import os
-import pandas as pd
+import time
+import asyncio
+import logging
 from aiogram import F, Router, Bot
 from aiogram.filters import Command
-from aiogram.types import Message, FSInputFile
-from aiogram.exceptions import TelegramNetworkError
-from processing.payd import process_jdt as process_payd_jdt, process_ojdt as process_payd_ojdt
-from processing.completed import process_jdt as process_completed_jdt, process_ojdt as process_completed_ojdt
-from bot.utils import clean_temp_directory
+from aiogram.types import Message, FSInputFile, BufferedInputFile
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from processing.loader import read_header, determine_report_type
+from processing.validation import check_header
+from processing.runner import run_conversion, run_buffer_conversion, run_batch_conversion, is_busy, queued_jobs
+from processing.batch import extract_csv_files, detect_batch_types
+from processing.cache import ResultCache, content_hash
+from processing.ledger import get_ledger
+from bot.utils import job_workspace, build_archive, file_size
+from bot.metrics import JobMetrics, record, format_stats
+from bot.job_queue import JobQueue
+from bot.sap import push_journals, format_push
+from processing.fx import rates_version
+from processing.journal_archive import JournalArchive, format_found
 from config.mappings import DEBIT_MAPPING_COMPLETED, DEBIT_MAPPING_PAYD, CREDIT_MAPPING_PEYD
-from config.settings import ADMIN_ID
+from config.settings import (ADMIN_ID, TEMP_DIR, PROCESSING_MODE, STREAMING_THRESHOLD_BYTES, MEDIA_GROUP_WAIT,
+                             DELIVERY_MODE, ARCHIVE_THRESHOLD_BYTES, ARCHIVE_NAME,
+                             CACHE_ENABLED, CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE, INCREMENTAL_MODE,
+                             VALIDATION_ENABLED, REJECTS_NAME, JOBS_PATH, JOB_WORKERS, USER_MAX_QUEUED_JOBS,
+                             USER_MAX_RUNNING_JOBS, JOB_MAX_ATTEMPTS, JOB_RETENTION, JOURNAL_MODE,
+                             SAP_ENABLED, FX_ENABLED, JOURNAL_ARCHIVE_ENABLED, JOURNAL_ARCHIVE_DIR, LEDGER_PATH)
 
 
 router = Router()
 
+# Документы медиагрупп, ожидающие обработки: media_group_id -> [Message]
+_media_groups = {}
+
+_result_cache = None
+_job_queue = None
+_journal_archive = None
+
 
 @router.message(Command("start"))
 async def start(message: Message):
@@ -24,7 +47,16 @@ async def help_command(message: Message):
         "🤖 *Как пользоваться ботом:*\n\n"
         "1. Отправьте CSV файл с отчетом\n"
         "2. Бот автоматически определит тип файла (PAYD или COMPLETED)\n"
-        "3. Создаст и отправит вам JDT и OJDT отчеты\n\n"
+        "3. Создаст и отправит вам JDT и OJDT отчеты (большие отчеты - одним zip-архивом)\n\n"
+        "Можно отправить сразу несколько CSV файлов одним сообщением или zip-архив с ними: "
+        "по каждому типу будет создан общий JDT и OJDT со сквозной нумерацией\n\n"
+        "Строки, которые нельзя провести (нечисловые суммы, неизвестный провайдер, нераспознанная дата, "
+        "Total Fee не равен Reseller + Net Fee), не попадают в отчеты и присылаются отдельным файлом\n\n"
+        + ("В отчетах одна проводка на дату и Payment Provider, проводки по каждому заказу - "
+           "в приложенных `jdt_detail.csv` и `ojdt_detail.csv`\n\n" if JOURNAL_MODE == 'summary' else "")
+        + ("После отправки файлов проводки создаются в SAP, повторно присланный файл не создает их второй раз\n\n"
+           if SAP_ENABLED else "") +
+        "Файлы обрабатываются по очереди: бот сразу сообщает позицию в очереди и обновляет сообщение по ходу обработки\n\n"
         "По всем вопросам обращайтесь к администратору"
     )
     await message.reply(help_text, parse_mode='Markdown')
@@ -39,12 +71,13 @@ async def format_command(message: Message):
         "- Total Fee EUR\n"
         "- Reseller Fee EUR\n"
         "- Net Fee EUR\n"
+        "- Additional Fee\n"
         "- Name\n"
         "- Order\n\n"
         "*PAYD файл должен содержать колонки:*\n"
         "- Paid\n"
-        "- Payment Method\n"
-        "- Total Fee EUR\n"
+        "- Payment Provider\n"
+        "- Fval EUR\n"
         "- Name\n"
         "- Order"
     )
@@ -96,81 +129,468 @@ async def info_command(message):
 
     await message.reply(info_text, parse_mode='HTML')
 
+@router.message(Command("stats"), F.from_user.id == ADMIN_ID)
+async def stats_command(message: Message):
+    # Команда доступна только администратору, остальным бот не отвечает
+    await message.reply(format_stats(), parse_mode='HTML')
+
+@router.message(Command("find"), F.from_user.id == ADMIN_ID)
+async def find_command(message: Message):
+    # Поиск строк созданных журналов по номеру заказа или началу имени клиента.
+    # В архиве заказы всех пользователей, поэтому команда доступна только администратору
+    archive = get_journal_archive()
+    if archive is None:
+        await message.reply("Архив журналов выключен")
+        return
+    text = (message.text or '').split(maxsplit=1)[1:]
+    if not text:
+        await message.reply("Укажите номер заказа или имя клиента: /find BE194612")
+        return
+    rows = await asyncio.to_thread(archive.find, text[0])
+    await message.reply(format_found(rows))
+
 @router.message(F.document)
 async def handle_file(message: Message, bot: Bot):
+    # Несколько файлов одним сообщением или zip-архив обрабатываются как пакет
+    if message.media_group_id:
+        await collect_media_group(message, bot)
+        return
+    if message.document.file_name.lower().endswith('.zip'):
+        await get_job_queue().submit(bot, 'batch', [message])
+        return
+
+    # Проверяем расширение файла
+    if not message.document.file_name.endswith('.csv'):
+        await message.reply("Пожалуйста, отправьте файл в формате CSV")
+        return
+
+    # Файл скачивается и обрабатывается, когда до него дойдет очередь
+    await get_job_queue().submit(bot, 'document', [message])
+
+async def run_document_job(messages, bot: Bot, status):
+    """Обрабатывает файл из очереди задач с учетом метрик и ошибок.
+    :param status: Сообщение о состоянии задачи, которое редактируется вместо новых ответов."""
+    message = messages[0]
+    job = JobMetrics(message.document.file_size or 0)
+    try:
+        if PROCESSING_MODE == 'memory' and not is_large_file(message.document):
+            # Файл обрабатывается целиком в памяти, без записи на диск
+            await process_document(message, bot, job=job, status=status)
+        else:
+            # Каждая задача работает в своей временной директории, удаляемой по завершении
+            async with job_workspace(TEMP_DIR) as workspace:
+                await process_document(message, bot, workspace, job=job, status=status)
+        record(job)
+
+    except Exception as e:
+        record(job, failed=True)
+        release_claims(message)
+        await report_error(message, bot, e)
+
+async def report_error(message: Message, bot: Bot, e):
+    """Сообщает пользователю об ошибке обработки и отправляет подробности администратору."""
+    error_type = type(e).__name__
+    error_msg = str(e)
+    await message.reply(f"❌ Ошибка при обработке файла: \nтип и сообщение об ошибке отправлен разработчику")
+    if ADMIN_ID:
+        try:
+            await bot.send_message(ADMIN_ID, f"❌ Ошибка при обработке файла: {error_type}: {error_msg}")
+        except Exception as admin_error:
+            print(f"Не удалось отправить сообщение администратору: {admin_error}")
+
+async def collect_media_group(message: Message, bot: Bot):
+    """Собирает документы медиагруппы: Telegram присылает их отдельными сообщениями.
+    Первое сообщение группы ждет остальные MEDIA_GROUP_WAIT секунд и запускает обработку пакета."""
+    group = _media_groups.setdefault(message.media_group_id, [])
+    group.append(message)
+    if len(group) > 1:
+        return
+    await asyncio.sleep(MEDIA_GROUP_WAIT)
+    messages = sorted(_media_groups.pop(message.media_group_id), key=lambda m: m.message_id)
+    await get_job_queue().submit(bot, 'batch', messages)
+
+async def run_batch_job(messages, bot: Bot, status):
+    """Обрабатывает пакет файлов (медиагруппу или zip-архив) из очереди задач с учетом метрик и ошибок."""
+    message = messages[0]
+    job = JobMetrics(sum(m.document.file_size or 0 for m in messages))
     try:
-        # Создаем временные директории
-        os.makedirs("temp", exist_ok=True)
+        await process_batch(message, bot, messages, job, status)
+        record(job)
+    except Exception as e:
+        record(job, failed=True)
+        release_claims(message)
+        await report_error(message, bot, e)
+
+async def download_document(bot: Bot, document):
+    """Скачивает документ в память и возвращает его содержимое (bytes)."""
+    file_info = await bot.get_file(document.file_id)
+    downloaded_file = await bot.download_file(file_info.file_path)
+    return downloaded_file.getvalue()
+
+async def process_batch(message: Message, bot: Bot, messages, job, status=None):
+    """Скачивает пакет файлов, создает по каждому типу общий JDT и OJDT со сквозной нумерацией
+    и отправляет их пользователю. Файлы скачиваются и читаются параллельно."""
+    with job.stage('download'):
+        downloads = await asyncio.gather(*(download_document(bot, m.document) for m in messages))
+
+    # Разворачиваем архивы, файлы других форматов пропускаем
+    files, skipped = [], []
+    for m, data in zip(messages, downloads):
+        name = m.document.file_name or ''
+        if name.lower().endswith('.zip'):
+            files.extend(extract_csv_files(data))
+        elif name.lower().endswith('.csv'):
+            files.append((name, data))
+        else:
+            skipped.append((name, "не CSV файл"))
+
+    with job.stage('detect'):
+        groups, errors = detect_batch_types(files)
+    skipped += errors
+    source_names = ", ".join(name for name, _ in files)
+    if not groups:
+        raise ValueError("В пакете нет CSV файлов известного формата")
+
+    # Формируем сообщение о процессе обработки
+    types_msg = ", ".join(f"{report_type.upper()}: {len(group)}" for report_type, group in groups.items())
+    received_msg = f"📥 Получено файлов: {len(files)} ({types_msg})"
+    if skipped:
+        received_msg += "\n⚠️ Пропущены:\n" + "\n".join(f"    - {name}: {error}" for name, error in skipped)
+    bot_message = await show_status(message, status, f"{received_msg}\n⚙️ Обрабатываю...")
+    bot_message_for_admin = await bot.send_message(ADMIN_ID, received_msg)
 
-        # Проверяем расширение файла
-        if not message.document.file_name.endswith('.csv'):
-            await message.reply("Пожалуйста, отправьте файл в формате CSV")
+    # Если все места в пуле заняты, сообщаем о месте в очереди
+    if is_busy():
+        await bot_message.edit_text(f"{received_msg}\n⏳ В очереди, перед вами: {queued_jobs()}")
+
+    # Типы отчетов обрабатываются параллельно, файлы одного типа объединяются
+    with job.stage('generate'):
+        results = await asyncio.gather(*(run_batch_conversion(report_type, group, owner=claims_owner(message))
+                                         for report_type, group in groups.items()))
+    job.values['rows'] = sum(stats['rows'] for stats, *_ in results)
+    job.values['peak_memory_mb'] = max(stats['peak_memory_mb'] for stats, *_ in results)
+
+    outputs, journals = [], []
+    for report_type, (stats, output_jdt, output_ojdt, rejects, summary) in zip(groups, results):
+        files = report_outputs(output_jdt, output_ojdt, summary, f"_{report_type}")
+        outputs += files
+        journals.append((report_type.upper(), files[0][1], files[1][1]))
+        if stats['rejected']:
+            outputs.append((f"{os.path.splitext(REJECTS_NAME)[0]}_{report_type}.csv", rejects))
+
+    rejected = sum(stats['rejected'] for stats, *_ in results)
+    entries = sum(stats['entries'] for stats, *_ in results)
+    done_text = f"{received_msg}\n✅ Успешно обработан{format_entries(entries)}{format_rejected(rejected)}"
+    await bot_message.edit_text(done_text)
+    with job.stage('send'):
+        await deliver_new_reports(message, bot, outputs)
+    if SAP_ENABLED:
+        with job.stage('sap'):
+            await push_to_sap(bot_message, done_text, journals)
+    if JOURNAL_ARCHIVE_ENABLED:
+        with job.stage('archive'):
+            await archive_journals(message, [(report_type, output_jdt) for report_type, (_, output_jdt, *_)
+                                             in zip(groups, results)], source_names)
+    await bot_message_for_admin.edit_text(f"{received_msg}\n✅ Успешно обработан\n\nДля: @{message.from_user.username or 'Неизвестный пользователь'}")
+
+def report_outputs(output_jdt, output_ojdt, summary, suffix=''):
+    """Файлы отчетов для отправки. В сводном режиме jdt/ojdt - сводный журнал,
+    а проводки по каждому заказу прикладываются как jdt_detail/ojdt_detail."""
+    if summary is None:
+        return [(f"jdt{suffix}.csv", output_jdt), (f"ojdt{suffix}.csv", output_ojdt)]
+    summary_jdt, summary_ojdt = summary
+    return [(f"jdt{suffix}.csv", summary_jdt), (f"ojdt{suffix}.csv", summary_ojdt),
+            (f"jdt_detail{suffix}.csv", output_jdt), (f"ojdt_detail{suffix}.csv", output_ojdt)]
+
+def format_entries(entries):
+    """Строка сообщения о числе проводок сводного журнала."""
+    return f"\n📊 Сводный журнал: {entries} проводок по дате и Payment Provider" if JOURNAL_MODE == 'summary' else ""
+
+async def push_to_sap(bot_message, text, journals):
+    """Проводит отчеты в SAP после отправки файлов и дописывает результат в сообщение о статусе.
+    Ошибка SAP не отменяет отправленные отчеты: их можно импортировать вручную или прислать файл снова.
+    :param journals: Список (подпись или None, JDT, OJDT): путь к файлу или содержимое."""
+    await bot_message.edit_text(f"{text}\n📤 Провожу в SAP...")
+    results = []
+    for label, jdt, ojdt in journals:
+        prefix = f"{label}: " if label else ""
+        try:
+            results.append(prefix + format_push(await push_journals(jdt, ojdt)))
+        except Exception as e:
+            logging.exception("Не удалось провести отчеты в SAP")
+            results.append(f"❌ {prefix}SAP: {type(e).__name__}: {e}")
+    await bot_message.edit_text(f"{text}\n" + "\n".join(results))
+
+async def archive_journals(message, journals, source):
+    """Записывает строки созданных JDT в архив журналов для /find.
+    Ошибка архива не отменяет отправленные отчеты.
+    :param journals: Список (тип отчета, JDT): путь к файлу или содержимое.
+    :param source: Имена исходных файлов."""
+    archive = get_journal_archive()
+    for report_type, jdt in journals:
+        try:
+            await asyncio.to_thread(archive.add, jdt, report_type, source, message.from_user.username)
+        except Exception:
+            logging.exception("Не удалось записать отчет в архив журналов")
+
+def format_rejected(rejected):
+    """Строка сообщения об отклоненных при проверке строках."""
+    return f"\n⚠️ Отклонено строк: {rejected}, они не вошли в отчеты - см. {REJECTS_NAME}" if rejected else ""
+
+def get_job_queue():
+    """Возвращает очередь задач, создавая ее при первом обращении."""
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(JOBS_PATH, {'document': run_document_job, 'batch': run_batch_job}, JOB_WORKERS,
+                              USER_MAX_QUEUED_JOBS, USER_MAX_RUNNING_JOBS, JOB_MAX_ATTEMPTS, JOB_RETENTION,
+                              on_failed=lambda messages: release_claims(messages[0]))
+    return _job_queue
+
+async def show_status(message: Message, status, text):
+    """Показывает состояние обработки: в сообщении задачи из очереди или новым ответом."""
+    if status is None:
+        return await message.answer(text)
+    await status.edit_text(text)
+    return status
+
+def get_result_cache():
+    """Возвращает кэш готовых отчетов (None, если кэш выключен)."""
+    global _result_cache
+    if CACHE_ENABLED and _result_cache is None:
+        _result_cache = ResultCache(CACHE_DIR, CACHE_MAX_BYTES, CACHE_MAX_AGE)
+    return _result_cache
+
+def get_journal_archive():
+    """Возвращает архив созданных журналов (None, если архив выключен)."""
+    global _journal_archive
+    if JOURNAL_ARCHIVE_ENABLED and _journal_archive is None:
+        _journal_archive = JournalArchive(JOURNAL_ARCHIVE_DIR)
+    return _journal_archive
+
+def is_large_file(document):
+    """Проверяет, нужно ли обрабатывать файл потоково по частям."""
+    return (document.file_size or 0) > STREAMING_THRESHOLD_BYTES
+
+async def process_document(message: Message, bot: Bot, workspace=None, job=None, status=None):
+    """Скачивает файл, создает JDT и OJDT отчеты и отправляет их пользователю.
+    Без workspace файл обрабатывается в памяти, иначе - в директории задачи.
+    Большие файлы скачиваются сразу на диск и обрабатываются потоково.
+    :param job: Метрики задачи, в которые записывается время этапов.
+    :param status: Сообщение о состоянии задачи из очереди (иначе бот отвечает новым сообщением)."""
+    streaming = is_large_file(message.document)
+    job = job or JobMetrics(message.document.file_size or 0)
+    cache = get_result_cache()
+
+    # В инкрементальном режиме результат зависит от журнала заказов: повторно присланный
+    # файл получает те же отчеты, что и в первый раз, а не пустые
+    # Сводный журнал - другой набор файлов, поэтому тоже отдельная запись кэша
+    variants = [name for name, enabled in (('incremental', INCREMENTAL_MODE),
+                                           ('summary', JOURNAL_MODE == 'summary')) if enabled]
+    if FX_ENABLED:
+        # Суммы в валюте зависят от таблицы курсов: после ее обновления файл обрабатывается заново
+        variants.append('fx' + rates_version())
+    variant = '-'.join(variants)
+    alias = message.document.file_unique_id + ('-' + variant if variant else '')
+
+    # Тот же документ (например, пересланный) находится в кэше без скачивания
+    if cache is not None:
+        entry = cache.get_by_alias(alias)
+        if entry is not None:
+            await send_cached_reports(message, bot, cache, entry, job, status)
             return
 
-        # Скачиваем файл
+    # Скачиваем файл
+    with job.stage('download'):
         file_info = await bot.get_file(message.document.file_id)
-        downloaded_file = await bot.download_file(file_info.file_path)
+        if workspace is None:
+            downloaded_file = await bot.download_file(file_info.file_path)
+            source = downloaded_file
+        else:
+            # Сохраняем файл во временную директорию задачи
+            source = os.path.join(workspace, "исходник.csv")
+            await bot.download_file(file_info.file_path, destination=source)
 
-        # Сохраняем файл во временную директорию
-        input_file = "temp/исходник.csv"
-        with open(input_file, 'wb') as new_file:
-            new_file.write(downloaded_file.read())  # .read() для BytesIO объекта
+    # Файл с тем же содержимым уже обрабатывался - отправляем готовые отчеты
+    if cache is not None:
+        key = cache.make_key(await asyncio.to_thread(
+            content_hash, downloaded_file.getvalue() if workspace is None else source), variant)
+        entry = cache.get(key)
+        if entry is not None:
+            cache.add_alias(alias, key)
+            await send_cached_reports(message, bot, cache, entry, job, status)
+            return
 
-        # Определяем тип отчета
-        df = pd.read_csv(input_file)
-        report_type = await determine_report_type(df)
+    # Определяем тип отчета только по строке заголовков
+    with job.stage('detect'):
+        header = read_header(source)
+        report_type = determine_report_type(header)
+        # Файл без нужных колонок отклоняется до постановки в очередь
+        if VALIDATION_ENABLED:
+            check_header(report_type, header)
 
-        # Формируем сообщение о процессе обработки
-        report_type_msg = "COMPLETED" if report_type == 'completed' else "PAYD"
-        bot_message = await message.answer(f"📥 Получен файл типа: {report_type_msg}\n⚙️ Обрабатываю...")
-        bot_message_for_admin = await bot.send_message(ADMIN_ID, f"📥 Получен файл типа: {report_type_msg}")
+    # Формируем сообщение о процессе обработки
+    report_type_msg = "COMPLETED" if report_type == 'completed' else "PAYD"
+    bot_message = await show_status(message, status, f"📥 Получен файл типа: {report_type_msg}\n⚙️ Обрабатываю...")
+    bot_message_for_admin = await bot.send_message(ADMIN_ID, f"📥 Получен файл типа: {report_type_msg}")
 
-        # Переименовываем файл для обработки
-        renamed_file = f"temp/исходник ({report_type_msg}).csv"
-        os.rename(input_file, renamed_file)
+    # Если все места в пуле заняты, сообщаем о месте в очереди
+    if is_busy():
+        await bot_message.edit_text(f"📥 Получен файл типа: {report_type_msg}\n⏳ В очереди, перед вами: {queued_jobs()}")
 
-        output_jdt = "temp/jdt.csv"
-        output_ojdt = "temp/ojdt.csv"
+    # Обрабатываем файл в пуле процессов, не блокируя бота
+    started = time.perf_counter()
+    if workspace is None:
+        stats, output_jdt, output_ojdt, rejects, summary = await run_buffer_conversion(
+            report_type, downloaded_file.getvalue(), owner=claims_owner(message))
+    else:
+        output_jdt = os.path.join(workspace, "jdt.csv")
+        output_ojdt = os.path.join(workspace, "ojdt.csv")
+        rejects = os.path.join(workspace, REJECTS_NAME)
+        summary = None
+        if JOURNAL_MODE == 'summary':
+            summary = (os.path.join(workspace, "jdt_summary.csv"), os.path.join(workspace, "ojdt_summary.csv"))
+        stats = await run_conversion(report_type, source, output_jdt, output_ojdt, streaming=streaming,
+                                     rejects_output=rejects, summary_outputs=summary, owner=claims_owner(message))
+    job.add_worker_stats(stats, time.perf_counter() - started)
 
-        # Обрабатываем файлы
-        if report_type == 'completed':
-            await process_completed_jdt(renamed_file, output_jdt)
-            await process_completed_ojdt(renamed_file, output_ojdt)
-        else:
-            await process_payd_jdt(renamed_file, output_jdt)
-            await process_payd_ojdt(renamed_file, output_ojdt)
+    # Отправляем файлы пользователю с повторными попытками
+    # Редактируем предыдущее сообщение о процессе обработки
+    skipped_msg = f"\n⏭ Пропущено уже проведенных строк: {stats['skipped']}" if stats.get('skipped') else ""
+    done_text = (f"{report_type_msg}\n✅ Успешно обработан{skipped_msg}"
+                 f"{format_entries(stats['entries'])}{format_rejected(stats['rejected'])}")
+    await bot_message.edit_text(done_text)
+    outputs = report_outputs(output_jdt, output_ojdt, summary)
+    if stats['rejected']:
+        outputs.append((REJECTS_NAME, rejects))
+    with job.stage('send'):
+        file_ids = await deliver_new_reports(message, bot, outputs)
+    if SAP_ENABLED:
+        # Файлы задачи в workspace еще не удалены
+        with job.stage('sap'):
+            await push_to_sap(bot_message, done_text, [(None, outputs[0][1], outputs[1][1])])
+    if JOURNAL_ARCHIVE_ENABLED:
+        # В архив записывается детальный JDT: в нем строка на каждый заказ
+        with job.stage('archive'):
+            await archive_journals(message, [(report_type, output_jdt)], message.document.file_name)
+    if cache is not None:
+        # Файлы задачи в workspace копируются в кэш до удаления директории
+        await asyncio.to_thread(cache.put, key, outputs, report_type=report_type, rows=stats['rows'],
+                                rejected=stats['rejected'], entries=stats['entries'])
+        cache.add_alias(alias, key)
+        cache.set_file_ids(key, file_ids)
+    await bot_message_for_admin.edit_text(f"{report_type_msg}\n✅ Успешно обработан\n\nДля: @{message.from_user.username or 'Неизвестный пользователь'}")
 
-        # Отправляем файлы пользователю с повторными попытками
-        # Редактируем предыдущее сообщение о процессе обработки
-        await bot_message.edit_text(f"{report_type_msg}\n✅ Успешно обработан")
-        await send_file_with_retry(message, output_jdt, "jdt.csv", bot)
-        await send_file_with_retry(message, output_ojdt, "ojdt.csv", bot)
-        await bot_message_for_admin.edit_text(f"{report_type_msg}\n✅ Успешно обработан\n\nДля: @{message.from_user.username or 'Неизвестный пользователь'}")
+async def send_cached_reports(message: Message, bot: Bot, cache, entry, job, status=None):
+    """Отправляет отчеты из кэша: по сохраненным file_id или загружая файлы из кэша."""
+    key = entry['key']
+    report_type_msg = "COMPLETED" if entry.get('report_type') == 'completed' else "PAYD"
+    done_text = (f"{report_type_msg}\n✅ Файл уже обрабатывался, отправляю готовые отчеты"
+                 f"{format_entries(entry.get('entries', 0))}{format_rejected(entry.get('rejected', 0))}")
+    bot_message = await show_status(message, status, done_text)
+    job.values['rows'] = entry.get('rows', 0)
+    files = [(filename, cache.file_path(key, filename)) for filename in entry['files']]
+    with job.stage('send'):
+        file_ids = await deliver_reports(message, bot, files, entry.get('file_ids'))
+    cache.set_file_ids(key, file_ids)
+    if SAP_ENABLED:
+        # Проводки, созданные при первой обработке файла, находятся по метке и не повторяются
+        with job.stage('sap'):
+            await push_to_sap(bot_message, done_text, [(None, files[0][1], files[1][1])])
+    try:
+        await bot.send_message(ADMIN_ID, f"{report_type_msg}\n♻️ Отправлен из кэша\n\nДля: @{message.from_user.username or 'Неизвестный пользователь'}")
+    except Exception as admin_error:
+        print(f"Не удалось отправить сообщение администратору: {admin_error}")
 
+def use_archive(files, mode=DELIVERY_MODE):
+    """Решает, отправлять ли отчеты одним архивом."""
+    if mode == 'archive':
+        return True
+    if mode == 'files':
+        return False
+    return sum(file_size(content) for _, content in files) > ARCHIVE_THRESHOLD_BYTES
+
+async def deliver_reports(message, bot, files, file_ids=None):
+    """Отправляет отчеты одним zip-архивом или отдельными файлами (параллельно).
+    Если все нужные файлы уже загружались в Telegram, они отправляются по file_id.
+    :param files: Список пар (имя файла, путь к файлу или содержимое bytes).
+    :param file_ids: Сохраненные file_id ранее отправленных файлов {имя файла: file_id}.
+    :return: file_id загруженных файлов {имя файла: file_id}."""
+    archive = use_archive(files)
+    filenames = [ARCHIVE_NAME] if archive else [filename for filename, _ in files]
+    file_ids = file_ids or {}
+    if all(filename in file_ids for filename in filenames):
+        sent = await asyncio.gather(*(send_file_by_id(message, bot, file_ids[filename]) for filename in filenames))
+        if all(sent):
+            return {}
+        # Сохраненный file_id больше не действителен - загружаем файлы заново
+
+    if archive:
+        # Сжатие больших отчетов выполняется в потоке, чтобы не блокировать бота
+        content = await asyncio.to_thread(build_archive, files)
+        uploads = [(ARCHIVE_NAME, content)]
+    else:
+        uploads = files
+    results = await asyncio.gather(*(send_file_with_retry(message, content, filename, bot)
+                                     for filename, content in uploads))
+    return {filename: sent.document.file_id for (filename, _), sent in zip(uploads, results) if sent}
+
+async def deliver_new_reports(message, bot, files):
+    """Отправляет созданные отчеты и подтверждает занятые задачей заказы в журнале.
+    Если хотя бы один файл не доставлен, задача завершается ошибкой, а ее заказы освобождаются
+    (см. release_claims) и попадут в отчеты при повторной отправке файла.
+    :return: file_id загруженных файлов (см. deliver_reports)."""
+    file_ids = await deliver_reports(message, bot, files)
+    filenames = [ARCHIVE_NAME] if use_archive(files) else [filename for filename, _ in files]
+    if not all(filename in file_ids for filename in filenames):
+        raise RuntimeError("Не все отчеты доставлены пользователю")
+    if INCREMENTAL_MODE:
+        get_ledger(LEDGER_PATH).confirm(claims_owner(message))
+    return file_ids
+
+def claims_owner(message):
+    """Задача, за которой заказы занимаются в журнале до доставки отчетов. Задача из очереди
+    восстанавливается после перезапуска с теми же сообщениями и получает свои заказы обратно."""
+    return f"{message.chat.id}:{message.message_id}"
+
+def release_claims(message):
+    """Освобождает заказы, занятые задачей, отчеты которой не доставлены."""
+    if INCREMENTAL_MODE:
+        get_ledger(LEDGER_PATH).release_owner(claims_owner(message))
+
+async def send_file_by_id(message, bot, file_id):
+    """Отправляет ранее загруженный файл по file_id без повторной загрузки.
+    :return: True, если файл отправлен."""
+    try:
+        await bot.send_document(message.chat.id, file_id)
+        return True
     except Exception as e:
-        error_type = type(e).__name__
-        error_msg = str(e)
-        await message.reply(f"❌ Ошибка при обработке файла: \nтип и сообщение об ошибке отправлен разработчику")
-        if ADMIN_ID:
-            try:
-                await bot.send_message(ADMIN_ID, f"❌ Ошибка при обработке файла: {error_type}: {error_msg}")
-            except Exception as admin_error:
-                print(f"Не удалось отправить сообщение администратору: {admin_error}")
-    finally:
-        await clean_temp_directory(directory="temp")
+        logging.warning(f"Не удалось отправить файл по file_id: {type(e).__name__}: {e}")
+        return False
 
 async def send_file_with_retry(message, file_path, filename, bot, max_retries=3):
-    """Отправляет файл с повторными попытками при сетевых ошибках."""
+    """Отправляет файл с повторными попытками при сетевых ошибках и ограничении частоты запросов.
+    Отчеты отправляются параллельно, поэтому между попытками выдерживается пауза.
+    :param file_path: Путь к файлу на диске или содержимое файла (bytes).
+    :return: Отправленное сообщение или False при ошибке."""
     for attempt in range(max_retries):
         try:
-            # Используем FSInputFile правильно - передаем путь к файлу, а не открытый фа
-            await bot.send_document(message.chat.id, FSInputFile(file_path, filename=filename))
-            return True  # Успешно отправлено
-        except TelegramNetworkError as e:
+            if isinstance(file_path, bytes):
+                # Содержимое из памяти отправляется без записи на диск
+                document = BufferedInputFile(file_path, filename=filename)
+            else:
+                # Используем FSInputFile правильно - передаем путь к файлу, а не открытый фа
+                document = FSInputFile(file_path, filename=filename)
+            return await bot.send_document(message.chat.id, document)  # Успешно отправлено
+        except (TelegramNetworkError, TelegramRetryAfter) as e:
             if attempt < max_retries - 1:
                 # Если это не последняя попытка, ждем и пробуем снова
-                retry_delay = 2 * (attempt + 1)  # Увеличиваем задержку с каждой попыткой
-                await message.answer(f"⚠️ Проблема с сетью, повторная попытка через {retry_delay} сек...")
+                if isinstance(e, TelegramRetryAfter):
+                    # Telegram сообщает, сколько ждать при слишком частых запросах
+                    retry_delay = e.retry_after
+                else:
+                    retry_delay = 2 * (attempt + 1)  # Увеличиваем задержку с каждой попыткой
+                    await message.answer(f"⚠️ Проблема с сетью, повторная попытка через {retry_delay} сек...")
+                await asyncio.sleep(retry_delay)
             else:
                 # Если все попытки исчерпаны, сообщаем об ошибке
                 await message.answer(f"❌ Не удалось отправить файл после {max_retries} попыток. Ошибка сети.")
@@ -179,20 +599,11 @@ async def send_file_with_retry(message, file_path, filename, bot, max_retries=3)
                         await bot.send_message(ADMIN_ID, f"❌ Сетевая ошибка при отправке файла {filename}: {str(e)}")
                     except:
                         pass  # Игнорируем ошибки при отправке сообщения администратору
-                return False
         except Exception as e:
+            # Остальные ошибки (например, файл слишком большой) повтором не исправить
             try:
                 await bot.send_message(ADMIN_ID, f"❌ Ошибка при отправке файла {filename}: {type(e).__name__}: {str(e)}")
             except:
                 pass
-        return False
-
-async def determine_report_type(df):
-    """Определяет тип отчета и проверяет валидность файла."""
-    df.columns = df.columns.str.strip()
-    if 'Reseller Fee EUR' in df.columns or 'Reseller\nFee EUR' in df.columns:
-        return 'completed'
-    elif 'Paid' in df.columns:
-        return 'payd'
-    else:
-        raise ValueError("Неверный формат файла. Проверьте колонки.")
\ No newline at end of file
+            return False
+    return False
@@ -0,0 +1,277 @@
+import json
+import time
+import sqlite3
+import asyncio
+import logging
+import itertools
+from aiogram.types import Message
+from aiogram.exceptions import TelegramAPIError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    user_id INTEGER NOT NULL,
+    chat_id INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    status_message_id INTEGER,
+    position INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    error TEXT
+)
+"""
+INDEX = "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, user_id)"
+
+# Состояния задачи
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+
+def dump_messages(messages):
+    """Сообщения задачи в JSON: после перезапуска задача восстанавливается без повторной отправки файла."""
+    return json.dumps([message.model_dump(mode='json', exclude_none=True) for message in messages],
+                      ensure_ascii=False)
+
+
+def load_messages(payload, bot):
+    """Восстанавливает сообщения задачи, привязывая их к боту (для answer/reply)."""
+    return [Message.model_validate(data).as_(bot) for data in json.loads(payload)]
+
+
+def fair_order(queued, last_started):
+    """Порядок запуска задач: за один круг - по одной задаче каждого пользователя,
+    первым идет пользователь, чья задача дольше всех не запускалась.
+    Один пользователь с большим пакетом файлов не задерживает остальных.
+    :param queued: Список пар (id задачи, user_id) в порядке поступления.
+    :param last_started: {user_id: время запуска его последней задачи}.
+    :return: Список id задач."""
+    by_user = {}
+    for job_id, user_id in queued:
+        by_user.setdefault(user_id, []).append(job_id)
+    users = sorted(by_user, key=lambda user_id: (last_started.get(user_id, 0.0), by_user[user_id][0]))
+    order = []
+    for round_jobs in itertools.zip_longest(*(by_user[user_id] for user_id in users)):
+        order.extend(job_id for job_id in round_jobs if job_id is not None)
+    return order
+
+
+class JobStatus:
+    """Сообщение о состоянии задачи, которое редактируется по мере ее выполнения.
+    Повторяет edit_text у Message, поэтому передается в обработчики вместо их собственного ответа.
+    Сообщение адресуется по id, поэтому его можно редактировать и после перезапуска."""
+
+    def __init__(self, bot, chat_id, message_id):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    async def edit_text(self, text, **kwargs):
+        if not self.message_id:
+            return
+        try:
+            await self.bot.edit_message_text(text=text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+        except TelegramAPIError as e:
+            # Сообщение удалено пользователем или текст не изменился - задача продолжается
+            logging.warning(f"Не удалось обновить статус задачи: {e}")
+
+
+class JobQueue:
+    """Очередь задач в SQLite с фиксированным числом обработчиков.
+    Задача хранится до завершения, поэтому прерванные перезапуском задачи выполняются снова.
+    У каждого пользователя ограничено число задач в очереди и одновременно выполняемых задач,
+    а задачи разных пользователей запускаются по очереди (см. fair_order)."""
+
+    def __init__(self, path, runners, workers, max_queued, max_running, max_attempts, retention, on_failed=None):
+        """:param runners: {тип задачи: async функция (messages, bot, status)}.
+        :param on_failed: Функция (messages), вызываемая для задачи, которая завершилась с ошибкой
+            или больше не будет запускаться после перезапусков."""
+        self.path = path
+        self.runners = runners
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_running = max_running
+        self.max_attempts = max_attempts
+        self.retention = retention
+        self.on_failed = on_failed
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        self.connection.execute(INDEX)
+        self.connection.commit()
+        self.bot = None
+        self.last_started = {}
+        self._wakeup = None
+        self._tasks = []
+
+    def active_jobs(self, user_id):
+        """Количество задач пользователя в очереди и в работе."""
+        return self.connection.execute("SELECT COUNT(*) FROM jobs WHERE user_id = ? AND status IN (?, ?)",
+                                       (user_id, QUEUED, RUNNING)).fetchone()[0]
+
+    def _queued(self):
+        # Задачи без сообщения о статусе еще не приняты: ответ пользователю отправляется
+        return self.connection.execute(
+            "SELECT id, user_id FROM jobs WHERE status = ? AND status_message_id IS NOT NULL ORDER BY id",
+            (QUEUED,)).fetchall()
+
+    def positions(self, extra=None):
+        """Позиции задач в очереди с учетом очередности пользователей: {id задачи: позиция}.
+        :param extra: Пара (id, user_id) задачи, которая еще не записана в очередь."""
+        queued = self._queued() + ([extra] if extra else [])
+        return {job_id: position for position, job_id in enumerate(fair_order(queued, self.last_started), start=1)}
+
+    async def submit(self, bot, kind, messages):
+        """Ставит задачу в очередь и сразу отвечает пользователю ее позицией.
+        :return: id задачи или None, если у пользователя слишком много задач."""
+        message = messages[0]
+        user_id = message.from_user.id
+        active = self.active_jobs(user_id)
+        if active >= self.max_queued:
+            await message.reply(f"⛔ У вас уже {active} файлов в обработке. "
+                                f"Дождитесь их завершения и отправьте файл снова")
+            return None
+
+        now = time.time()
+        with self.connection:
+            job_id = self.connection.execute(
+                "INSERT INTO jobs (kind, user_id, chat_id, payload, status, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (kind, user_id, message.chat.id, dump_messages(messages), QUEUED, now)).lastrowid
+        position = self.positions((job_id, user_id))[job_id]
+        status_message_id = 0
+        try:
+            status_message = await message.reply(f"⏳ В очереди, позиция {position}")
+            status_message_id = status_message.message_id
+        except TelegramAPIError as e:
+            logging.warning(f"Не удалось отправить статус задачи {job_id}: {e}")
+        # С этого момента задачу могут взять обработчики
+        with self.connection:
+            self.connection.execute("UPDATE jobs SET status_message_id = ?, position = ? WHERE id = ?",
+                                    (status_message_id, position, job_id))
+        logging.info(f"Задача {job_id} ({kind}) пользователя {user_id} в очереди, позиция {position}")
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return job_id
+
+    def _claim(self):
+        """Отмечает запущенной следующую задачу, которую можно выполнить сейчас, и возвращает ее."""
+        running = dict(self.connection.execute(
+            "SELECT user_id, COUNT(*) FROM jobs WHERE status = ? GROUP BY user_id", (RUNNING,)).fetchall())
+        queued = self._queued()
+        users = dict(queued)
+        for job_id in fair_order(queued, self.last_started):
+            user_id = users[job_id]
+            if running.get(user_id, 0) >= self.max_running:
+                continue
+            now = time.time()
+            with self.connection:
+                self.connection.execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1, position = NULL WHERE id = ?",
+                    (RUNNING, now, job_id))
+            self.last_started[user_id] = now
+            return self.connection.execute(
+                "SELECT id, kind, chat_id, payload, status_message_id FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return None
+
+    def _finish(self, job_id, status, error=None):
+        with self.connection:
+            self.connection.execute("UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE id = ?",
+                                    (status, time.time(), error, job_id))
+
+    def _failed(self, job_id, payload):
+        if self.on_failed is None:
+            return
+        try:
+            self.on_failed(load_messages(payload, self.bot))
+        except Exception:
+            logging.exception(f"Не удалось завершить задачу {job_id} после ошибки")
+
+    async def refresh_positions(self):
+        """Обновляет сообщения задач, позиция которых в очереди изменилась."""
+        stored = dict(self.connection.execute("SELECT id, position FROM jobs WHERE status = ?", (QUEUED,)).fetchall())
+        for job_id, position in self.positions().items():
+            if stored.get(job_id) == position:
+                continue
+            with self.connection:
+                self.connection.execute("UPDATE jobs SET position = ? WHERE id = ?", (position, job_id))
+            chat_id, message_id = self.connection.execute(
+                "SELECT chat_id, status_message_id FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            await JobStatus(self.bot, chat_id, message_id).edit_text(f"⏳ В очереди, позиция {position}")
+
+    async def _run(self, job):
+        job_id, kind, chat_id, payload, status_message_id = job
+        status = JobStatus(self.bot, chat_id, status_message_id)
+        await status.edit_text("⚙️ Обрабатываю...")
+        await self.refresh_positions()
+        try:
+            messages = load_messages(payload, self.bot)
+            await self.runners[kind](messages, self.bot, status)
+        except asyncio.CancelledError:
+            # Остановка бота: задача остается в работе и будет выполнена после перезапуска
+            raise
+        except Exception as e:
+            # Ошибки обработки файла сообщаются самими обработчиками, сюда попадают только непредвиденные
+            logging.exception(f"Задача {job_id} завершилась с ошибкой")
+            self._finish(job_id, FAILED, f"{type(e).__name__}: {e}")
+            self._failed(job_id, payload)
+            await status.edit_text("❌ Ошибка при обработке файла")
+            return
+        self._finish(job_id, DONE)
+
+    async def _worker(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            try:
+                await self._run(job)
+            finally:
+                # Освободилось место - задачи этого пользователя и остальных могут запускаться
+                self._wakeup.set()
+
+    async def _resume(self):
+        """Возвращает в очередь задачи, прерванные перезапуском. Задачи, которые уже
+        прерывались max_attempts раз (например, из-за падения на самом файле), завершаются с ошибкой."""
+        interrupted = self.connection.execute(
+            "SELECT id, chat_id, status_message_id, attempts, payload FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        for job_id, chat_id, message_id, attempts, payload in interrupted:
+            if attempts >= self.max_attempts:
+                self._finish(job_id, FAILED, "прервана перезапуском")
+                self._failed(job_id, payload)
+                await JobStatus(self.bot, chat_id, message_id).edit_text(
+                    "❌ Не удалось обработать файл: обработка прерывалась несколько раз")
+                continue
+            with self.connection:
+                self.connection.execute("UPDATE jobs SET status = ?, position = NULL WHERE id = ?", (QUEUED, job_id))
+        # Задачи, принятые без ответа пользователю (перезапуск во время отправки статуса)
+        with self.connection:
+            self.connection.execute("UPDATE jobs SET status_message_id = 0 WHERE status = ? AND status_message_id IS NULL",
+                                    (QUEUED,))
+        if interrupted:
+            logging.info(f"После перезапуска в очередь возвращено задач: {len(interrupted)}")
+
+    async def start(self, bot):
+        """Запускает обработчики очереди и возобновляет незавершенные задачи."""
+        self.bot = bot
+        self._wakeup = asyncio.Event()
+        with self.connection:
+            self.connection.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                                    (DONE, FAILED, time.time() - self.retention))
+        self.last_started = dict(self.connection.execute(
+            "SELECT user_id, MAX(started_at) FROM jobs WHERE started_at IS NOT NULL GROUP BY user_id").fetchall())
+        await self._resume()
+        await self.refresh_positions()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logging.info(f"Запущена очередь задач: {self.workers} обработчиков")
+
+    async def stop(self):
+        """Останавливает обработчики. Выполнявшиеся задачи будут запущены снова при следующем старте."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self.connection.close()
@@ -0,0 +1,139 @@
+import math
+import time
+import logging
+from collections import deque
+from contextlib import contextmanager
+from aiohttp import web
+from config.settings import METRICS_WINDOW, METRICS_HOST, METRICS_PORT
+
+# Этапы обработки файла в порядке выполнения.
+# queue - ожидание места в пуле и передача данных между процессами
+STAGES = ['download', 'detect', 'queue', 'parse', 'generate', 'send', 'sap', 'archive']
+
+# Прочие показатели задачи: (ключ, подпись, единица)
+VALUES = [
+    ('rows', 'Строк', ''),
+    ('input_mb', 'Размер файла', ' МБ'),
+    ('peak_memory_mb', 'Пик памяти', ' МБ'),
+]
+
+_jobs = deque(maxlen=METRICS_WINDOW)
+_totals = {'jobs': 0, 'failed': 0}
+
+
+class JobMetrics:
+    """Время этапов и показатели одной задачи."""
+
+    def __init__(self, input_bytes=0):
+        self.timings = {}
+        self.values = {'input_mb': input_bytes / (1024 * 1024)}
+
+    @contextmanager
+    def stage(self, name):
+        """Замеряет время этапа (повторные замеры одного этапа суммируются)."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0.0) + time.perf_counter() - started
+
+    def add_worker_stats(self, stats, elapsed):
+        """Добавляет статистику из процесса пула.
+        :param elapsed: Полное время ожидания результата пула; все, что не parse и не generate, - очередь."""
+        parse, generate = stats.get('parse', 0.0), stats.get('generate', 0.0)
+        self.timings['parse'] = parse
+        self.timings['generate'] = generate
+        self.timings['queue'] = max(elapsed - parse - generate, 0.0)
+        self.values['rows'] = stats.get('rows', 0)
+        self.values['peak_memory_mb'] = stats.get('peak_memory_mb', 0.0)
+
+
+def record(job, failed=False):
+    """Сохраняет задачу в скользящее окно. Задачи с ошибкой только считаются."""
+    _totals['jobs'] += 1
+    if failed:
+        _totals['failed'] += 1
+        return
+    _jobs.append(job)
+    logging.info("Задача обработана: " + ", ".join(f"{name} {seconds:.2f} с" for name, seconds in job.timings.items()))
+
+
+def percentile(values, p):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(p * len(ordered)) - 1, 0)]
+
+
+def summarize():
+    """Считает p50/p95/max по этапам и показателям задач из окна.
+    :return: {название: (p50, p95, max)}"""
+    series = {}
+    for job in _jobs:
+        for name, value in list(job.timings.items()) + list(job.values.items()):
+            series.setdefault(name, []).append(value)
+    return {name: (percentile(values, 0.5), percentile(values, 0.95), max(values))
+            for name, values in series.items()}
+
+
+def format_stats():
+    """Форматирует статистику для команды /stats."""
+    summary = summarize()
+    lines = [
+        f"📈 <b>Статистика за последние {len(_jobs)} задач</b>",
+        f"Всего задач: {_totals['jobs']}, с ошибкой: {_totals['failed']}",
+    ]
+    if not _jobs:
+        lines.append("\nЕще нет обработанных файлов")
+        return "\n".join(lines)
+
+    lines.append("\n<b>Этапы (p50 / p95 / max, сек):</b>")
+    for stage in STAGES:
+        if stage in summary:
+            lines.append(f"• {stage}: " + " / ".join(f"{value:.2f}" for value in summary[stage]))
+    lines.append("\n<b>Задачи (p50 / p95 / max):</b>")
+    for key, title, unit in VALUES:
+        if key in summary:
+            lines.append(f"• {title}: " + " / ".join(f"{value:.0f}{unit}" for value in summary[key]))
+    return "\n".join(lines)
+
+
+def render_prometheus():
+    """Отрисовывает метрики в текстовом формате Prometheus."""
+    summary = summarize()
+    lines = [
+        "# TYPE jdt_jobs_total counter",
+        f"jdt_jobs_total {_totals['jobs']}",
+        "# TYPE jdt_jobs_failed_total counter",
+        f"jdt_jobs_failed_total {_totals['failed']}",
+        "# TYPE jdt_stage_seconds summary",
+    ]
+    for stage in STAGES:
+        if stage in summary:
+            p50, p95, maximum = summary[stage]
+            lines.append(f'jdt_stage_seconds{{stage="{stage}",quantile="0.5"}} {p50:.6f}')
+            lines.append(f'jdt_stage_seconds{{stage="{stage}",quantile="0.95"}} {p95:.6f}')
+            lines.append(f'jdt_stage_seconds{{stage="{stage}",quantile="1"}} {maximum:.6f}')
+    for key, _, _ in VALUES:
+        if key in summary:
+            lines.append(f"# TYPE jdt_job_{key} summary")
+            for quantile, value in zip(("0.5", "0.95", "1"), summary[key]):
+                lines.append(f'jdt_job_{key}{{quantile="{quantile}"}} {value:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+async def metrics_handler(request):
+    return web.Response(text=render_prometheus(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(host=METRICS_HOST, port=METRICS_PORT):
+    """Запускает HTTP-эндпоинт /metrics для сбора метрик.
+    :return: AppRunner для остановки сервера или None, если эндпоинт выключен."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Метрики доступны по адресу http://{host}:{port}/metrics")
+    return runner
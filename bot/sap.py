@@ -0,0 +1,361 @@
+# Проведение созданных отчетов в SAP Business One через Service Layer (объект JournalEntries).
+#     SAP_ENABLED=1 SAP_URL=https://sap:50000/b1s/v1 SAP_COMPANY_DB=... SAP_USER=... SAP_PASSWORD=... python main.py
+#     python -m bot.sap jdt.csv ojdt.csv            # провести уже созданные отчеты вручную
+#
+# Проводки отправляются запросами $batch по SAP_BATCH_SIZE штук, SAP_CONCURRENCY запросов одновременно,
+# через одну сессию Service Layer и пул keep-alive соединений. Каждый пакет - один changeset:
+# Service Layer создает все его проводки или ни одной. В Reference3 проводки пишется метка
+# <SAP_REFERENCE_PREFIX><хэш файлов>-<номер проводки в файле>. Перед отправкой и перед каждой повторной
+# попыткой уже созданные проводки ищутся по метке, поэтому потерянный ответ, повторная отправка
+# того же файла или перезапуск задачи не создают дублей.
+# Локальный Service Layer для проверки: python tests/fake_sap.py
+import io
+import re
+import sys
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import argparse
+from urllib.parse import quote, urlsplit
+import aiohttp
+import pandas as pd
+from yarl import URL
+from processing.cache import content_hash
+from processing.summary import check_rounding_account
+from config.settings import (SAP_URL, SAP_COMPANY_DB, SAP_USER, SAP_PASSWORD, SAP_BATCH_SIZE, SAP_CONCURRENCY,
+                             SAP_MAX_RETRIES, SAP_TIMEOUT, SAP_VERIFY_SSL, SAP_REFERENCE_PREFIX, BALANCE_TOLERANCE,
+                             ROUNDING_ACCOUNT)
+
+# Суммы строк и заголовка проводки: в JSON передаются числами
+AMOUNT_FIELDS = {'Debit', 'Credit', 'FCDebit', 'FCCredit', 'DebitSys', 'CreditSys', 'BaseSum', 'SystemBaseAmount',
+                 'VatAmount', 'SystemVatAmount', 'GrossValue'}
+
+# Даты: в файлах DTW - YYYYMMDD, в Service Layer - YYYY-MM-DD
+DATE_FIELDS = {'DueDate', 'ReferenceDate1', 'ReferenceDate2', 'TaxDate', 'VatDate', 'ReferenceDate', 'StornoDate'}
+
+# Колонки DTW, которых нет в объекте JournalEntries: номера задает сам SAP
+SKIP_FIELDS = {'ParentKey', 'LineNum', 'Line_ID', 'JdtNum'}
+
+# Поле заголовка с меткой проводки (в SAP - не длиннее 27 символов)
+TAG_FIELD = 'Reference3'
+
+# Сколько проводок запрашивается на одной странице при поиске уже созданных
+PAGE_SIZE = 500
+
+# Поля последней строки проводки, которые повторяются в строке разницы округления
+ROUNDING_LINE_FIELDS = ('DueDate', 'LineMemo', 'ReferenceDate1', 'Reference1', 'Reference2', 'TaxDate')
+
+# Ответы, после которых пакет отправляется снова: сбой или перегрузка сервера
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+# Статус и тело каждого ответа внутри ответа $batch
+RESPONSE_PART = re.compile(r'^HTTP/1\.[01] (\d{3})[^\r\n]*\r?\n(?:[^\r\n]+\r?\n)*\r?\n(.*?)(?=\r?\n--|\Z)', re.M | re.S)
+
+
+def read_journal(source):
+    """Читает созданный JDT или OJDT отчет как текст, без второй строки заголовков DTW.
+    Колонки, пустые во всех строках, отбрасываются сразу.
+    :param source: Путь к файлу или содержимое (bytes)."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    df = pd.read_csv(source, skiprows=[1], dtype=str, keep_default_na=False).fillna('')
+    return df.loc[:, (df != '').any()]
+
+
+def record_fields(columns, row):
+    """Непустые значения строки отчета как свойства объекта Service Layer."""
+    fields = {}
+    for column, value in zip(columns, row):
+        if value == '' or column in SKIP_FIELDS:
+            continue
+        if column in AMOUNT_FIELDS:
+            value = float(value)
+        elif column in DATE_FIELDS and len(value) == 8 and value.isdigit():
+            value = f"{value[:4]}-{value[4:6]}-{value[6:]}"
+        fields[column] = value
+    return fields
+
+
+def journal_tag(jdt_source, ojdt_source, prefix=SAP_REFERENCE_PREFIX):
+    """Метка файлов: одинакова для одного и того же содержимого отчетов."""
+    digest = hashlib.sha256((content_hash(jdt_source) + content_hash(ojdt_source)).encode()).hexdigest()
+    return f"{prefix}{digest[:10]}"
+
+
+def balance_lines(lines, account=ROUNDING_ACCOUNT):
+    """Добавляет строку разницы округления на счет account, если дебет и кредит проводки не совпадают.
+    В детальном журнале Total Fee может отличаться от Reseller + Net Fee на округление до десятых
+    (в пределах BALANCE_TOLERANCE), а SAP принимает только сбалансированные проводки.
+    Большая разница - ошибка в данных: проводка отправляется как есть, и SAP ее отклоняет."""
+    difference = round(sum(line.get('Debit', 0) for line in lines) - sum(line.get('Credit', 0) for line in lines), 2)
+    if not difference or abs(difference) > BALANCE_TOLERANCE + 1e-9:
+        return lines
+    check_rounding_account()
+    line = {field: lines[-1][field] for field in ROUNDING_LINE_FIELDS if field in lines[-1]}
+    line['ShortName'] = account
+    line['Credit' if difference > 0 else 'Debit'] = abs(difference)
+    return lines + [line]
+
+
+def build_entries(jdt_source, ojdt_source, tag):
+    """Собирает объекты JournalEntries из созданных JDT и OJDT отчетов (детальных или сводных).
+    Разница округления несбалансированной проводки относится на счет ROUNDING_ACCOUNT.
+    :param tag: Метка файлов (см. journal_tag): Reference3 проводки - метка и номер проводки в файле.
+    :return: Список пар (Reference3, объект проводки) в порядке OJDT."""
+    jdt, ojdt = read_journal(jdt_source), read_journal(ojdt_source)
+    lines = {}
+    columns = list(jdt.columns)
+    for parent, row in zip(jdt['ParentKey'], jdt.to_numpy()):
+        lines.setdefault(parent, []).append(record_fields(columns, row))
+    entries = []
+    columns = list(ojdt.columns)
+    for number, row in zip(ojdt['JdtNum'], ojdt.to_numpy()):
+        entry = record_fields(columns, row)
+        entry[TAG_FIELD] = f"{tag}-{number}"
+        entry['JournalEntryLines'] = balance_lines(lines.get(number, []))
+        entries.append((entry[TAG_FIELD], entry))
+    return entries
+
+
+def batch_body(entries, boundary, changeset, path):
+    """Тело запроса $batch: все проводки в одном changeset."""
+    parts = [f"--{boundary}", f"Content-Type: multipart/mixed;boundary={changeset}", ""]
+    for content_id, (_, entry) in enumerate(entries, start=1):
+        parts += [f"--{changeset}", "Content-Type: application/http", "Content-Transfer-Encoding: binary",
+                  f"Content-ID: {content_id}", "", f"POST {path}/JournalEntries", "Content-Type: application/json", "",
+                  json.dumps(entry, ensure_ascii=False)]
+    parts += [f"--{changeset}--", f"--{boundary}--", ""]
+    return "\r\n".join(parts)
+
+
+def parse_batch_response(text):
+    """Разбирает ответ $batch: список пар (статус, тело) по каждому ответу внутри."""
+    return [(int(status), body) for status, body in RESPONSE_PART.findall(text)]
+
+
+def error_message(text):
+    """Текст ошибки из ответа Service Layer (OData v3 и v4) или начало ответа."""
+    try:
+        message = json.loads(text)['error']['message']
+    except (ValueError, KeyError, TypeError):
+        return text.strip()[:200]
+    return message.get('value', '') if isinstance(message, dict) else str(message)
+
+
+class ServiceLayer:
+    """Сессия Service Layer: вход выполняется один раз, cookie B1SESSION и keep-alive соединения
+    пула используются всеми запросами. Истекшая сессия (401) открывается заново один раз на все
+    одновременные запросы."""
+
+    def __init__(self, url=SAP_URL, company_db=SAP_COMPANY_DB, user=SAP_USER, password=SAP_PASSWORD,
+                 concurrency=SAP_CONCURRENCY, timeout=SAP_TIMEOUT, verify_ssl=SAP_VERIFY_SSL):
+        if not url:
+            raise ValueError("Не задан адрес Service Layer (SAP_URL)")
+        self.url = url.rstrip('/')
+        parts = urlsplit(self.url)
+        self.origin, self.path = f"{parts.scheme}://{parts.netloc}", parts.path
+        self.credentials = {'CompanyDB': company_db, 'UserName': user, 'Password': password}
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.verify_ssl = verify_ssl
+        self.session = None
+        self._login_lock = asyncio.Lock()
+        self._generation = 0
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.concurrency, ssl=self.verify_ssl)
+        # unsafe - cookie сессии принимается и от адреса вида 127.0.0.1
+        self.session = aiohttp.ClientSession(connector=connector, cookie_jar=aiohttp.CookieJar(unsafe=True),
+                                             timeout=aiohttp.ClientTimeout(total=self.timeout))
+        try:
+            await self.login()
+        except BaseException:
+            await self.session.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        try:
+            async with self.session.post(f"{self.url}/Logout"):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+        await self.session.close()
+
+    async def login(self, expired=None):
+        """Открывает сессию.
+        :param expired: Номер истекшей сессии: если ее уже обновил другой запрос, вход не повторяется."""
+        async with self._login_lock:
+            if expired is not None and expired != self._generation:
+                return
+            async with self.session.post(f"{self.url}/Login", json=self.credentials) as response:
+                text = await response.text()
+                if response.status != 200:
+                    raise ValueError(f"Service Layer: вход не выполнен ({response.status}): {error_message(text)}")
+            self._generation += 1
+
+    def _url(self, path):
+        # Путь уже закодирован: aiohttp не должен менять $ и кавычки в $filter
+        if path.startswith('http'):
+            return URL(path, encoded=True)
+        if path.startswith('/'):
+            return URL(self.origin + path, encoded=True)
+        return URL(f"{self.url}/{path}", encoded=True)
+
+    async def request(self, method, path, **kwargs):
+        """Запрос к Service Layer. При истекшей сессии выполняется вход и запрос повторяется.
+        :param path: Путь относительно адреса Service Layer или ссылка из ответа (odata.nextLink).
+        :return: (статус, текст ответа)"""
+        for attempt in range(2):
+            generation = self._generation
+            async with self.session.request(method, self._url(path), **kwargs) as response:
+                text = await response.text()
+                if response.status != 401 or attempt:
+                    return response.status, text
+            await self.login(expired=generation)
+
+    async def find_tags(self, condition):
+        """Метки Reference3 проводок, подходящих под условие $filter (по всем страницам ответа)."""
+        found = set()
+        path = f"JournalEntries?$select={TAG_FIELD}&$filter={quote(condition, safe='')}"
+        while path:
+            status, text = await self.request('GET', path, headers={'Prefer': f'odata.maxpagesize={PAGE_SIZE}'})
+            if status != 200:
+                raise RuntimeError(f"Service Layer: поиск проводок не выполнен ({status}): {error_message(text)}")
+            data = json.loads(text)
+            found.update(item.get(TAG_FIELD) for item in data.get('value', []))
+            path = data.get('odata.nextLink') or data.get('@odata.nextLink')
+        return found
+
+    async def tagged(self, tag):
+        """Метки уже созданных проводок файлов с меткой tag."""
+        return await self.find_tags(f"startswith({TAG_FIELD}, '{tag}-')")
+
+    async def existing(self, tags):
+        """Какие из меток уже есть в SAP."""
+        return await self.find_tags(" or ".join(f"{TAG_FIELD} eq '{tag}'" for tag in tags))
+
+    async def post_batch(self, entries):
+        """Отправляет проводки одним $batch.
+        :return: (статус, текст ошибки или None, если созданы все проводки)"""
+        boundary, changeset = f"batch_{uuid.uuid4().hex}", f"changeset_{uuid.uuid4().hex}"
+        body = batch_body(entries, boundary, changeset, self.path).encode('utf-8')
+        status, text = await self.request('POST', '$batch', data=body,
+                                          headers={'Content-Type': f'multipart/mixed;boundary={boundary}'})
+        if status not in (200, 202):
+            return status, error_message(text)
+        results = parse_batch_response(text)
+        for part_status, part_body in results:
+            if not 200 <= part_status < 300:
+                return part_status, error_message(part_body)
+        if len(results) != len(entries):
+            # Ответ оборван: созданы ли проводки, выясняется по меткам перед повторной попыткой
+            return 502, f"в ответе $batch {len(results)} результатов из {len(entries)}"
+        return 201, None
+
+
+async def send_batch(client, batch, stats, max_retries, retry_delay):
+    """Отправляет пакет с повторными попытками. Перед повтором отправляются только проводки,
+    которых еще нет в SAP: ответ на прошлую попытку мог потеряться после их создания.
+    Пакет, отклоненный из-за данных, делится на части, чтобы остальные проводки были созданы."""
+    first, last = batch[0][0].rsplit('-', 1)[1], batch[-1][0].rsplit('-', 1)[1]
+    error = None
+    for attempt in range(max_retries + 1):
+        if attempt:
+            await asyncio.sleep(retry_delay * attempt)
+            try:
+                present = await client.existing([tag for tag, _ in batch])
+            except (aiohttp.ClientError, asyncio.TimeoutError, RuntimeError) as e:
+                # Без проверки повторять нельзя - пакет мог быть создан
+                error = f"{type(e).__name__}: {e}"
+                continue
+            stats['existing'] += sum(1 for tag, _ in batch if tag in present)
+            batch = [(tag, entry) for tag, entry in batch if tag not in present]
+            if not batch:
+                return
+        try:
+            status, error = await client.post_batch(batch)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            status, error = None, f"{type(e).__name__}: {e}"
+        if error is None:
+            stats['posted'] += len(batch)
+            return
+        logging.warning(f"SAP: пакет проводок {first}-{last} не создан ({status}): {error}")
+        if status is not None and status not in RETRY_STATUSES:
+            # Ошибка в данных (счет, баланс, период): changeset не создал ни одной проводки, повтор не поможет.
+            # Пакет делится пополам, пока ошибка не останется только у проводок, которые SAP не принимает
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                await send_batch(client, batch[:middle], stats, max_retries, retry_delay)
+                await send_batch(client, batch[middle:], stats, max_retries, retry_delay)
+                return
+            break
+    stats['failed'] += len(batch)
+    stats['errors'].append(f"проводки {first}-{last}: {error}" if first != last else f"проводка {first}: {error}")
+
+
+async def push_entries(client, entries, tag, batch_size=SAP_BATCH_SIZE, max_retries=SAP_MAX_RETRIES, retry_delay=2):
+    """Создает в SAP проводки, которых там еще нет.
+    :param entries: Список пар (Reference3, объект проводки), см. build_entries.
+    :return: Статистика: entries, posted (создано), existing (уже были в SAP), failed, errors."""
+    stats = {'entries': len(entries), 'posted': 0, 'existing': 0, 'failed': 0, 'errors': []}
+    present = await client.tagged(tag)
+    pending = [(reference, entry) for reference, entry in entries if reference not in present]
+    stats['existing'] = len(entries) - len(pending)
+    batches = [pending[start:start + batch_size] for start in range(0, len(pending), batch_size)]
+    slots = asyncio.Semaphore(client.concurrency)
+
+    async def send(batch):
+        async with slots:
+            await send_batch(client, batch, stats, max_retries, retry_delay)
+
+    await asyncio.gather(*(send(batch) for batch in batches))
+    return stats
+
+
+async def push_journals(jdt_source, ojdt_source, **options):
+    """Проводит созданные JDT и OJDT отчеты в SAP.
+    :param jdt_source: Путь к JDT или его содержимое (bytes); так же ojdt_source.
+    :param options: Параметры ServiceLayer (url, user, concurrency...) вместо настроек.
+    :return: Статистика (см. push_entries)."""
+    tag = journal_tag(jdt_source, ojdt_source)
+    entries = await asyncio.to_thread(build_entries, jdt_source, ojdt_source, tag)
+    if not entries:
+        return {'entries': 0, 'posted': 0, 'existing': 0, 'failed': 0, 'errors': []}
+    batch_size = options.pop('batch_size', SAP_BATCH_SIZE)
+    async with ServiceLayer(**options) as client:
+        stats = await push_entries(client, entries, tag, batch_size)
+    logging.info(f"SAP: проводок {stats['entries']}, создано {stats['posted']}, уже были {stats['existing']}, "
+                 f"с ошибкой {stats['failed']}")
+    return stats
+
+
+def format_push(stats):
+    """Строка сообщения о результате проведения в SAP."""
+    text = f"📤 SAP: создано проводок {stats['posted']} из {stats['entries']}"
+    if stats['existing']:
+        text += f", уже были в SAP: {stats['existing']}"
+    if stats['failed']:
+        text += f"\n❌ Не созданы: {stats['failed']}\n" + "\n".join(f"    - {error}" for error in stats['errors'][:5])
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Проведение JDT и OJDT отчетов в SAP через Service Layer')
+    parser.add_argument('jdt', help='Созданный JDT отчет')
+    parser.add_argument('ojdt', help='Созданный OJDT отчет')
+    parser.add_argument('--url', default=SAP_URL, help='Адрес Service Layer')
+    parser.add_argument('--batch-size', type=int, default=SAP_BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=SAP_CONCURRENCY)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    stats = asyncio.run(push_journals(args.jdt, args.ojdt, url=args.url, batch_size=args.batch_size,
+                                      concurrency=args.concurrency))
+    print(format_push(stats))
+    return 1 if stats['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,10 @@
+import io
 import os
+import shutil
+import zipfile
 import logging
+import tempfile
+from contextlib import asynccontextmanager
 
 
 async def clean_temp_directory(directory="temp"):
@@ -13,6 +18,39 @@ async def clean_temp_directory(directory="temp"):
             except Exception as e:
                 logging.error(f"Ошибка при удалении файла {file_path}: {e}")
 
+@asynccontextmanager
+async def job_workspace(base_dir="temp"):
+    """Создает отдельную временную директорию для одной задачи и удаляет ее по завершении.
+    Параллельные задачи не видят и не удаляют файлы друг друга."""
+    os.makedirs(base_dir, exist_ok=True)
+    workspace = tempfile.mkdtemp(prefix="job_", dir=base_dir)
+    try:
+        yield workspace
+    finally:
+        try:
+            shutil.rmtree(workspace)
+        except Exception as e:
+            logging.error(f"Ошибка при удалении директории {workspace}: {e}")
+
+def file_size(content):
+    """Размер файла на диске или содержимого в памяти (bytes)."""
+    if isinstance(content, bytes):
+        return len(content)
+    return os.path.getsize(content)
+
+def build_archive(files):
+    """Упаковывает файлы в zip-архив в памяти.
+    :param files: Список пар (имя файла в архиве, путь к файлу или содержимое bytes).
+    :return: Содержимое архива (bytes)."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for filename, content in files:
+            if isinstance(content, bytes):
+                archive.writestr(filename, content)
+            else:
+                archive.write(content, arcname=filename)
+    return buffer.getvalue()
+
 async def ensure_directories_exist(directories):
     """Убеждается, что указанные директории существуют.Если директория не существует, она будет создана."""
     for directory in directories:
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from processing.runner import is_busy, queued_jobs
+from config.settings import WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEB_HOST, WEB_PORT, HEALTH_PATH
+
+
+async def health_handler(request):
+    """Проверка работоспособности: отвечает, пока запущен процесс бота."""
+    return web.json_response({"status": "ok", "busy": is_busy(), "queued_jobs": queued_jobs()})
+
+
+def create_app(dp: Dispatcher, bot: Bot):
+    """Создает aiohttp приложение с обработчиком обновлений и проверкой работоспособности."""
+    app = web.Application()
+    app.router.add_get(HEALTH_PATH, health_handler)
+    # Обновление подтверждается Telegram сразу, а обрабатывается в фоне
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET or None).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot, host=WEB_HOST, port=WEB_PORT):
+    """Запускает HTTP-сервер и ждет обновлений до остановки процесса.
+    Без WEBHOOK_URL вебхук не регистрируется в Telegram, и сервер принимает только
+    локально отправленные обновления (python -m bot.fake_update)."""
+    if WEBHOOK_URL:
+        await bot.set_webhook(WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET or None)
+        logging.info(f"Вебхук зарегистрирован: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
+    else:
+        logging.warning("WEBHOOK_URL не задан: вебхук не зарегистрирован в Telegram")
+
+    runner = web.AppRunner(create_app(dp, bot))
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f"Сервер запущен на {host}:{port}, обновления принимаются по {WEBHOOK_PATH}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
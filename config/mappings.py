@@ -58,4 +58,51 @@ DEBIT_MAPPING_COMPLETED = {
     'wire_transfer': '210001',
     'Unicorn': '210010',
     'payretailers': '210014'
-}
\ No newline at end of file
+}
+
+# Правила проводок по типу отчета.
+# entries - наборы проводок в порядке нумерации JdtNum: первый набор нумеруется по строкам файла,
+# следующий (например, Additional Fee) - после всех транзакций. Условие when отбирает строки набора.
+# lines - строки JDT в порядке блоков отчета: набор, LineNum, колонка суммы в Debit или Credit
+# и счет ShortName. Счет задается таблицей по провайдеру (mapping - имя таблицы из этого файла,
+# неизвестный провайдер остается как есть), ключом SPECIAL_MAPPINGS (special) или условием
+# по значению колонки (if / then / else с ключами SPECIAL_MAPPINGS).
+# Для каждого набора в OJDT создаются заголовки в том же порядке.
+# currency - колонка валюты транзакции: при FX_ENABLED по ней и таблице курсов заполняются
+# FCDebit, FCCredit и FCCurrency каждой строки.
+POSTING_RULES = {
+    'payd': {
+        'date': 'Paid',
+        'dayfirst_fallback': True,
+        'currency': 'Fiat',
+        'entries': [
+            {'name': 'transaction'},
+        ],
+        'lines': [
+            {'entry': 'transaction', 'line': '', 'debit': 'Fval EUR', 'account': {'mapping': 'DEBIT_MAPPING_PAYD'}},
+            {'entry': 'transaction', 'line': '1', 'credit': 'Fval EUR', 'account': {'mapping': 'CREDIT_MAPPING_PEYD'}},
+        ],
+    },
+    'completed': {
+        'date': 'Completed',
+        'dayfirst_fallback': False,
+        'currency': 'Fiat',
+        'entries': [
+            {'name': 'transaction'},
+            {'name': 'additional_fee', 'when': {'nonzero': 'Additionall Fee'}},
+        ],
+        'lines': [
+            {'entry': 'transaction', 'line': '', 'debit': 'Total Fee EUR',
+             'account': {'mapping': 'DEBIT_MAPPING_COMPLETED'}},
+            {'entry': 'transaction', 'line': '1', 'credit': 'Reseller\nFee EUR',
+             'account': {'special': 'reseller_fee'}},
+            {'entry': 'transaction', 'line': '2', 'credit': 'Net\nFee EUR',
+             'account': {'if': {'Payment Provider': 'wire_transfer'},
+                         'then': 'net_fee_wire_transfer', 'else': 'net_fee_cc_apm'}},
+            {'entry': 'additional_fee', 'line': '', 'debit': 'Additionall Fee',
+             'account': {'mapping': 'DEBIT_MAPPING_COMPLETED'}},
+            {'entry': 'additional_fee', 'line': '1', 'credit': 'Additionall Fee',
+             'account': {'special': 'additional_fee'}},
+        ],
+    },
+}
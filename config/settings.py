@@ -18,3 +18,78 @@ PAYD_INPUT_FILE = os.path.join(TEMP_DIR, "исходник (Payd).csv")
 COMPLETED_INPUT_FILE = os.path.join(TEMP_DIR, "исходник (Completed).csv")
 JDT_OUTPUT_FILE = os.path.join(TEMP_DIR, "jdt.csv")
 OJDT_OUTPUT_FILE = os.path.join(TEMP_DIR, "ojdt.csv")
+
+# Настройки обработки
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1))  # Размер пула процессов для генерации отчетов
+MAX_CONCURRENT_JOBS = int(os.getenv("MAX_CONCURRENT_JOBS", WORKER_PROCESSES))  # Сколько файлов обрабатывается одновременно, остальные ждут в очереди
+PROCESSING_MODE = os.getenv("PROCESSING_MODE", "memory")  # memory - без записи на диск, disk - через временную директорию задачи
+STREAMING_THRESHOLD_BYTES = int(os.getenv("STREAMING_THRESHOLD_BYTES", 10 * 1024 * 1024))  # Файлы больше этого размера обрабатываются потоково по частям (ниже лимита скачивания Bot API в 20 МБ)
+STREAM_CHUNK_ROWS = int(os.getenv("STREAM_CHUNK_ROWS", 50000))  # Размер части при потоковой обработке
+CSV_ENGINE = os.getenv("CSV_ENGINE", "auto")  # pandas, pyarrow или auto - pyarrow, если установлен
+VALIDATION_ENABLED = os.getenv("VALIDATION_ENABLED", "1") == "1"  # Проверять строки до генерации и отдавать отклоненные отдельным файлом
+BALANCE_TOLERANCE = float(os.getenv("BALANCE_TOLERANCE", 0.1))  # Допустимое расхождение Total Fee и Reseller + Net Fee (округление до десятых)
+ROUNDING_ACCOUNT = os.getenv("ROUNDING_ACCOUNT", "")  # Счет SAP для разницы округления в сводном журнале и в проводках, отправляемых в SAP; обязателен при JOURNAL_MODE=summary или SAP_ENABLED=1
+REJECTS_NAME = "rejects.csv"  # Имя файла с отклоненными строками и причинами
+FX_ENABLED = os.getenv("FX_ENABLED", "0") == "1"  # Заполнять FCDebit, FCCredit и FCCurrency по валюте транзакции (Fiat) и таблице курсов
+FX_RATES_PATH = os.getenv("FX_RATES_PATH", os.path.join(BASE_DIR, "fx_rates.csv"))  # Таблица курсов: Date,Currency,Rate или eurofxref-hist.csv ЕЦБ (Date,USD,GBP,...)
+LOCAL_CURRENCY = os.getenv("LOCAL_CURRENCY", "EUR")  # Валюта Debit и Credit; курс - единиц валюты за 1 единицу этой валюты
+FX_MAX_AGE_DAYS = int(os.getenv("FX_MAX_AGE_DAYS", 7))  # Насколько последний курс может быть старше даты проводки (выходные и праздники)
+JOURNAL_MODE = os.getenv("JOURNAL_MODE", "detail")  # detail - проводка на каждый заказ, summary - одна проводка на дату и Payment Provider (детальные отчеты прикладываются)
+MEDIA_GROUP_WAIT = float(os.getenv("MEDIA_GROUP_WAIT", 1.0))  # Сколько секунд ждать остальные файлы медиагруппы
+
+# Настройки метрик
+METRICS_WINDOW = int(os.getenv("METRICS_WINDOW", 200))  # По скольким последним задачам считается /stats
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # Адрес HTTP-эндпоинта метрик
+METRICS_PORT = int(os.getenv("METRICS_PORT", 0))  # Порт эндпоинта /metrics, 0 - эндпоинт выключен
+
+# Настройки отправки результатов
+DELIVERY_MODE = os.getenv("DELIVERY_MODE", "auto")  # files - два CSV, archive - один zip, auto - zip, если отчеты больше порога
+ARCHIVE_THRESHOLD_BYTES = int(os.getenv("ARCHIVE_THRESHOLD_BYTES", 5 * 1024 * 1024))  # Суммарный размер отчетов, начиная с которого в режиме auto отправляется zip
+ARCHIVE_NAME = "reports.zip"  # Имя архива с отчетами
+
+# Настройки получения обновлений
+BOT_MODE = os.getenv("BOT_MODE", "polling")  # polling - long polling (процесс worker в Procfile), webhook - обновления через HTTP-сервер на PORT (процесс web)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # Публичный адрес приложения (https://...), пустой - вебхук не регистрируется в Telegram
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")  # Путь, на который Telegram отправляет обновления
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")  # Секрет из заголовка X-Telegram-Bot-Api-Secret-Token
+WEB_HOST = os.getenv("WEB_HOST", "0.0.0.0")  # Адрес HTTP-сервера в режиме webhook
+WEB_PORT = int(os.getenv("PORT", 8080))  # Порт HTTP-сервера (PaaS передает его в PORT)
+HEALTH_PATH = "/health"  # Проверка работоспособности для балансировщика
+
+# Настройки кэша результатов
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") == "1"  # Повторно присланный файл отвечается готовыми отчетами
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "cache"))  # Директория кэша
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", 500 * 1024 * 1024))  # Максимальный размер кэша
+CACHE_MAX_AGE = int(os.getenv("CACHE_MAX_AGE", 7 * 24 * 3600))  # Сколько секунд хранится запись без обращений
+
+# Настройки журнала проведенных заказов
+LEDGER_ENABLED = os.getenv("LEDGER_ENABLED", "1") == "1"  # Записывать заказы из созданных отчетов в журнал
+LEDGER_PATH = os.getenv("LEDGER_PATH", os.path.join(BASE_DIR, "ledger.sqlite3"))  # Файл SQLite журнала
+INCREMENTAL_MODE = os.getenv("INCREMENTAL_MODE", "0") == "1"  # Создавать проводки только по заказам, которых еще нет в журнале
+
+# Настройки архива созданных журналов (поиск командой /find)
+JOURNAL_ARCHIVE_ENABLED = os.getenv("JOURNAL_ARCHIVE_ENABLED", "1") == "1"  # Записывать строки созданных JDT в архив после отправки отчетов
+JOURNAL_ARCHIVE_DIR = os.getenv("JOURNAL_ARCHIVE_DIR", os.path.join(BASE_DIR, "journal_archive"))  # Директория партиций архива (файл SQLite на месяц)
+JOURNAL_ARCHIVE_COMPACT_INTERVAL = int(os.getenv("JOURNAL_ARCHIVE_COMPACT_INTERVAL", 24 * 3600))  # Как часто (сек) сжимать партиции закончившихся месяцев
+JOURNAL_ARCHIVE_FIND_LIMIT = int(os.getenv("JOURNAL_ARCHIVE_FIND_LIMIT", 20))  # Сколько строк показывает /find
+
+# Настройки очереди задач
+JOBS_PATH = os.getenv("JOBS_PATH", os.path.join(BASE_DIR, "jobs.sqlite3"))  # Файл SQLite очереди: незавершенные задачи выполняются после перезапуска
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", MAX_CONCURRENT_JOBS))  # Сколько задач (скачивание, обработка, отправка) выполняется одновременно
+USER_MAX_QUEUED_JOBS = int(os.getenv("USER_MAX_QUEUED_JOBS", 5))  # Сколько задач одного пользователя может быть в очереди и в работе
+USER_MAX_RUNNING_JOBS = int(os.getenv("USER_MAX_RUNNING_JOBS", 1))  # Сколько задач одного пользователя выполняется одновременно
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 3))  # Сколько раз задача запускается снова после перезапуска бота
+JOB_RETENTION = int(os.getenv("JOB_RETENTION", 7 * 24 * 3600))  # Сколько секунд хранятся завершенные задачи
+
+# Настройки проведения в SAP Business One через Service Layer
+SAP_ENABLED = os.getenv("SAP_ENABLED", "0") == "1"  # Проводить созданные JDT и OJDT в SAP после отправки файлов
+SAP_URL = os.getenv("SAP_URL", "")  # Адрес Service Layer, например https://sap:50000/b1s/v1
+SAP_COMPANY_DB = os.getenv("SAP_COMPANY_DB", "")  # База компании
+SAP_USER = os.getenv("SAP_USER", "")  # Пользователь SAP
+SAP_PASSWORD = os.getenv("SAP_PASSWORD", "")  # Пароль пользователя SAP
+SAP_BATCH_SIZE = int(os.getenv("SAP_BATCH_SIZE", 50))  # Проводок в одном запросе $batch (создаются все или ни одной)
+SAP_CONCURRENCY = int(os.getenv("SAP_CONCURRENCY", 4))  # Сколько запросов $batch выполняется одновременно, это же размер пула соединений
+SAP_MAX_RETRIES = int(os.getenv("SAP_MAX_RETRIES", 3))  # Повторные попытки пакета при сетевых ошибках и ошибках сервера
+SAP_TIMEOUT = int(os.getenv("SAP_TIMEOUT", 300))  # Таймаут одного запроса в секундах
+SAP_VERIFY_SSL = os.getenv("SAP_VERIFY_SSL", "1") == "1"  # Проверять сертификат Service Layer (0 - для самоподписанного)
+SAP_REFERENCE_PREFIX = os.getenv("SAP_REFERENCE_PREFIX", "TG")  # Начало метки Reference3, по которой находятся уже созданные проводки
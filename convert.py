@@ -0,0 +1,163 @@
+# Пакетная конвертация выгрузок без Telegram.
+#
+#     python convert.py exports/                    # все CSV в директории
+#     python convert.py "exports/2025-*.csv" -w 4   # по маске, 4 процесса
+#     python convert.py exports/ -r --skip-existing  # рекурсивно, пропуская готовые
+#     python convert.py exports/ --incremental      # только заказы, которых еще нет в журнале
+#     python convert.py exports/ --summary          # еще и сводный журнал по дате и провайдеру
+#
+# Рядом с каждым файлом <имя>.csv создаются <имя>_jdt.csv и <имя>_ojdt.csv,
+# а строки, не прошедшие проверку, записываются в <имя>_rejects.csv.
+# Со --summary сводный журнал записывается в <имя>_jdt_summary.csv и <имя>_ojdt_summary.csv.
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from processing.runner import convert_path
+from processing.templates import preload_templates
+from processing.summary import check_rounding_account
+from config.settings import WORKER_PROCESSES, STREAMING_THRESHOLD_BYTES, INCREMENTAL_MODE, JOURNAL_MODE
+
+# Суффиксы выходных файлов: такие файлы не считаются выгрузками при повторном запуске
+OUTPUT_SUFFIXES = ('_jdt.csv', '_ojdt.csv', '_rejects.csv', '_jdt_summary.csv', '_ojdt_summary.csv')
+
+
+def output_paths(input_file):
+    """Пути к JDT и OJDT отчетам рядом с исходным файлом."""
+    stem = os.path.splitext(input_file)[0]
+    return stem + OUTPUT_SUFFIXES[0], stem + OUTPUT_SUFFIXES[1]
+
+
+def rejects_path(input_file):
+    """Путь к файлу отклоненных строк рядом с исходным файлом."""
+    return os.path.splitext(input_file)[0] + OUTPUT_SUFFIXES[2]
+
+
+def summary_paths(input_file):
+    """Пути к сводным JDT и OJDT рядом с исходным файлом."""
+    stem = os.path.splitext(input_file)[0]
+    return stem + OUTPUT_SUFFIXES[3], stem + OUTPUT_SUFFIXES[4]
+
+
+def find_inputs(patterns, recursive=False):
+    """Собирает CSV выгрузки по директориям и маскам, без повторов и выходных файлов."""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*.csv') if recursive else os.path.join(pattern, '*.csv')
+        found.extend(glob.glob(pattern, recursive=recursive))
+    inputs = []
+    for path in sorted(set(os.path.abspath(path) for path in found)):
+        if os.path.isfile(path) and path.lower().endswith('.csv') and not path.endswith(OUTPUT_SUFFIXES):
+            inputs.append(path)
+    return inputs
+
+
+def is_converted(input_file, summary=False):
+    """Проверяет, что отчеты (и сводный журнал, если он нужен) уже созданы и не старше исходного файла."""
+    mtime = os.path.getmtime(input_file)
+    paths = output_paths(input_file) + (summary_paths(input_file) if summary else ())
+    return all(os.path.exists(path) and os.path.getmtime(path) >= mtime for path in paths)
+
+
+def convert_all(inputs, workers=WORKER_PROCESSES, streaming_threshold=STREAMING_THRESHOLD_BYTES,
+                incremental=INCREMENTAL_MODE, summary=JOURNAL_MODE == 'summary'):
+    """Конвертирует файлы в пуле процессов, печатая прогресс.
+    :return: (список статистик успешных файлов, список пар (файл, ошибка))"""
+    results, failures = [], []
+    # spawn - как в пуле бота: одинаковое поведение на всех платформах
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=preload_templates) as executor:
+        futures = {executor.submit(convert_path, path, *output_paths(path), streaming_threshold, incremental,
+                                   rejects_path(path), summary_paths(path) if summary else None): path
+                   for path in inputs}
+        for done, future in enumerate(as_completed(futures), start=1):
+            path = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:
+                failures.append((path, f"{type(e).__name__}: {e}"))
+                print(f"[{done}/{len(inputs)}] ❌ {path}: {type(e).__name__}: {e}", flush=True)
+                continue
+            results.append(stats)
+            seconds = stats.get('parse', 0.0) + stats.get('generate', 0.0)
+            print(f"[{done}/{len(inputs)}] ✅ {path}: {stats['report_type'].upper()}, "
+                  f"{stats['rows']} строк, {seconds:.2f} с"
+                  + (f", пропущено проведенных: {stats['skipped']}" if stats['skipped'] else "")
+                  + (f", сводных проводок: {stats['entries']}" if summary else "")
+                  + (f", отклонено: {stats['rejected']} ({rejects_path(path)})" if stats['rejected'] else ""),
+                  flush=True)
+    return results, failures
+
+
+def format_summary(results, failures, skipped, elapsed):
+    """Итоговая сводка по пропускной способности и ошибкам."""
+    rows = sum(stats['rows'] for stats in results)
+    skipped_rows = sum(stats['skipped'] for stats in results)
+    rejected_rows = sum(stats['rejected'] for stats in results)
+    megabytes = sum(stats['input_bytes'] for stats in results) / (1024 * 1024)
+    by_type = {}
+    for stats in results:
+        by_type[stats['report_type']] = by_type.get(stats['report_type'], 0) + 1
+    lines = [
+        "",
+        f"Обработано файлов: {len(results)} "
+        f"({', '.join(f'{t.upper()}: {n}' for t, n in sorted(by_type.items())) or '-'}), "
+        f"с ошибкой: {len(failures)}, пропущено готовых: {skipped}",
+        f"Строк: {rows}, пропущено проведенных: {skipped_rows}, отклонено: {rejected_rows}, объем: {megabytes:.1f} МБ, время: {elapsed:.1f} с",
+    ]
+    if elapsed > 0:
+        lines.append(f"Скорость: {rows / elapsed:.0f} строк/с, {megabytes / elapsed:.1f} МБ/с, "
+                     f"{len(results) / elapsed:.2f} файлов/с")
+    if failures:
+        lines.append("Ошибки:")
+        lines.extend(f"    - {path}: {error}" for path, error in failures)
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Конвертация выгрузок PAYD/COMPLETED в JDT и OJDT отчеты')
+    parser.add_argument('paths', nargs='+', help='Директории, файлы или маски (например, "exports/*.csv")')
+    parser.add_argument('-w', '--workers', type=int, default=WORKER_PROCESSES, help='Количество процессов')
+    parser.add_argument('-r', '--recursive', action='store_true', help='Искать файлы во вложенных директориях')
+    parser.add_argument('--skip-existing', action='store_true', help='Пропускать файлы, для которых отчеты уже созданы')
+    parser.add_argument('--streaming-threshold', type=int, default=STREAMING_THRESHOLD_BYTES,
+                        help='Размер файла в байтах, начиная с которого он читается по частям')
+    parser.add_argument('--incremental', action='store_true', default=INCREMENTAL_MODE,
+                        help='Создавать проводки только по заказам, которых еще нет в журнале')
+    parser.add_argument('--summary', action='store_true', default=JOURNAL_MODE == 'summary',
+                        help='Создавать также сводный журнал: одна проводка на дату и Payment Provider')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+    if args.summary:
+        try:
+            check_rounding_account()
+        except ValueError as e:
+            print(e)
+            return 1
+
+    inputs = find_inputs(args.paths, args.recursive)
+    skipped = 0
+    if args.skip_existing:
+        pending = [path for path in inputs if not is_converted(path, args.summary)]
+        skipped = len(inputs) - len(pending)
+        inputs = pending
+    if not inputs:
+        print("Нет файлов для обработки")
+        return 0
+
+    print(f"Найдено файлов: {len(inputs)}, процессов: {args.workers}")
+    started = time.perf_counter()
+    results, failures = convert_all(inputs, args.workers, args.streaming_threshold, args.incremental,
+                                     args.summary)
+    print(format_summary(results, failures, skipped, time.perf_counter() - started))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
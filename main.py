@@ -4,8 +4,13 @@ import asyncio
 from aiogram import Bot, Dispatcher
 from aiogram.types import BotCommand
 
-from config.settings import BOT_TOKEN
-from bot.handlers import router
+from config.settings import BOT_TOKEN, BOT_MODE, JOURNAL_MODE, SAP_ENABLED
+from bot.handlers import router, get_job_queue
+from bot.webhook import run_webhook
+from bot.metrics import start_metrics_server
+from processing.runner import shutdown as shutdown_runner
+from processing.templates import preload_templates
+from processing.summary import check_rounding_account
 
 
 bot = Bot(token=BOT_TOKEN)
@@ -24,9 +29,32 @@ async def register_commands():
     await bot.set_my_commands(commands)
 
 async def main():
+    if JOURNAL_MODE == 'summary' or SAP_ENABLED:
+        # Сводный журнал и проведение в SAP относят разницу округления на ROUNDING_ACCOUNT:
+        # без счета не запускаемся, а не падаем на первом файле
+        check_rounding_account()
+    preload_templates()  # Загружаем шаблоны отчетов один раз при запуске
     await register_commands()  # Регистрируем команды
     dp.include_router(router)
-    await dp.start_polling(bot)
+    metrics_runner = await start_metrics_server()  # Эндпоинт /metrics, если задан METRICS_PORT
+    job_queue = get_job_queue()
+    await job_queue.start(bot)  # Обработчики очереди и задачи, прерванные прошлым перезапуском
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            # Вебхук, оставшийся от запуска в режиме webhook, мешает получать обновления
+            webhook = await bot.get_webhook_info()
+            if webhook.url:
+                logging.warning(f"Удаляется вебхук {webhook.url}: если процесс web еще запущен, "
+                                f"он перестанет получать обновления")
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        await job_queue.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        shutdown_runner()
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
@@ -0,0 +1,67 @@
+import io
+import os
+import zipfile
+import pandas as pd
+from processing.reports import REPORT_MODULES
+from processing.dates import normalize_dates
+from processing.loader import load_report, read_raw_header, determine_report_type
+from processing.rules import get_plan
+from processing.validation import check_header
+from config.settings import VALIDATION_ENABLED
+
+
+def extract_csv_files(data):
+    """Извлекает CSV файлы из zip-архива в порядке их следования в архиве.
+    Служебные файлы (__MACOSX, скрытые) и вложенные директории пропускаются.
+    :return: Список пар (имя файла, содержимое bytes)."""
+    files = []
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or info.filename.startswith('__MACOSX') or name.startswith('.'):
+                continue
+            if name.lower().endswith('.csv'):
+                files.append((name, archive.read(info)))
+    return files
+
+
+def detect_batch_types(files):
+    """Определяет тип каждого файла пакета по строке заголовков.
+    Файлы без обязательных колонок попадают в ошибки (если проверка включена).
+    :param files: Список пар (имя файла, содержимое bytes).
+    :return: ({тип отчета: [(имя файла, содержимое)]}, [(имя файла, ошибка)])"""
+    groups, errors = {}, []
+    for name, data in files:
+        try:
+            header = read_raw_header(io.BytesIO(data))
+            report_type = determine_report_type(header)
+            if VALIDATION_ENABLED:
+                check_header(report_type, header)
+        except ValueError as e:
+            errors.append((name, str(e)))
+            continue
+        groups.setdefault(report_type, []).append((name, data))
+    return groups, errors
+
+
+def read_batch_file(report_type, data):
+    """Читает один файл пакета, оставляя только колонки, нужные для генерации.
+    Выполняется в процессе пула. Значения переводятся в object, чтобы при объединении
+    файлов целые и дробные суммы из разных файлов печатались так же, как по отдельности.
+    Даты разбираются по формату этого файла и записываются как YYYY-MM-DD: в пакете бывают
+    выгрузки D/M и M/D, а формат объединенной колонки определяется один на все файлы."""
+    df = load_report(io.BytesIO(data), REPORT_MODULES[report_type].INPUT_COLUMNS)
+    df = df.reindex(columns=REPORT_MODULES[report_type].INPUT_COLUMNS).astype(object)
+    plan = get_plan(report_type)
+    dates, _ = normalize_dates(df[plan.date_column], dayfirst_fallback=plan.dayfirst_fallback)
+    dates = pd.Series(dates, index=df.index, dtype=object)
+    # Нераспознанные значения остаются как в файле и отклоняются проверкой
+    parsed = dates.str.fullmatch(r'\d{8}', na=False)
+    df.loc[parsed, plan.date_column] = dates[parsed].str.replace(r'(\d{4})(\d{2})(\d{2})', r'\1-\2-\3', regex=True)
+    return df
+
+
+def merge_frames(frames):
+    """Объединяет файлы пакета в один DataFrame в порядке поступления.
+    Нумерация JdtNum/ParentKey при генерации идет сквозной по всем файлам."""
+    return pd.concat(frames, ignore_index=True)
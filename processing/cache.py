@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+from config import mappings
+from config.settings import VALIDATION_ENABLED, BALANCE_TOLERANCE
+from processing.templates import ALL_TEMPLATES
+
+# Увеличивается при любом изменении логики генерации, влияющем на содержимое отчетов
+FORMAT_VERSION = 3
+
+META_FILE = 'meta.json'
+ALIASES_DIR = 'aliases'
+
+
+def compute_version():
+    """Версия правил генерации: логика, счета и правила проводок из config.mappings, настройки проверки строк и файлы шаблонов.
+    При изменении любого из них старые записи кэша перестают находиться."""
+    digest = hashlib.sha256(str(FORMAT_VERSION).encode())
+    tables = [mappings.SPECIAL_MAPPINGS, mappings.DEBIT_MAPPING_PAYD,
+              mappings.CREDIT_MAPPING_PEYD, mappings.DEBIT_MAPPING_COMPLETED, mappings.POSTING_RULES]
+    digest.update(json.dumps([tables, VALIDATION_ENABLED, BALANCE_TOLERANCE], sort_keys=True).encode('utf-8'))
+    for path in ALL_TEMPLATES:
+        with open(path, 'rb') as handle:
+            digest.update(handle.read())
+    return digest.hexdigest()[:16]
+
+
+def content_hash(source):
+    """sha256 содержимого (bytes) или файла на диске."""
+    digest = hashlib.sha256()
+    if isinstance(source, bytes):
+        digest.update(source)
+    else:
+        with open(source, 'rb') as handle:
+            for block in iter(lambda: handle.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Кэш готовых отчетов на диске, адресуемый хэшем исходного файла.
+    Запись - директория <ключ>/ с файлами отчетов и meta.json (тип отчета, число строк,
+    file_id отправленных в Telegram файлов). Время последнего обращения - mtime meta.json.
+    Вытеснение: сначала записи старше max_age, затем самые давние по обращению,
+    пока общий размер больше max_bytes."""
+
+    def __init__(self, directory, max_bytes, max_age, version=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.version = version or compute_version()
+        os.makedirs(os.path.join(directory, ALIASES_DIR), exist_ok=True)
+
+    def make_key(self, digest, variant=''):
+        """Ключ записи: хэш исходного файла с версией правил генерации.
+        :param variant: Режим обработки, от которого зависит результат (например, incremental)."""
+        return f"{digest}-{self.version}{'-' + variant if variant else ''}"
+
+    def _entry_dir(self, key):
+        return os.path.join(self.directory, key)
+
+    def _alias_path(self, alias):
+        # file_unique_id Telegram содержит только символы base64url
+        return os.path.join(self.directory, ALIASES_DIR, alias)
+
+    def get(self, key):
+        """Возвращает метаданные записи и отмечает обращение, либо None."""
+        meta_path = os.path.join(self._entry_dir(key), META_FILE)
+        try:
+            with open(meta_path, encoding='utf-8') as handle:
+                meta = json.load(handle)
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            return None
+        meta['key'] = key
+        return meta
+
+    def get_by_alias(self, alias):
+        """Ищет запись по file_unique_id исходного документа (без скачивания файла)."""
+        try:
+            with open(self._alias_path(alias), encoding='utf-8') as handle:
+                key = handle.read().strip()
+        except OSError:
+            return None
+        return self.get(key)
+
+    def add_alias(self, alias, key):
+        """Запоминает, что документ с file_unique_id alias соответствует записи key."""
+        with open(self._alias_path(alias), 'w', encoding='utf-8') as handle:
+            handle.write(key)
+
+    def read_file(self, key, filename):
+        """Содержимое файла отчета из записи (bytes)."""
+        with open(os.path.join(self._entry_dir(key), filename), 'rb') as handle:
+            return handle.read()
+
+    def file_path(self, key, filename):
+        return os.path.join(self._entry_dir(key), filename)
+
+    def put(self, key, files, **meta):
+        """Сохраняет отчеты в кэш. Запись создается во временной директории
+        и переименовывается целиком, поэтому недописанные записи не видны.
+        :param files: Список пар (имя файла, путь к файлу или содержимое bytes).
+        :param meta: Дополнительные метаданные (тип отчета, число строк)."""
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(entry_dir):
+            return
+        staging = tempfile.mkdtemp(prefix='.tmp_', dir=self.directory)
+        try:
+            for filename, content in files:
+                target = os.path.join(staging, filename)
+                if isinstance(content, bytes):
+                    with open(target, 'wb') as handle:
+                        handle.write(content)
+                else:
+                    shutil.copyfile(content, target)
+            meta = {**meta, 'files': [filename for filename, _ in files], 'file_ids': {}, 'created': time.time()}
+            with open(os.path.join(staging, META_FILE), 'w', encoding='utf-8') as handle:
+                json.dump(meta, handle, ensure_ascii=False)
+            os.rename(staging, entry_dir)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            # Запись могла быть создана параллельной задачей с тем же файлом
+            if not os.path.exists(entry_dir):
+                raise
+        self.evict()
+
+    def set_file_ids(self, key, file_ids):
+        """Запоминает file_id отправленных файлов, чтобы отправлять их повторно без загрузки."""
+        meta_path = os.path.join(self._entry_dir(key), META_FILE)
+        try:
+            with open(meta_path, encoding='utf-8') as handle:
+                meta = json.load(handle)
+            meta['file_ids'].update(file_ids)
+            with open(meta_path, 'w', encoding='utf-8') as handle:
+                json.dump(meta, handle, ensure_ascii=False)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Не удалось сохранить file_id в кэш: {e}")
+
+    def _entries(self):
+        """Записи кэша: (время обращения, размер, ключ)."""
+        entries = []
+        for key in os.listdir(self.directory):
+            entry_dir = self._entry_dir(key)
+            if key == ALIASES_DIR or key.startswith('.') or not os.path.isdir(entry_dir):
+                continue
+            try:
+                accessed = os.path.getmtime(os.path.join(entry_dir, META_FILE))
+                size = sum(entry.stat().st_size for entry in os.scandir(entry_dir))
+            except OSError:
+                continue
+            entries.append((accessed, size, key))
+        return entries
+
+    def evict(self):
+        """Удаляет устаревшие записи и самые давние по обращению, пока кэш больше max_bytes."""
+        entries = sorted(self._entries())
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        removed = set()
+        for accessed, size, key in entries:
+            if now - accessed <= self.max_age and total <= self.max_bytes:
+                break
+            shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+            removed.add(key)
+            total -= size
+        if removed:
+            logging.info(f"Из кэша удалено записей: {len(removed)}")
+            self._drop_aliases(removed)
+
+    def _drop_aliases(self, keys):
+        aliases_dir = os.path.join(self.directory, ALIASES_DIR)
+        for alias in os.listdir(aliases_dir):
+            path = os.path.join(aliases_dir, alias)
+            try:
+                with open(path, encoding='utf-8') as handle:
+                    if handle.read().strip() in keys:
+                        os.remove(path)
+            except OSError:
+                continue
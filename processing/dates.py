@@ -0,0 +1,242 @@
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+# Поддерживаемые форматы дат в порядке приоритета
+DATE_FORMATS = [
+    '%Y-%m-%d %H:%M:%S',  # 2025-01-31 22:22:24
+    '%d/%m/%Y %H:%M:%S',  # 31/01/2025 22:22:24
+    '%m/%d/%Y %H:%M:%S',  # 01/31/2025 22:22:24
+    '%d.%m.%Y %H:%M:%S',  # 31.01.2025 22:22:24
+    '%Y/%m/%d %H:%M:%S',  # 2025/01/31 22:22:24
+    '%d/%m/%Y %H:%M',     # 31/01/2025 22:22
+    '%m/%d/%Y %H:%M',     # 01/31/2025 22:22
+    '%d/%m/%y %H:%M',     # 31/01/25 22:22
+    '%m/%d/%y %H:%M',     # 1/31/25 22:22
+    '%Y-%m-%d',           # 2025-01-31
+    '%d/%m/%Y',           # 31/01/2025
+    '%m/%d/%Y',           # 01/31/2025
+    '%d.%m.%Y',           # 31.01.2025
+    '%Y/%m/%d',           # 2025/01/31
+    '%Y%m%d',             # 20250131
+]
+
+# Формат дат в выходных отчетах
+OUTPUT_FORMAT = '%Y%m%d'
+
+# Форматы, в которых год идет первым: порядок дня и месяца в них не бывает неоднозначным
+YEAR_FIRST = '%Y'
+
+
+def date_order(date_format):
+    """Порядок дня и месяца в формате: 'day' (день перед месяцем), 'month' или None (год первым)."""
+    if date_format.startswith(YEAR_FIRST):
+        return None
+    return 'day' if date_format.index('%d') < date_format.index('%m') else 'month'
+
+
+# Форма значения даты: все цифры заменяются на 1
+SHAPE_DIGITS = str.maketrans('0123456789', '1111111111')
+
+
+def format_dates(dates):
+    """Даты в OUTPUT_FORMAT (yyyymmdd) - числом из года, месяца и дня, без strftime по каждому значению."""
+    return (dates.year * 10000 + dates.month * 100 + dates.day).astype(str).to_numpy(dtype=object)
+
+
+def distinct_texts(dates):
+    """Уникальные непустые значения колонки дат как текст без пробелов по краям."""
+    uniques = pd.Series(dates, dtype=object).dropna().unique()
+    return pd.Index(uniques, dtype=object).map(str).str.strip()
+
+
+def shape_fits(shape, date_format):
+    """Подходит ли форма значения (цифры заменены на 1) к формату."""
+    try:
+        datetime.strptime(shape, date_format)
+        return True
+    except ValueError:
+        return False
+
+
+class ParsedFormats:
+    """Разбор уникальных значений колонки форматами: каждый формат разбирается не больше одного раза
+    и только на значениях подходящей формы. Значения одной формы (все цифры заменены на 1) отличаются
+    только цифрами: если форма не подходит к формату, ни одно из них не разбирается этим форматом."""
+
+    def __init__(self, texts):
+        self.texts = pd.Index(texts, dtype=object)
+        self.shape_codes, self.shapes = pd.factorize(np.array([text.translate(SHAPE_DIGITS) for text in self.texts],
+                                                              dtype=object))
+        self.results = {}
+
+    def dates(self, date_format):
+        """Даты всех значений по формату (NaT - не разобрано)."""
+        if date_format not in self.results:
+            fits = np.array([shape_fits(shape, date_format) for shape in self.shapes], dtype=bool)
+            mask = fits[self.shape_codes] if len(self.shapes) else np.zeros(0, dtype=bool)
+            dates = pd.DatetimeIndex(np.full(len(self.texts), np.datetime64('NaT', 'ns')))
+            if mask.any():
+                values = dates.to_numpy().copy()
+                values[mask] = pd.to_datetime(self.texts[mask], format=date_format, errors='coerce').to_numpy()
+                dates = pd.DatetimeIndex(values)
+            self.results[date_format] = dates
+        return self.results[date_format]
+
+    def parsed(self, date_format):
+        """Маска значений, разобранных форматом."""
+        return np.asarray(self.dates(date_format).notna())
+
+
+def choose_format(counts, total):
+    """Выбирает формат по числу разобранных значений {формат: число} (в порядке приоритета):
+    первый формат, подходящий ко всем значениям, иначе подходящий к наибольшему числу."""
+    if not total:
+        return None
+    for date_format, count in counts.items():
+        if count == total:
+            return date_format
+    best = max(counts, key=counts.get, default=None)
+    return best if best is not None and counts[best] else None
+
+
+def choose_parsed(parsed, formats, within=None):
+    """Выбирает формат для значений ParsedFormats (всех или по маске within), см. detect_format."""
+    within = np.ones(len(parsed.texts), dtype=bool) if within is None else within
+    total = int(within.sum())
+    counts = {}
+    for date_format in formats:
+        counts[date_format] = int((parsed.parsed(date_format) & within).sum())
+        if counts[date_format] == total:
+            break
+    return choose_format(counts, total)
+
+
+def detect_format(values, formats=DATE_FORMATS):
+    """Определяет формат колонки по всем переданным значениям.
+    Формат, не разбирающий хотя бы одно значение, выбирается, только если ни один формат
+    не подходит ко всем: в выгрузке, отсортированной по дате, первые значения часто
+    подходят и к D/M, и к M/D. Возвращает None, если не подошел ни один."""
+    return choose_parsed(ParsedFormats(values), formats)
+
+
+def detect_column_format(dates, formats=DATE_FORMATS):
+    """Определяет формат колонки дат по всем ее уникальным значениям."""
+    texts = distinct_texts(dates)
+    return detect_format(texts, formats) if len(texts) else None
+
+
+class FormatDetector:
+    """Определяет формат колонки по всем значениям, прочитанным по частям (потоковая обработка):
+    выбор тот же, что у detect_format, но без хранения всех значений."""
+
+    def __init__(self, formats=DATE_FORMATS):
+        self.counts = dict.fromkeys(formats, 0)
+        self.total = 0
+
+    def add(self, dates):
+        parsed = ParsedFormats(distinct_texts(dates))
+        self.total += len(parsed.texts)
+        for date_format in self.counts:
+            self.counts[date_format] += int(parsed.parsed(date_format).sum())
+
+    def result(self):
+        return choose_format(self.counts, self.total)
+
+
+def parse_column(texts, formats=DATE_FORMATS, date_format=None):
+    """Подбирает формат каждому уникальному значению колонки.
+    Первым пробуется формат колонки (переданный или определенный по всем значениям), оставшиеся
+    значения - форматами, определенными по ним же. После формата с днем и месяцем используются
+    только форматы с тем же порядком: колонка никогда не читается одновременно как D/M и как M/D.
+    :return: (даты yyyymmdd или None, формат каждого значения или None, порядок дня и месяца колонки)"""
+    parsed = ParsedFormats(texts)
+    formatted = np.full(len(texts), None, dtype=object)
+    unique_formats = np.full(len(texts), None, dtype=object)
+    pending = np.ones(len(texts), dtype=bool)
+    order, remaining = None, list(formats)
+    while pending.any() and remaining:
+        candidate = date_format if date_format in remaining else choose_parsed(parsed, remaining, pending)
+        date_format = None
+        if candidate is None:
+            break
+        remaining.remove(candidate)
+        positions = np.flatnonzero(pending & parsed.parsed(candidate))
+        formatted[positions] = format_dates(parsed.dates(candidate)[positions])
+        unique_formats[positions] = candidate
+        pending[positions] = False
+        if order is None and date_order(candidate):
+            order = date_order(candidate)
+            remaining = [f for f in remaining if date_order(f) in (None, order)]
+    return formatted, unique_formats, order
+
+
+def parse_dayfirst(text):
+    """Свободный разбор даты с dayfirst=True. :return: yyyymmdd или None."""
+    try:
+        return pd.to_datetime(text, dayfirst=True).strftime(OUTPUT_FORMAT)
+    except (ValueError, OverflowError):
+        return None
+
+
+def normalize_dates(dates, formats=DATE_FORMATS, dayfirst_fallback=False, column=None, date_format=None):
+    """Преобразует колонку дат в формат yyyymmdd.
+    Формат определяется один раз по всем уникальным значениям, каждое уникальное значение
+    разбирается один раз, результат раскладывается обратно по строкам. Значения, не подошедшие
+    под формат колонки, пробуются остальными форматами с тем же порядком дня и месяца, затем
+    (если dayfirst_fallback и колонка не M/D) свободным разбором с dayfirst=True.
+    Нераспознанные значения остаются как есть.
+    :param date_format: Заранее известный формат колонки (например, определенный по всему файлу).
+    :return: (массив отформатированных дат, отчет {формат: число строк})"""
+    column = column or getattr(dates, 'name', None) or 'date'
+    codes, uniques = pd.factorize(pd.Series(dates, dtype=object))
+    texts = pd.Index(uniques, dtype=object).map(str).str.strip()
+    parsed, unique_formats, order = parse_column(texts, formats, date_format)
+
+    for position in np.flatnonzero(pd.isnull(unique_formats)):
+        if dayfirst_fallback and order != 'month':
+            parsed[position] = parse_dayfirst(texts[position])
+            if parsed[position] is not None:
+                unique_formats[position] = 'dayfirst'
+                continue
+        logging.error(f"Не удалось распознать формат даты: {uniques[position]}")
+
+    formatted = np.empty(len(uniques) + 1, dtype=object)
+    formatted[:-1] = np.where(pd.isnull(unique_formats), uniques, parsed)
+    # Код -1 (пустая дата) указывает на последний элемент
+    formatted[-1] = np.nan
+
+    # Отчет считается по строкам, а не по уникальным значениям
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    report = {}
+    for unique_format, count in zip(unique_formats, counts):
+        key = unique_format or 'не распознано'
+        report[key] = report.get(key, 0) + int(count)
+    if len(report) > 1:
+        logging.warning(format_report(column, report))
+
+    return formatted[codes], report
+
+
+def unparsed_mask(dates, formats=DATE_FORMATS, dayfirst_fallback=False, date_format=None):
+    """Маска непустых дат, которые normalize_dates не разберет: не подходят под формат колонки
+    и форматы с тем же порядком дня и месяца (и не разбираются свободно с dayfirst=True, если
+    dayfirst_fallback и колонка не M/D). Как и в normalize_dates, разбираются только уникальные значения."""
+    codes, uniques = pd.factorize(pd.Series(dates, dtype=object))
+    texts = pd.Index(uniques, dtype=object).map(str).str.strip()
+    _, unique_formats, order = parse_column(texts, formats, date_format)
+    pending = pd.isnull(unique_formats)
+    if dayfirst_fallback and order != 'month':
+        for position in np.flatnonzero(pending):
+            pending[position] = parse_dayfirst(texts[position]) is None
+    # Код -1 (пустая дата) указывает на последний элемент
+    return np.append(pending, False)[codes]
+
+
+def format_report(column, report):
+    """Форматирует отчет о найденных форматах дат для колонки."""
+    lines = [f"Колонка '{column}' содержит несколько форматов дат:"]
+    for date_format, count in sorted(report.items(), key=lambda item: -item[1]):
+        lines.append(f"    - {date_format}: {count} строк")
+    return "\n".join(lines)
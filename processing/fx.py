@@ -0,0 +1,83 @@
+import os
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from config.settings import FX_RATES_PATH, LOCAL_CURRENCY, FX_MAX_AGE_DAYS
+
+# Таблицы курсов по пути файла: (mtime, таблица, sha256 файла)
+_tables = {}
+
+
+def read_rates(path):
+    """Читает таблицу курсов в длинном виде (Date, Currency, Rate) или в широком, как eurofxref-hist.csv
+    ЕЦБ (Date, USD, GBP, ...). Курс - количество единиц валюты за 1 единицу LOCAL_CURRENCY.
+    :return: DataFrame date, currency, rate, отсортированный по дате (для as-of join)."""
+    df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    df.columns = df.columns.str.strip()
+    # У файла ЕЦБ в конце строк лишняя запятая
+    df = df.loc[:, [column for column in df.columns if column and not column.startswith('Unnamed')]]
+    if 'Currency' not in df.columns:
+        df = df.melt(id_vars='Date', var_name='Currency', value_name='Rate')
+    rates = pd.DataFrame({
+        'date': pd.to_datetime(df['Date'].str.strip(), format='mixed', errors='coerce').astype('datetime64[ns]'),
+        'currency': df['Currency'].str.strip().str.upper(),
+        'rate': pd.to_numeric(df['Rate'].str.strip(), errors='coerce'),
+    })
+    # N/A у ЕЦБ - курс в этот день не публиковался
+    rates = rates[rates['date'].notna() & (rates['rate'] > 0)]
+    return rates.sort_values('date', kind='stable').reset_index(drop=True)
+
+
+def load_rates(path=FX_RATES_PATH):
+    """Таблица курсов из файла: читается один раз на процесс и перечитывается, только если файл изменился.
+    :return: (таблица курсов, sha256 файла)"""
+    if not os.path.exists(path):
+        raise ValueError(f"Нет таблицы курсов {path} (FX_RATES_PATH)")
+    mtime = os.path.getmtime(path)
+    cached = _tables.get(path)
+    if cached is None or cached[0] != mtime:
+        with open(path, 'rb') as handle:
+            digest = hashlib.sha256(handle.read()).hexdigest()
+        cached = _tables[path] = (mtime, read_rates(path), digest)
+        logging.info(f"Загружена таблица курсов {path}: {len(cached[1])} курсов, "
+                     f"валют: {cached[1]['currency'].nunique()}")
+    return cached[1], cached[2]
+
+
+def rates_version(path=FX_RATES_PATH):
+    """Версия таблицы курсов для кэша отчетов: меняется вместе с содержимым файла."""
+    return load_rates(path)[1][:10]
+
+
+def lookup_rates(dates, currencies, path=FX_RATES_PATH, local_currency=LOCAL_CURRENCY, max_age_days=FX_MAX_AGE_DAYS):
+    """Курс на дату проводки для каждой строки: последний курс валюты не старше даты (as-of join
+    по всей колонке, без поиска по строкам).
+    :param dates: Даты проводок (yyyymmdd).
+    :param currencies: Валюты транзакций.
+    :return: (курсы, валюты): NaN и пустая валюта для строк в LOCAL_CURRENCY, без валюты или без курса."""
+    rates, _ = load_rates(path)
+    currency = pd.Series(currencies, dtype=object).str.strip().str.upper()
+    rows = pd.DataFrame({
+        'date': pd.to_datetime(pd.Series(dates, dtype=object), format='%Y%m%d', errors='coerce').astype('datetime64[ns]'),
+        # Ключ as-of join должен иметь тот же тип, что и в таблице курсов
+        'currency': currency.astype(rates['currency'].dtype).to_numpy(),
+        'row': np.arange(len(currency)),
+    })
+    wanted = rows[rows['date'].notna() & rows['currency'].notna() & (rows['currency'] != local_currency)]
+    result = np.full(len(rows), np.nan)
+    if len(wanted):
+        joined = pd.merge_asof(wanted.sort_values('date', kind='stable'), rates, on='date', by='currency',
+                               direction='backward', tolerance=pd.Timedelta(days=max_age_days))
+        result[joined['row'].to_numpy()] = joined['rate'].to_numpy(dtype=float)
+        missing = joined[joined['rate'].isna()]
+        if len(missing):
+            logging.warning(f"Нет курса для {len(missing)} строк (валюты: "
+                            f"{', '.join(sorted(missing['currency'].unique()))}): FC-колонки не заполнены")
+    found = ~np.isnan(result)
+    return result, np.where(found, currency.to_numpy(dtype=object), np.nan).astype(object)
+
+
+def foreign_amounts(amounts, rates):
+    """Суммы в валюте транзакции: сумма в LOCAL_CURRENCY по курсу, с округлением до сотых."""
+    return (pd.to_numeric(pd.Series(amounts, dtype=object)).to_numpy(dtype=float) * rates).round(2)
@@ -0,0 +1,157 @@
+import io
+import os
+import csv
+import numpy as np
+import pandas as pd
+from processing.templates import load_template
+
+# Разделитель строк, как у pandas.to_csv по умолчанию
+LINE_TERMINATOR = os.linesep
+
+# Символы, при наличии которых значение заключается в кавычки
+SPECIAL_CHARS = r'[,"\r\n]'
+
+
+def map_accounts(providers, mapping):
+    """Сопоставляет провайдерам счета, оставляя неизвестных провайдеров как есть.
+    Для категориальной колонки сопоставляются только категории."""
+    if isinstance(providers.dtype, pd.CategoricalDtype):
+        categories = providers.cat.categories.to_series().astype(object)
+        accounts = np.empty(len(categories) + 1, dtype=object)
+        accounts[:-1] = categories.map(mapping).fillna(categories).to_numpy(dtype=object)
+        # Код -1 (пустой провайдер) указывает на последний элемент
+        accounts[-1] = np.nan
+        return accounts[providers.cat.codes.to_numpy()]
+    return providers.map(mapping).fillna(providers).to_numpy(dtype=object)
+
+
+def build_block(jdt_num, line_num, debit, credit, short_name, dates, names, orders, foreign=None):
+    """Собирает блок строк JDT из целых колонок.
+    :param foreign: Пара (суммы в валюте, валюты) для FCDebit/FCCredit и FCCurrency или None."""
+    size = len(jdt_num)
+    empty = np.full(size, '', dtype=object)
+    if isinstance(short_name, str):
+        short_name = np.full(size, short_name, dtype=object)
+    block = pd.DataFrame({
+        'ParentKey': jdt_num,
+        'JdtNum': jdt_num,
+        'LineNum': np.full(size, line_num, dtype=object),
+        'Debit': empty if debit is None else debit,
+        'Credit': empty if credit is None else credit,
+        'DueDate': dates,
+        'ShortName': short_name,
+        'ReferenceDate1': dates,
+        'Reference1': names,
+        'Reference2': orders,
+        'TaxDate': dates
+    })
+    if foreign is not None:
+        amounts, currencies = foreign
+        block['FCDebit'] = empty if debit is None else amounts
+        block['FCCredit'] = empty if credit is None else amounts
+        block['FCCurrency'] = currencies
+    return block
+
+
+def build_header_block(jdt_num, dates, names, orders):
+    """Собирает блок заголовков OJDT из целых колонок."""
+    return pd.DataFrame({
+        'JdtNum': jdt_num,
+        'ReferenceDate': dates,
+        'Reference': names,
+        'Reference2': orders,
+        'TaxDate': dates,
+        'DueDate': dates
+    })
+
+
+def quote_field(value):
+    """Экранирует одно значение так же, как csv writer внутри pandas.to_csv."""
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator=LINE_TERMINATOR, quoting=csv.QUOTE_MINIMAL).writerow([value])
+    return buffer.getvalue()[:-len(LINE_TERMINATOR)]
+
+
+def to_text(values):
+    """Переводит значения в текст через str(), пустые значения - в ''."""
+    values = pd.Series(values, dtype=object)
+    texts = values.astype(str).astype(object)
+    texts[values.isna().to_numpy()] = ''
+    return texts.to_numpy(dtype=object)
+
+
+def quote_values(texts):
+    """Заключает в кавычки только значения с разделителем, кавычкой или переводом строки."""
+    texts = pd.Series(texts, dtype=object)
+    special = texts.str.contains(SPECIAL_CHARS, regex=True).to_numpy(dtype=bool)
+    if special.any():
+        texts[special] = texts[special].map(quote_field)
+    return texts.to_numpy(dtype=object)
+
+
+def render_column(values):
+    """Отрисовывает колонку отчета так же, как pandas.to_csv.
+    Целые числа преобразуются напрямую, экранирование выполняется один раз
+    для каждого уникального значения."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'iu':
+        return np.array(list(map(str, values.tolist())), dtype=object)
+    if values.dtype.kind != 'O' or pd.api.types.infer_dtype(values, skipna=True) != 'string':
+        # Равные числа (0 и -0.0, 1 и True) печатаются по-разному,
+        # поэтому уникальные значения ищутся уже среди текстов
+        values = to_text(values)
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    rendered = np.empty(len(uniques) + 1, dtype=object)
+    rendered[:-1] = quote_values(uniques)
+    # Код -1 (пустое значение) указывает на последний элемент
+    rendered[-1] = ''
+    return rendered[codes]
+
+
+def render_rows(result_df, template):
+    """Отрисовывает строки отчета в колонках шаблона.
+    Пустые колонки между заполненными заранее собраны в шаблон строки из запятых,
+    поэтому стоимость зависит от числа заполненных полей, а не от ширины шаблона."""
+    populated = sorted((template.positions[column], column)
+                       for column in result_df.columns if column in template.positions)
+    # Без общих с шаблоном колонок строк нет, как и при копировании колонок в пустой DataFrame
+    if not len(result_df) or not populated:
+        return ''
+
+    # Шаблон строки вида ",,%s,%s,,,%s,,,,": %s только на месте заполненных колонок
+    cells = [''] * len(template.columns)
+    for position, _ in populated:
+        cells[position] = '%s'
+    row_format = ','.join(cells)
+    columns = [render_column(result_df[column].to_numpy()) for _, column in populated]
+    return LINE_TERMINATOR.join(map(row_format.__mod__, zip(*columns))) + LINE_TERMINATOR
+
+
+def write_text(output, text):
+    """Записывает текст в файл по пути, в текстовый или в бинарный файловый объект."""
+    if isinstance(output, (str, os.PathLike)):
+        with open(output, 'w', encoding='utf-8', newline='') as handle:
+            handle.write(text)
+    elif isinstance(output, (io.RawIOBase, io.BufferedIOBase)):
+        output.write(text.encode('utf-8'))
+    else:
+        output.write(text)
+
+
+def write_journal(result_df, template_path, output_file):
+    """Записывает строки отчета под двумя строками заголовков шаблона.
+    :param result_df: DataFrame с заполненными колонками отчета.
+    :param template_path: Путь к шаблону отчета.
+    :param output_file: Путь к выходному файлу или файловый объект."""
+    template = load_template(template_path)
+    write_text(output_file, template.header + render_rows(result_df, template))
+
+
+def write_header(template, handle):
+    """Записывает только две строки заголовков шаблона."""
+    write_text(handle, template.header)
+
+
+def write_rows(result_df, template, handle):
+    """Дописывает строки отчета без заголовков (для потоковой записи по частям)."""
+    write_text(handle, render_rows(result_df, template))
@@ -0,0 +1,278 @@
+# Архив созданных журналов: в каком отчете и в какой проводке оказался заказ.
+#     python -m processing.journal_archive find BE194612
+#     python -m processing.journal_archive find "Nadya Zhegova" --date 20250131 --account 210008
+#     python -m processing.journal_archive compact
+#
+# После отправки отчетов строки JDT записываются в партицию месяца архивации - отдельный файл SQLite
+# <JOURNAL_ARCHIVE_DIR>/journals-YYYY-MM.sqlite3 с индексами по Order, Name, дате и счету.
+# Поиск - индексный запрос к каждой партиции, от новых к старым. Отчет с тем же содержимым
+# (повторно присланный файл) в партиции второй раз не записывается.
+# Сжатие (не чаще JOURNAL_ARCHIVE_COMPACT_INTERVAL): партиции закончившихся месяцев получают
+# ANALYZE и VACUUM, месяцы закончившегося года объединяются в journals-YYYY.sqlite3 без повторов отчетов,
+# чтобы поиск открывал меньше файлов.
+import io
+import os
+import re
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import closing
+import pandas as pd
+from processing.cache import content_hash
+from config.settings import JOURNAL_ARCHIVE_DIR, JOURNAL_ARCHIVE_COMPACT_INTERVAL, JOURNAL_ARCHIVE_FIND_LIMIT
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    report_id INTEGER PRIMARY KEY,
+    digest TEXT NOT NULL UNIQUE,
+    report_type TEXT,
+    source TEXT,
+    user TEXT,
+    archived_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS lines (
+    report_id INTEGER NOT NULL,
+    jdt_num INTEGER,
+    line_num TEXT,
+    order_id TEXT COLLATE NOCASE,
+    name TEXT COLLATE NOCASE,
+    date TEXT,
+    account TEXT,
+    debit REAL,
+    credit REAL
+);
+CREATE INDEX IF NOT EXISTS lines_order ON lines (order_id);
+CREATE INDEX IF NOT EXISTS lines_name ON lines (name);
+CREATE INDEX IF NOT EXISTS lines_date ON lines (date);
+CREATE INDEX IF NOT EXISTS lines_account ON lines (account, date);
+"""
+
+# Колонки JDT, которые хранятся в архиве, и их имена в таблице lines
+COLUMNS = {'ParentKey': 'jdt_num', 'LineNum': 'line_num', 'Reference2': 'order_id', 'Reference1': 'name',
+           'DueDate': 'date', 'ShortName': 'account', 'Debit': 'debit', 'Credit': 'credit'}
+
+# Партиции: journals-YYYY-MM (месяц, открытая или сжатая) и journals-YYYY (объединенный год)
+PARTITION = re.compile(r'journals-(\d{4})(?:-(\d{2}))?\.sqlite3$')
+
+# PRAGMA user_version сжатой партиции
+COMPACTED = 1
+
+# Строки, которые записываются одним executemany
+INSERT_CHUNK = 10000
+
+# Верхняя граница поиска по началу имени
+PREFIX_END = '\U0010ffff'
+
+
+def read_lines(source):
+    """Строки JDT отчета для архива (без второй строки заголовков DTW).
+    :param source: Путь к файлу или содержимое (bytes)."""
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    df = pd.read_csv(source, skiprows=[1], usecols=list(COLUMNS), dtype=str, keep_default_na=False)
+    df = df.rename(columns=COLUMNS)[list(COLUMNS.values())]
+    df['jdt_num'] = pd.to_numeric(df['jdt_num'], errors='coerce')
+    for column in ('debit', 'credit'):
+        df[column] = pd.to_numeric(df[column], errors='coerce')
+    return df.astype(object).where(df.notna(), None)
+
+
+def connect(path):
+    """Соединение с партицией; схема создается при первом обращении."""
+    connection = sqlite3.connect(path, timeout=30)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+class JournalArchive:
+    """Архив строк созданных JDT по партициям-месяцам в SQLite.
+    Запись и поиск вызываются из потоков (asyncio.to_thread), поэтому запись и сжатие
+    выполняются под одной блокировкой, а каждый вызов открывает свои соединения."""
+
+    def __init__(self, directory, compact_interval=JOURNAL_ARCHIVE_COMPACT_INTERVAL):
+        self.directory = directory
+        self.compact_interval = compact_interval
+        self.compacted_at = 0.0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def partition_path(self, year, month=None):
+        name = f"journals-{year:04d}" + (f"-{month:02d}" if month else "") + ".sqlite3"
+        return os.path.join(self.directory, name)
+
+    def partitions(self):
+        """Партиции от новых к старым: [(год, месяц или None, путь)]."""
+        found = []
+        for name in os.listdir(self.directory):
+            match = PARTITION.fullmatch(name)
+            if match:
+                year, month = match.groups()
+                found.append((int(year), int(month) if month else None, os.path.join(self.directory, name)))
+        # Объединенный год старше любого своего месяца
+        return sorted(found, key=lambda item: (item[0], item[1] or 0), reverse=True)
+
+    def add(self, jdt, report_type=None, source=None, user=None, now=None):
+        """Записывает строки JDT отчета в партицию текущего месяца.
+        :param jdt: Путь к JDT или его содержимое (bytes).
+        :return: Количество записанных строк (0, если этот отчет уже в архиве)."""
+        digest = content_hash(jdt)
+        lines = read_lines(jdt)
+        now = time.time() if now is None else now
+        moment = time.localtime(now)
+        with self.lock:
+            with closing(connect(self.partition_path(moment.tm_year, moment.tm_mon))) as connection:
+                with connection:
+                    cursor = connection.execute(
+                        "INSERT OR IGNORE INTO reports (digest, report_type, source, user, archived_at) "
+                        "VALUES (?, ?, ?, ?, ?)", (digest, report_type, source, user, now))
+                    if not cursor.rowcount:
+                        return 0
+                    report_id = cursor.lastrowid
+                    rows = list(zip(*(lines[column].to_numpy() for column in COLUMNS.values())))
+                    for start in range(0, len(rows), INSERT_CHUNK):
+                        connection.executemany(
+                            "INSERT INTO lines (report_id, jdt_num, line_num, order_id, name, date, account, "
+                            "debit, credit) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            ((report_id,) + row for row in rows[start:start + INSERT_CHUNK]))
+            logging.info(f"В архив журналов записано {len(rows)} строк {report_type or ''} {source or ''}")
+            if now - self.compacted_at >= self.compact_interval:
+                self.compact(now)
+        return len(rows)
+
+    def find(self, text=None, date=None, account=None, limit=JOURNAL_ARCHIVE_FIND_LIMIT):
+        """Ищет строки по Order (точно) или Name (по началу, без учета регистра), дате и счету.
+        :return: Список словарей строк с данными отчета, от новых отчетов к старым, не больше limit."""
+        conditions, params = [], []
+        if text:
+            text = text.strip()
+            conditions.append("(l.order_id = ? OR (l.name >= ? AND l.name < ?))")
+            params += [text, text, text + PREFIX_END]
+        if date:
+            conditions.append("l.date = ?")
+            params.append(date)
+        if account:
+            conditions.append("l.account = ?")
+            params.append(account)
+        if not conditions:
+            raise ValueError("Укажите Order, Name, дату или счет")
+        query = ("SELECT r.report_type, r.source, r.user, r.archived_at, l.jdt_num, l.line_num, l.order_id, "
+                 "l.name, l.date, l.account, l.debit, l.credit FROM lines l "
+                 "JOIN reports r ON r.report_id = l.report_id WHERE " + " AND ".join(conditions) +
+                 " ORDER BY r.archived_at DESC, l.jdt_num, l.line_num LIMIT ?")
+        results = []
+        for _, _, path in self.partitions():
+            with closing(sqlite3.connect(path, timeout=30)) as connection:
+                connection.row_factory = sqlite3.Row
+                rows = connection.execute(query, params + [limit - len(results)]).fetchall()
+            results += [dict(row) for row in rows]
+            if len(results) >= limit:
+                break
+        return results
+
+    def compact(self, now=None):
+        """Сжимает партиции закончившихся месяцев и объединяет месяцы закончившегося года.
+        :return: Количество сжатых или объединенных партиций."""
+        now = time.time() if now is None else now
+        moment = time.localtime(now)
+        self.compacted_at = now
+        done = 0
+        for year, month, path in self.partitions():
+            if month is None or (year, month) >= (moment.tm_year, moment.tm_mon):
+                continue
+            if year < moment.tm_year:
+                self.merge(path, self.partition_path(year))
+            elif not self.is_compacted(path):
+                self.optimize(path)
+            else:
+                continue
+            done += 1
+        for year, month, path in self.partitions():
+            if month is None and not self.is_compacted(path):
+                self.optimize(path)
+        if done:
+            logging.info(f"Архив журналов: сжато партиций: {done}")
+        return done
+
+    @staticmethod
+    def is_compacted(path):
+        with closing(sqlite3.connect(path, timeout=30)) as connection:
+            return connection.execute("PRAGMA user_version").fetchone()[0] == COMPACTED
+
+    @staticmethod
+    def optimize(path):
+        """Обновляет статистику индексов и уплотняет файл партиции."""
+        with closing(sqlite3.connect(path, timeout=30)) as connection:
+            connection.execute("ANALYZE")
+            connection.execute("VACUUM")
+            connection.execute(f"PRAGMA user_version = {COMPACTED}")
+
+    @staticmethod
+    def merge(path, target):
+        """Переносит партицию месяца в партицию года и удаляет ее.
+        Отчеты, которые уже есть в партиции года, не переносятся, поэтому прерванное
+        объединение можно повторить."""
+        with closing(connect(target)) as connection:
+            connection.execute("PRAGMA user_version = 0")
+            connection.execute("ATTACH DATABASE ? AS month", (path,))
+            with connection:
+                offset = connection.execute("SELECT COALESCE(MAX(report_id), 0) FROM reports").fetchone()[0]
+                connection.execute(
+                    "INSERT INTO reports (report_id, digest, report_type, source, user, archived_at) "
+                    "SELECT report_id + ?, digest, report_type, source, user, archived_at FROM month.reports "
+                    "WHERE digest NOT IN (SELECT digest FROM main.reports)", (offset,))
+                connection.execute(
+                    "INSERT INTO lines SELECT l.report_id + ?, l.jdt_num, l.line_num, l.order_id, l.name, l.date, "
+                    "l.account, l.debit, l.credit FROM month.lines l "
+                    "JOIN main.reports r ON r.report_id = l.report_id + ? "
+                    "JOIN month.reports m ON m.report_id = l.report_id AND m.digest = r.digest",
+                    (offset, offset))
+            connection.execute("DETACH DATABASE month")
+        os.remove(path)
+
+
+def format_found(rows, limit=JOURNAL_ARCHIVE_FIND_LIMIT):
+    """Текст ответа /find: строка на каждую найденную строку журнала."""
+    if not rows:
+        return "🔍 Ничего не найдено"
+    lines = [f"🔍 Найдено строк: {len(rows)}" + (f" (показаны первые {limit})" if len(rows) >= limit else "")]
+    for row in rows:
+        amount = f"Дт {row['debit']:.2f}" if row['debit'] is not None else f"Кт {row['credit'] or 0:.2f}"
+        archived = time.strftime('%Y-%m-%d %H:%M', time.localtime(row['archived_at']))
+        lines.append(f"• {row['order_id']} {row['name']} - {row['date']}, счет {row['account']}, {amount}\n"
+                     f"    JdtNum {row['jdt_num']} в {(row['report_type'] or '').upper()} "
+                     f"{row['source'] or ''} от {archived}" + (f" (@{row['user']})" if row['user'] else ""))
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поиск по архиву созданных журналов и сжатие архива')
+    parser.add_argument('--dir', default=JOURNAL_ARCHIVE_DIR, help='Директория архива')
+    commands = parser.add_subparsers(dest='command', required=True)
+    find_parser = commands.add_parser('find', help='Найти строки журналов по Order или Name')
+    find_parser.add_argument('text', nargs='?', help='Номер заказа или начало имени клиента')
+    find_parser.add_argument('--date', help='Дата проводки, YYYYMMDD')
+    find_parser.add_argument('--account', help='Счет (ShortName)')
+    find_parser.add_argument('--limit', type=int, default=JOURNAL_ARCHIVE_FIND_LIMIT)
+    commands.add_parser('compact', help='Сжать партиции закончившихся месяцев')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    archive = JournalArchive(args.dir)
+    if args.command == 'compact':
+        print(f"Сжато партиций: {archive.compact()}")
+        return
+    started = time.perf_counter()
+    try:
+        rows = archive.find(args.text, args.date, args.account, args.limit)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(format_found(rows, args.limit))
+    print(f"Поиск: {(time.perf_counter() - started) * 1000:.1f} мс", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+import time
+import sqlite3
+import logging
+import pandas as pd
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS posted_orders (
+    report_type TEXT NOT NULL,
+    order_id TEXT NOT NULL,
+    posted_at REAL NOT NULL,
+    source TEXT,
+    owner TEXT,
+    PRIMARY KEY (report_type, order_id)
+) WITHOUT ROWID
+"""
+# Неподтвержденных заказов немного, поэтому индекс только по ним
+OWNER_INDEX = "CREATE INDEX IF NOT EXISTS posted_orders_owner ON posted_orders (owner) WHERE owner IS NOT NULL"
+
+_ledgers = {}
+
+
+def order_keys(orders):
+    """Номера заказов как текст; пустые значения остаются пустыми (None)."""
+    orders = pd.Series(orders, dtype=object)
+    keys = orders.astype(str).str.strip()
+    return keys.where(orders.notna(), None)
+
+
+class OrderLedger:
+    """Журнал проведенных заказов (Order) по типам отчетов в SQLite.
+    Проверка выполняется одним запросом на весь файл: уникальные номера загружаются
+    во временную таблицу и соединяются с журналом по первичному ключу."""
+
+    def __init__(self, path):
+        self.path = path
+        # Журнал используется из процессов пула и CLI: WAL и ожидание блокировки
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(SCHEMA)
+        # Журнал, созданный до появления владельцев: все его заказы подтверждены
+        columns = {row[1] for row in self.connection.execute("PRAGMA table_info(posted_orders)")}
+        if 'owner' not in columns:
+            self.connection.execute("ALTER TABLE posted_orders ADD COLUMN owner TEXT")
+        self.connection.execute(OWNER_INDEX)
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_orders (order_id TEXT PRIMARY KEY)")
+        self.connection.commit()
+
+    def posted(self, report_type, orders):
+        """Возвращает множество номеров из orders, уже проведенных в отчетах report_type."""
+        keys = pd.unique(order_keys(orders).dropna())
+        if not len(keys):
+            return set()
+        with self.connection:
+            self.connection.execute("DELETE FROM lookup_orders")
+            self.connection.executemany("INSERT OR IGNORE INTO lookup_orders VALUES (?)",
+                                        ((key,) for key in keys))
+            rows = self.connection.execute(
+                "SELECT l.order_id FROM lookup_orders l "
+                "JOIN posted_orders p ON p.report_type = ? AND p.order_id = l.order_id",
+                (report_type,)).fetchall()
+        return {row[0] for row in rows}
+
+    def claim(self, report_type, orders, source=None, owner=None):
+        """Занимает заказы до создания отчетов: проверка журнала и запись выполняются в одной
+        транзакции с блокировкой записи, поэтому параллельные задачи не проведут один заказ дважды.
+        :param owner: Задача, которой принадлежат заказы до confirm. Заказы, занятые ею раньше
+            (повтор после перезапуска или ошибки отправки), возвращаются ей снова.
+            Без owner заказы сразу считаются проведенными.
+        :return: Маска строк с заказами, которых не было в журнале (строки без номера считаются
+            новыми), и множество занятых этим вызовом номеров - для release при ошибке."""
+        keys = order_keys(orders)
+        unique = pd.unique(keys.dropna())
+        if not len(unique):
+            return ~keys.isin(()).to_numpy(), set()
+        posted_at = time.time()
+        self.connection.execute("BEGIN IMMEDIATE")
+        try:
+            self.connection.execute("DELETE FROM lookup_orders")
+            self.connection.executemany("INSERT OR IGNORE INTO lookup_orders VALUES (?)",
+                                        ((key,) for key in unique))
+            rows = self.connection.execute(
+                "SELECT l.order_id FROM lookup_orders l "
+                "JOIN posted_orders p ON p.report_type = ? AND p.order_id = l.order_id "
+                "WHERE p.owner IS NULL OR p.owner IS NOT ?",
+                (report_type, owner)).fetchall()
+            self.connection.execute(
+                "INSERT OR IGNORE INTO posted_orders (report_type, order_id, posted_at, source, owner) "
+                "SELECT ?, order_id, ?, ?, ? FROM lookup_orders", (report_type, posted_at, source, owner))
+            self.connection.commit()
+        except BaseException:
+            self.connection.rollback()
+            raise
+        posted = {row[0] for row in rows}
+        logging.info(f"В журнале заказов {report_type} занято {len(unique) - len(posted)} номеров")
+        return ~keys.isin(posted).to_numpy(), set(unique) - posted
+
+    def release(self, report_type, orders):
+        """Снимает отметку с заказов, занятых задачей, которая завершилась ошибкой."""
+        with self.connection:
+            self.connection.executemany("DELETE FROM posted_orders WHERE report_type = ? AND order_id = ?",
+                                        ((report_type, key) for key in orders))
+        logging.info(f"В журнале заказов {report_type} освобождено {len(orders)} номеров")
+
+    def confirm(self, owner):
+        """Подтверждает заказы, занятые задачей owner, после того как отчеты доставлены."""
+        with self.connection:
+            count = self.connection.execute("UPDATE posted_orders SET owner = NULL WHERE owner = ?",
+                                            (owner,)).rowcount
+        logging.info(f"В журнале заказов подтверждено {count} номеров задачи {owner}")
+
+    def release_owner(self, owner):
+        """Снимает отметку со всех неподтвержденных заказов задачи owner (отчеты не доставлены)."""
+        with self.connection:
+            count = self.connection.execute("DELETE FROM posted_orders WHERE owner = ?", (owner,)).rowcount
+        logging.info(f"В журнале заказов освобождено {count} номеров задачи {owner}")
+
+    def record(self, report_type, orders, source=None):
+        """Отмечает заказы как проведенные (повторные номера пропускаются)."""
+        keys = pd.unique(order_keys(orders).dropna())
+        posted_at = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR IGNORE INTO posted_orders (report_type, order_id, posted_at, source) VALUES (?, ?, ?, ?)",
+                ((report_type, key, posted_at, source) for key in keys))
+        logging.info(f"В журнал заказов {report_type} добавлено до {len(keys)} номеров")
+
+    def close(self):
+        self.connection.close()
+
+
+def get_ledger(path):
+    """Возвращает журнал заказов для пути, открывая соединение один раз на процесс."""
+    ledger = _ledgers.get(path)
+    if ledger is None:
+        ledger = _ledgers[path] = OrderLedger(path)
+    return ledger
@@ -0,0 +1,139 @@
+import csv
+import io
+import re
+import pandas as pd
+from config.settings import CSV_ENGINE
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:
+    pa = pa_csv = None
+
+# Написания заголовков, отличающиеся не только пробелами и регистром: вариант -> название колонки
+COLUMN_ALIASES = {
+    'additional fee': 'Additionall Fee',
+}
+
+# Типы колонок при выборочном чтении. Суммы не указываются явно: парсер сам читает их как числа
+# (int64 или float64), и значения печатаются так же, как при чтении всего файла
+COLUMN_DTYPES = {
+    'Payment Provider': 'category',
+    'Name': str,
+    'Order': str,
+    'Completed': str,
+    'Paid': str,
+    'Fiat': 'category',
+}
+
+# Значения, которые pandas считает пустыми: те же используются для pyarrow
+NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+
+def read_raw_header(source):
+    """Читает строку заголовков CSV без изменений.
+    :param source: Путь к файлу или файловый объект (позиция чтения сохраняется)."""
+    if hasattr(source, 'read'):
+        position = source.tell()
+        data = source.read(64 * 1024)
+        source.seek(position)
+        if isinstance(data, bytes):
+            data = data.decode('utf-8-sig', errors='replace')
+        elif data.startswith('\ufeff'):
+            data = data[1:]
+        # Заголовок может содержать переносы строк внутри кавычек, поэтому разбираем через csv
+        return next(csv.reader(io.StringIO(data)), [])
+    with open(source, encoding='utf-8-sig', errors='replace', newline='') as f:
+        return next(csv.reader(f), [])
+
+
+def read_header(source):
+    """Читает только строку заголовков CSV и возвращает очищенные названия колонок.
+    :param source: Путь к файлу или файловый объект."""
+    return [column.strip() for column in read_raw_header(source)]
+
+
+def column_key(name):
+    """Ключ для сравнения заголовков: без учета пробелов, переносов строк и регистра."""
+    return re.sub(r'\s+', ' ', name).strip().lower()
+
+
+def resolve_columns(header, columns):
+    """Сопоставляет нужным колонкам их написание в файле.
+    'Reseller\\nFee EUR', 'Reseller Fee EUR' и ' reseller  fee eur ' считаются одной колонкой.
+    :return: {заголовок в файле: название колонки} для найденных колонок."""
+    wanted = {column_key(column): column for column in columns}
+    for alias, column in COLUMN_ALIASES.items():
+        if column in columns:
+            wanted.setdefault(alias, column)
+    resolved = {}
+    for name in header:
+        column = wanted.get(column_key(name))
+        if column is not None and column not in resolved.values():
+            resolved[name] = column
+    return resolved
+
+
+def determine_report_type(columns):
+    """Определяет тип отчета по названиям колонок и проверяет валидность файла."""
+    columns = [column.strip() for column in columns]
+    if 'Reseller Fee EUR' in columns or 'Reseller\nFee EUR' in columns:
+        return 'completed'
+    elif 'Paid' in columns:
+        return 'payd'
+    else:
+        raise ValueError("Неверный формат файла. Проверьте колонки.")
+
+
+def use_pyarrow(engine=CSV_ENGINE):
+    """Проверяет, читать ли файл через pyarrow (быстрее pandas, если установлен)."""
+    if engine == 'pyarrow' and pa_csv is None:
+        raise ImportError("Для CSV_ENGINE=pyarrow нужен пакет pyarrow")
+    return engine == 'pyarrow' or (engine == 'auto' and pa_csv is not None)
+
+
+def read_pyarrow(source, resolved):
+    """Читает выбранные колонки через pyarrow.
+    В заголовках есть переносы строк внутри кавычек, поэтому нужен newlines_in_values."""
+    column_types = {}
+    for name, column in resolved.items():
+        dtype = COLUMN_DTYPES.get(column)
+        if dtype == 'category':
+            column_types[name] = pa.dictionary(pa.int32(), pa.string())
+        elif dtype is str:
+            # Без явного типа pyarrow превращает даты в timestamp
+            column_types[name] = pa.string()
+    table = pa_csv.read_csv(
+        source,
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+        convert_options=pa_csv.ConvertOptions(include_columns=list(resolved), column_types=column_types,
+                                              null_values=NA_VALUES, strings_can_be_null=True,
+                                              quoted_strings_can_be_null=True))
+    return table.to_pandas()
+
+
+def read_projected(source, columns, engine=CSV_ENGINE):
+    """Читает из CSV только нужные колонки с явными типами и приводит их названия к каноническим."""
+    resolved = resolve_columns(read_raw_header(source), columns)
+    if use_pyarrow(engine):
+        df = read_pyarrow(source, resolved)
+    else:
+        dtypes = {name: COLUMN_DTYPES[column] for name, column in resolved.items() if column in COLUMN_DTYPES}
+        df = pd.read_csv(source, encoding='utf-8-sig', usecols=list(resolved), dtype=dtypes)
+    # Колонки в порядке файла, с каноническими названиями
+    return df[list(resolved)].rename(columns=resolved)
+
+
+def load_report(source, columns=None):
+    """Загружает отчет в DataFrame с очищенными названиями колонок.
+    Если передан уже загруженный DataFrame, он возвращается без повторного чтения.
+    :param columns: Нужные колонки: читаются только они (с учетом вариантов написания заголовков),
+        остальные колонки выгрузки пропускаются."""
+    if isinstance(source, pd.DataFrame):
+        return source
+    if columns is not None:
+        return read_projected(source, columns)
+    df = pd.read_csv(source, encoding='utf-8-sig')
+    df.columns = df.columns.str.strip()
+    return df
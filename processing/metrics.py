@@ -0,0 +1,45 @@
+import time
+from contextlib import contextmanager
+
+# Файлы procfs для пиковой памяти текущего процесса (только Linux)
+CLEAR_REFS = '/proc/self/clear_refs'
+PROC_STATUS = '/proc/self/status'
+
+
+@contextmanager
+def timed(timings, stage):
+    """Добавляет время выполнения блока к timings[stage] (в секундах)."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - started
+
+
+def reset_peak_memory():
+    """Сбрасывает счетчик пиковой памяти процесса, чтобы измерять каждую задачу отдельно.
+    Процессы пула переиспользуются, поэтому без сброса пик был бы максимумом за все задачи.
+    :return: True, если сброс поддерживается."""
+    try:
+        with open(CLEAR_REFS, 'w') as handle:
+            handle.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def peak_memory_mb():
+    """Пиковая память процесса (VmHWM) в мегабайтах с момента последнего сброса."""
+    try:
+        with open(PROC_STATUS) as handle:
+            for line in handle:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # Без procfs - максимум за все время жизни процесса (на Linux в килобайтах)
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
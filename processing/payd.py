@@ -1,102 +1,57 @@
 import pandas as pd
-import os
 import logging
-from config.mappings import DEBIT_MAPPING_PAYD, CREDIT_MAPPING_PEYD
+from processing.loader import load_report
+from processing import templates
+from processing.rules import get_plan
+from processing.journal import write_journal
 
+JDT_TEMPLATE = templates.JDT_PAYD
+OJDT_TEMPLATE = templates.OJDT_PAYD
+
+# Колонки исходного файла, используемые при генерации отчетов
+INPUT_COLUMNS = ['Paid', 'Name', 'Order', 'Payment Provider', 'Fval EUR']
+
+# Правила проводок из config.mappings
+PLAN = get_plan('payd')
+
+# Колонка валюты транзакции читается, только если включены проводки в валюте
+if PLAN.currency_column:
+    INPUT_COLUMNS = INPUT_COLUMNS + [PLAN.currency_column]
+
+# В PAYD нет групп, нумеруемых после всех транзакций
+JDT_FEE_BLOCKS = PLAN.jdt_deferred_blocks
+OJDT_FEE_BLOCKS = PLAN.ojdt_deferred_blocks
+
+
+def check_template(template_path):
+    """Проверяет существование шаблона, загружая его в кэш."""
+    templates.load_template(template_path)
+
+
+def build_blocks(df, first_num=1, fee_first_num=None, date_format=None):
+    """Строит группы строк JDT и OJDT PAYD отчета по правилам POSTING_RULES['payd']:
+    сначала все дебетовые, затем все кредитовые записи.
+    :return: (список групп JDT, список групп OJDT)"""
+    return PLAN.build_blocks(df, first_num, fee_first_num, date_format)
+
+
+def build_journals(df):
+    """Строит JDT и OJDT PAYD отчета.
+    :return: (DataFrame строк JDT, DataFrame заголовков OJDT)"""
+    jdt_blocks, ojdt_blocks = build_blocks(df)
+    return pd.concat(jdt_blocks, ignore_index=True), pd.concat(ojdt_blocks, ignore_index=True)
 
-async def format_date(date_str):
-    """Преобразует дату в формат yyyymmdd.
-    Поддерживает несколько форматов ввода."""
-    try:
-        # Для формата dd/mm/yyyy
-        return pd.to_datetime(date_str, format='%d/%m/%Y').strftime('%Y%m%d')
-    except:
-        try:
-            # Для других форматов с явным указанием dayfirst=True
-            return pd.to_datetime(date_str, dayfirst=True).strftime('%Y%m%d')
-        except:
-            return date_str
 
 async def process_jdt(input_file, output_file):
     """Обрабатывает PAYD файл и создает JDT отчет."""
     try:
-        logging.info(f"Начинаем обработку JDT отчета из файла {input_file}")
-
-
-        # Читаем исходный файл
-        df = pd.read_csv(input_file, encoding='utf-8-sig')
-
-        # Очищаем названия колонок от лишних пробелов
-        df.columns = df.columns.str.strip()
-
-        # Проверяем существование шаблона
-        template_path = 'templates/jdt_template.csv'
-        if not os.path.exists(template_path):
-            raise FileNotFoundError(f"Шаблон не найден: {template_path}")
-
-        # Читаем шаблон и сохраняем только первую строку
-        template_df = pd.read_csv(template_path, nrows=1)
-
-        # Создаем пустой список для строк результата
-        debit_rows = []
-        credit_rows = []
-
-        # Создаем debit строки с их нумерацией
-        for index, row in df.iterrows():
-            # Форматируем дату
-            formatted_date = await format_date(row['Paid'])
-
-            # Дебетовая запись
-            debit_row = {
-                'ParentKey': index + 1,
-                'JdtNum': index + 1,
-                'LineNum': '',
-                'Debit': row['Fval EUR'],
-                'Credit': '',
-                'DueDate': formatted_date,
-                'ShortName': DEBIT_MAPPING_PAYD.get(row['Payment Provider'], row['Payment Provider']),
-                'ReferenceDate1': formatted_date,
-                'Reference1': row['Name'],
-                'Reference2': row['Order'],
-                'TaxDate': formatted_date
-            }
-            debit_rows.append(debit_row)
-
-            # Кредитовая запись
-            credit_row = {
-                'ParentKey': index + 1,
-                'JdtNum': index + 1,
-                'LineNum': '1',
-                'Debit': '',
-                'Credit': row['Fval EUR'],
-                'DueDate': formatted_date,
-                'ShortName': CREDIT_MAPPING_PEYD.get(row['Payment Provider'], row['Payment Provider']),
-                'ReferenceDate1': formatted_date,
-                'Reference1': row['Name'],
-                'Reference2': row['Order'],
-                'TaxDate': formatted_date
-            }
-            credit_rows.append(credit_row)
-
-        # Объединяем списки
-        result_rows = debit_rows + credit_rows
-
-        # Создаем DataFrame из результата
-        result_df = pd.DataFrame(result_rows)
-
-        # Создаем пустой DataFrame с колонками из шаблона
-        final_df = pd.DataFrame(columns=template_df.columns)
-
-        # Копируем данные
-        for col in result_df.columns:
-            if col in final_df.columns:
-                final_df[col] = result_df[col]
-
-        # Объединяем заголовки и данные
-        final_df = pd.concat([template_df, final_df], ignore_index=True)
-
-        # Сохраняем результат
-        final_df.to_csv(output_file, index=False)
+        # Загружаем исходные данные (путь к файлу или уже прочитанный DataFrame)
+        df = load_report(input_file, INPUT_COLUMNS)
+        logging.info(f"Начинаем обработку JDT отчета ({len(df)} строк)")
+
+        check_template(JDT_TEMPLATE)
+        jdt_df, _ = build_journals(df)
+        write_journal(jdt_df, JDT_TEMPLATE, output_file)
         logging.info(f"JDT отчет успешно сохранен в {output_file}")
 
         return output_file
@@ -109,51 +64,40 @@ async def process_ojdt(input_file, output_file):
     Обрабатывает PAYD файл и создает OJDT отчет.
     """
     try:
-        logging.info(f"Начинаем обработку OJDT отчета из файла {input_file}")
-
-        # Читаем исходный файл
-        df = pd.read_csv(input_file)
-        logging.info(f"Прочитан файл с {len(df)} строками")
-
-        # Очищаем названия колонок от лишних пробелов
-        df.columns = df.columns.str.strip()
-
-        # Проверяем существование шаблона
-        template_path = 'templates/ojdt_template.csv'
-        if not os.path.exists(template_path):
-            raise FileNotFoundError(f"Шаблон не найден: {template_path}")
+        # Загружаем исходные данные (путь к файлу или уже прочитанный DataFrame)
+        df = load_report(input_file, INPUT_COLUMNS)
+        logging.info(f"Начинаем обработку OJDT отчета ({len(df)} строк)")
 
-        # Читаем шаблон и сохраняем только первую строку
-        template_df = pd.read_csv(template_path, nrows=1)
-
-        # Создаем список для строк результата
-        result_rows = []
-
-        # Проходим по всем строкам исходного файла
-        for index, row in df.iterrows():
-            formatted_date = await format_date(row['Paid'])
-
-            ojdt_row = {
-                'JdtNum': index + 1,
-                'ReferenceDate': formatted_date,
-                'Reference': row['Name'],
-                'Reference2': row['Order'],
-                'TaxDate': formatted_date,
-                'DueDate': formatted_date
-            }
-            result_rows.append(ojdt_row)
-
-        # Создаем DataFrame с данными
-        data_df = pd.DataFrame(result_rows, columns=template_df.columns)
-
-        # Объединяем заголовки и данные
-        final_df = pd.concat([template_df, data_df], ignore_index=True)
-
-        # Сохраняем результат
-        final_df.to_csv(output_file, index=False)
+        check_template(OJDT_TEMPLATE)
+        _, ojdt_df = build_journals(df)
+        write_journal(ojdt_df, OJDT_TEMPLATE, output_file)
         logging.info(f"OJDT отчет успешно сохранен в {output_file}")
 
         return output_file
     except Exception as e:
         logging.error(f"Ошибка при обработке OJDT отчета: {e}", exc_info=True)
-        raise
\ No newline at end of file
+        raise
+
+def write_reports(input_file, jdt_output, ojdt_output):
+    """Синхронно создает JDT и OJDT PAYD отчета за один проход по исходным данным.
+    Используется как в event loop, так и в процессах пула обработки.
+    :return: Количество обработанных строк."""
+    try:
+        df = load_report(input_file, INPUT_COLUMNS)
+        logging.info(f"Начинаем обработку JDT и OJDT отчетов ({len(df)} строк)")
+
+        check_template(JDT_TEMPLATE)
+        check_template(OJDT_TEMPLATE)
+        jdt_df, ojdt_df = build_journals(df)
+        write_journal(jdt_df, JDT_TEMPLATE, jdt_output)
+        write_journal(ojdt_df, OJDT_TEMPLATE, ojdt_output)
+        logging.info(f"JDT и OJDT отчеты успешно сохранены в {jdt_output}, {ojdt_output}")
+
+        return len(df)
+    except Exception as e:
+        logging.error(f"Ошибка при обработке PAYD отчетов: {e}", exc_info=True)
+        raise
+
+async def process_reports(input_file, jdt_output, ojdt_output):
+    """Создает JDT и OJDT PAYD отчета за один проход по исходным данным."""
+    return write_reports(input_file, jdt_output, ojdt_output)
@@ -1,6 +1,7 @@
 import os
 import pandas as pd
 from abc import ABC, abstractmethod
+from processing.dates import DATE_FORMATS, normalize_dates
 
 class BaseProcessor(ABC):
     """ Базовый класс для обработки отчетов.
@@ -52,17 +53,9 @@ class BaseProcessor(ABC):
         :param date_str: Строка с датой.
         :param formats: Список форматов для попытки преобразования.
         :return: Дата в формате yyyymmdd или исходная строка, если преобразование не удалось. """
-        if formats is None:
-            formats = ['%d/%m/%Y', '%d/%m/%Y %H:%M:%S']
-
-        for fmt in formats:
-            try:
-                return pd.to_datetime(date_str, format=fmt).strftime('%Y%m%d')
-            except:
-                continue
-
-        # Если преобразование не удалось, возвращаем исходную строку
-        return date_str
+        formats = formats or DATE_FORMATS
+        dates, _ = normalize_dates([date_str], formats=formats)
+        return dates[0]
 
     async def clean_temp_files(self, files):
         """ Удаляет временные файлы.:param files: Список путей к файлам для удаления. """
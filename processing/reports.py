@@ -0,0 +1,8 @@
+from processing import completed, payd
+
+# Модули генерации по типу отчета: колонки файла, шаблоны, правила проводок и write_reports.
+# Новый тип отчета добавляется только здесь и в config.mappings.POSTING_RULES
+REPORT_MODULES = {
+    'completed': completed,
+    'payd': payd,
+}
@@ -0,0 +1,163 @@
+import json
+import numpy as np
+import pandas as pd
+from config import mappings
+from processing.dates import normalize_dates
+from processing.journal import map_accounts, build_block, build_header_block
+from processing.fx import lookup_rates, foreign_amounts
+from config.settings import FX_ENABLED
+
+# Колонка провайдера для счетов по таблице (mapping), если в правиле не указана другая
+PROVIDER_COLUMN = 'Payment Provider'
+
+_plans = {}
+
+
+def nonzero_mask(values):
+    """Маска строк с заполненным и ненулевым значением."""
+    present = values.notna()
+    return (present & (pd.to_numeric(values.where(present)) != 0)).to_numpy()
+
+
+def compile_condition(spec):
+    """Условие отбора строк набора проводок: функция df -> маска строк (None - все строки)."""
+    if spec is None:
+        return None
+    if 'nonzero' in spec:
+        column = spec['nonzero']
+        return lambda df: nonzero_mask(df[column]) if len(df) else np.zeros(0, dtype=bool)
+    raise ValueError(f"Неизвестное условие в правилах проводок: {spec}")
+
+
+def special_account(key):
+    try:
+        return mappings.SPECIAL_MAPPINGS[key]
+    except KeyError:
+        raise ValueError(f"Нет счета '{key}' в SPECIAL_MAPPINGS") from None
+
+
+def compile_account(spec):
+    """Счет ShortName: функция df -> счет для всех строк (str) или массив счетов по строкам.
+    :return: (функция, имя таблицы счетов по провайдеру или None)"""
+    if 'special' in spec:
+        account = special_account(spec['special'])
+        return (lambda df: account), None
+    if 'mapping' in spec:
+        table = getattr(mappings, spec['mapping'], None)
+        if not isinstance(table, dict):
+            raise ValueError(f"Нет таблицы счетов '{spec['mapping']}' в config.mappings")
+        column = spec.get('column', PROVIDER_COLUMN)
+        return (lambda df: map_accounts(df[column], table)), spec['mapping']
+    if 'if' in spec:
+        (column, value), = spec['if'].items()
+        then, otherwise = special_account(spec['then']), special_account(spec['else'])
+        return (lambda df: np.where(df[column].to_numpy(dtype=object) == value, then, otherwise).astype(object)), None
+    raise ValueError(f"Неизвестное описание счета в правилах проводок: {spec}")
+
+
+class PostingPlan:
+    """Правила проводок одного типа отчета, подготовленные для выполнения по колонкам целиком.
+    Маски наборов, даты и счета считаются один раз на весь DataFrame и общие для всех строк,
+    которые их используют (например, счет по провайдеру для транзакции и для Additional Fee)."""
+
+    def __init__(self, rules):
+        self.date_column = rules['date']
+        self.dayfirst_fallback = rules.get('dayfirst_fallback', False)
+        # Колонка валюты транзакции: по ней заполняются FC-колонки, если включены проводки в валюте
+        self.currency_column = rules.get('currency') if FX_ENABLED else None
+        entries = rules['entries']
+        if not entries:
+            raise ValueError("В правилах проводок нет ни одного набора")
+        # Потоковая обработка сдвигает все отложенные записи на одно и то же число,
+        # поэтому после транзакций нумеруется только один набор
+        if len(entries) > 2:
+            raise ValueError("После транзакций может нумероваться только один набор проводок")
+        self.entries = [(entry['name'], compile_condition(entry.get('when'))) for entry in entries]
+        names = [name for name, _ in self.entries]
+
+        # Одинаковые описания счетов выполняются один раз
+        accounts, self.mappings = {}, []
+        self.lines = []
+        for line in rules['lines']:
+            if line['entry'] not in names:
+                raise ValueError(f"Неизвестный набор проводок '{line['entry']}' в правилах")
+            if ('debit' in line) == ('credit' in line):
+                raise ValueError(f"В строке проводки должна быть ровно одна из колонок debit/credit: {line}")
+            key = json.dumps(line['account'], sort_keys=True)
+            if key not in accounts:
+                accounts[key], mapping = compile_account(line['account'])
+                if mapping is not None and mapping not in self.mappings:
+                    self.mappings.append(mapping)
+            self.lines.append((names.index(line['entry']), line['line'], line.get('debit'), line.get('credit'),
+                               accounts[key]))
+
+        # Потоковая обработка перенумеровывает последние группы отчета
+        order = [entry for entry, *_ in self.lines]
+        if order != sorted(order):
+            raise ValueError("Строки набора, нумеруемого после транзакций, должны идти в конце правил")
+
+        # Сколько последних групп JDT и OJDT нумеруется после всех транзакций
+        self.jdt_deferred_blocks = sum(1 for entry, *_ in self.lines if entry > 0)
+        self.ojdt_deferred_blocks = len(self.entries) - 1
+
+    def build_blocks(self, df, first_num=1, fee_first_num=None, date_format=None):
+        """Строит группы строк JDT и OJDT по правилам.
+        :param first_num: JdtNum первой транзакции.
+        :param fee_first_num: JdtNum первой записи набора, нумеруемого после транзакций
+            (по умолчанию - сразу после транзакций).
+        :param date_format: Заранее известный формат колонки дат.
+        :return: (список групп JDT, список групп OJDT)"""
+        dates, _ = normalize_dates(df[self.date_column], dayfirst_fallback=self.dayfirst_fallback,
+                                   date_format=date_format)
+        names = df['Name'].to_numpy(dtype=object)
+        orders = df['Order'].to_numpy(dtype=object)
+        # Курсы ищутся один раз на все строки и общие для всех строк проводки
+        rates = lookup_rates(dates, df[self.currency_column]) if self.currency_column else None
+
+        # Строки и нумерация наборов: первый - по строкам файла, следующий - после всех транзакций
+        selections = []
+        for index, (_, condition) in enumerate(self.entries):
+            mask = condition(df) if condition is not None else None
+            count = len(df) if mask is None else int(mask.sum())
+            if index == 0:
+                start = first_num
+            else:
+                start = fee_first_num if fee_first_num is not None else first_num + len(df)
+            selections.append((mask, np.arange(start, start + count)))
+
+        def select(values, mask):
+            return values if mask is None else values[mask]
+
+        resolved = {}
+        jdt_blocks = []
+        for entry, line_num, debit, credit, account in self.lines:
+            mask, jdt_num = selections[entry]
+            if account not in resolved:
+                resolved[account] = account(df)
+            short_name = resolved[account]
+            if not isinstance(short_name, str):
+                short_name = select(short_name, mask)
+            amounts = df[debit or credit].to_numpy(dtype=object)
+            amounts = select(amounts, mask)
+            foreign = None
+            if rates is not None:
+                line_rates, currencies = rates
+                foreign = (foreign_amounts(amounts, select(line_rates, mask)), select(currencies, mask))
+            jdt_blocks.append(build_block(jdt_num, line_num,
+                                          amounts if debit else None, amounts if credit else None,
+                                          short_name, select(dates, mask), select(names, mask), select(orders, mask),
+                                          foreign))
+        ojdt_blocks = [build_header_block(jdt_num, select(dates, mask), select(names, mask), select(orders, mask))
+                       for mask, jdt_num in selections]
+        return jdt_blocks, ojdt_blocks
+
+
+def get_plan(report_type):
+    """Возвращает подготовленные правила проводок для типа отчета (один раз на процесс)."""
+    plan = _plans.get(report_type)
+    if plan is None:
+        rules = mappings.POSTING_RULES.get(report_type)
+        if rules is None:
+            raise ValueError(f"Нет правил проводок для типа отчета: {report_type}")
+        plan = _plans[report_type] = PostingPlan(rules)
+    return plan
@@ -0,0 +1,227 @@
+import asyncio
+import io
+import os
+import logging
+import multiprocessing
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from processing.loader import load_report, read_raw_header, determine_report_type
+from processing.reports import REPORT_MODULES
+from processing.batch import read_batch_file, merge_frames
+from processing.metrics import timed, reset_peak_memory, peak_memory_mb
+from processing.ledger import get_ledger, order_keys
+from processing.validation import validate, check_header, write_rejects, attach_sources
+from processing.streaming import stream_reports
+from processing.summary import SummaryBuilder
+from processing.templates import preload_templates
+from config.settings import (WORKER_PROCESSES, MAX_CONCURRENT_JOBS, STREAMING_THRESHOLD_BYTES,
+                             LEDGER_ENABLED, LEDGER_PATH, INCREMENTAL_MODE, VALIDATION_ENABLED, JOURNAL_MODE)
+
+_executor = None
+_slots = None
+_waiting = 0
+
+
+def convert_file(report_type, input_file, jdt_output, ojdt_output, streaming=False, incremental=INCREMENTAL_MODE,
+                 rejects_output=None, summary_outputs=None, sources=None, owner=None):
+    """Создает JDT и OJDT отчеты для файла указанного типа. Выполняется в процессе пула.
+    Строки, которые нельзя провести, отделяются до генерации (если проверка включена).
+    Заказы из созданных отчетов записываются в журнал заказов (если он включен); в инкрементальном
+    режиме они занимаются в журнале до генерации и освобождаются, если отчеты создать не удалось.
+    :param streaming: Читать файл по частям с постоянным расходом памяти.
+    :param incremental: Создавать проводки только по заказам, которых еще нет в журнале.
+    :param rejects_output: Путь или файловый объект для отклоненных строк; файл создается,
+        только если такие строки есть.
+    :param summary_outputs: Пара путей или файловых объектов (JDT, OJDT) для сводного журнала
+        по дате и Payment Provider; детальные отчеты создаются как обычно.
+    :param sources: Список пар (имя файла, число строк) для объединенных файлов пакета: в файле
+        отклоненных строк указываются исходный файл и номер строки в нем.
+    :param owner: Задача бота, за которой заказы остаются до подтверждения доставки отчетов
+        (OrderLedger.confirm); без owner занятые заказы сразу считаются проведенными.
+    :return: Статистика задачи: rows, skipped (пропущено проведенных строк), rejected (отклонено строк),
+        entries (проводок в сводном журнале), время этапов parse и generate (сек), peak_memory_mb."""
+    module = REPORT_MODULES.get(report_type)
+    if module is None:
+        raise ValueError(f"Неизвестный тип отчета: {report_type}")
+    reset_peak_memory()
+    timings = {}
+    ledger = get_ledger(LEDGER_PATH) if LEDGER_ENABLED or incremental else None
+    source = input_file if isinstance(input_file, str) else None
+    posted, claimed, skipped = [], set(), 0
+    rejects, seen = [], 0
+    summary = SummaryBuilder(module.PLAN) if summary_outputs is not None else None
+
+    def select_rows(df, date_format=None):
+        # Проверка строк и журнала - по колонкам целиком, а не по каждой строке
+        nonlocal skipped, seen
+        if VALIDATION_ENABLED:
+            # Номера строк считаются до отбора по журналу - как в исходном файле
+            first_row, seen = seen + 1, seen + len(df)
+            df, rejected = validate(report_type, df, first_row, date_format)
+            if len(rejected):
+                rejects.append(rejected)
+        if incremental:
+            # Заказы занимаются сразу: параллельная задача с тем же заказом его пропустит
+            mask, new = ledger.claim(report_type, df['Order'], source=source, owner=owner)
+            # Номера, занятые предыдущими частями этого же файла, остаются в отчетах
+            mask |= order_keys(df['Order']).isin(claimed).to_numpy()
+            claimed.update(new)
+            skipped += int((~mask).sum())
+            df = df[mask].reset_index(drop=True)
+        elif ledger is not None:
+            posted.append(df['Order'])
+        return df
+
+    try:
+        if streaming:
+            # Чтение и генерация чередуются по частям: чтение считается внутри stream_reports
+            with timed(timings, 'total'):
+                rows = stream_reports(report_type, input_file, jdt_output, ojdt_output, timings=timings,
+                                      row_filter=select_rows, summary=summary)
+            timings['generate'] = timings.pop('total') - timings.get('parse', 0.0)
+        else:
+            with timed(timings, 'parse'):
+                df = select_rows(load_report(input_file, module.INPUT_COLUMNS))
+            with timed(timings, 'generate'):
+                rows = module.write_reports(df, jdt_output, ojdt_output)
+                if summary is not None:
+                    summary.add(df)
+        entries = 0
+        if summary is not None:
+            with timed(timings, 'generate'):
+                entries = summary.write(module.JDT_TEMPLATE, module.OJDT_TEMPLATE, *summary_outputs)
+
+        rejected = sum(len(part) for part in rejects)
+        if rejected and rejects_output is not None:
+            rejected_rows = pd.concat(rejects, ignore_index=True)
+            if sources:
+                rejected_rows = attach_sources(rejected_rows, sources)
+            write_rejects(rejected_rows, rejects_output)
+        elif isinstance(rejects_output, str) and os.path.exists(rejects_output):
+            # Файл от предыдущего запуска больше не соответствует отчетам
+            os.remove(rejects_output)
+    except BaseException:
+        # Отчеты не созданы: занятые заказы должны попасть в следующий запуск
+        if claimed:
+            ledger.release(report_type, claimed)
+        raise
+
+    # Без инкрементального режима заказы отмечаются проведенными после создания отчетов
+    if posted:
+        ledger.record(report_type, pd.concat(posted, ignore_index=True), source=source)
+    return {'rows': rows, 'skipped': skipped, 'rejected': rejected, 'entries': entries, **timings,
+            'peak_memory_mb': peak_memory_mb()}
+
+
+def convert_path(input_file, jdt_output, ojdt_output, streaming_threshold=STREAMING_THRESHOLD_BYTES,
+                 incremental=INCREMENTAL_MODE, rejects_output=None, summary_outputs=None):
+    """Определяет тип файла по заголовкам и создает JDT и OJDT отчеты.
+    Файлы больше streaming_threshold обрабатываются потоково.
+    :return: Статистика задачи (см. convert_file) с типом отчета и размером файла."""
+    header = read_raw_header(input_file)
+    report_type = determine_report_type(header)
+    if VALIDATION_ENABLED:
+        check_header(report_type, header)
+    size = os.path.getsize(input_file)
+    stats = convert_file(report_type, input_file, jdt_output, ojdt_output,
+                         streaming=size > streaming_threshold, incremental=incremental, rejects_output=rejects_output,
+                         summary_outputs=summary_outputs)
+    return {'report_type': report_type, 'input_bytes': size, **stats}
+
+
+def convert_buffer(report_type, data, summary=False, sources=None, owner=None):
+    """Создает JDT и OJDT отчеты из содержимого файла без обращения к диску.
+    :param data: Содержимое исходного CSV файла (bytes) или уже прочитанный DataFrame.
+    :param summary: Создать также сводный журнал по дате и Payment Provider.
+    :param sources: Файлы пакета, объединенные в data (см. convert_file).
+    :param owner: Задача, за которой занимаются заказы (см. convert_file).
+    :return: (статистика задачи, содержимое JDT, содержимое OJDT, содержимое файла
+        отклоненных строк - пустое, если таких строк нет, пара содержимого сводных JDT и OJDT или None)"""
+    jdt_output, ojdt_output, rejects_output = io.BytesIO(), io.BytesIO(), io.BytesIO()
+    summary_outputs = (io.BytesIO(), io.BytesIO()) if summary else None
+    source = data if isinstance(data, pd.DataFrame) else io.BytesIO(data)
+    stats = convert_file(report_type, source, jdt_output, ojdt_output, rejects_output=rejects_output,
+                         summary_outputs=summary_outputs, sources=sources, owner=owner)
+    summary_files = tuple(output.getvalue() for output in summary_outputs) if summary else None
+    return stats, jdt_output.getvalue(), ojdt_output.getvalue(), rejects_output.getvalue(), summary_files
+
+
+def get_executor():
+    """Возвращает пул процессов, создавая его при первом обращении."""
+    global _executor
+    if _executor is None:
+        # spawn не копирует состояние event loop и потоков aiogram в дочерние процессы
+        _executor = ProcessPoolExecutor(max_workers=WORKER_PROCESSES,
+                                        mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=preload_templates)
+        logging.info(f"Запущен пул обработки: {WORKER_PROCESSES} процессов, {MAX_CONCURRENT_JOBS} задач одновременно")
+    return _executor
+
+
+def _get_slots():
+    global _slots
+    if _slots is None:
+        _slots = asyncio.Semaphore(MAX_CONCURRENT_JOBS)
+    return _slots
+
+
+def queued_jobs():
+    """Количество задач, ожидающих свободного места в пуле."""
+    return _waiting
+
+
+def is_busy():
+    """Проверяет, заняты ли все места для одновременной обработки."""
+    return _get_slots().locked()
+
+
+async def run_in_pool(func, *args):
+    """Выполняет функцию в пуле процессов, не блокируя event loop.
+    Если все места заняты, задача ждет своей очереди."""
+    global _waiting
+    loop = asyncio.get_running_loop()
+    _waiting += 1
+    try:
+        await _get_slots().acquire()
+    finally:
+        _waiting -= 1
+    try:
+        return await loop.run_in_executor(get_executor(), func, *args)
+    finally:
+        _get_slots().release()
+
+
+async def run_conversion(report_type, input_file, jdt_output, ojdt_output, streaming=False, rejects_output=None,
+                         summary_outputs=None, owner=None):
+    """Создает отчеты по файлам на диске в пуле процессов.
+    :return: Статистика задачи (см. convert_file)."""
+    return await run_in_pool(convert_file, report_type, input_file, jdt_output, ojdt_output, streaming,
+                             INCREMENTAL_MODE, rejects_output, summary_outputs, None, owner)
+
+
+async def run_buffer_conversion(report_type, data, summary=JOURNAL_MODE == 'summary', owner=None):
+    """Создает отчеты из содержимого файла в памяти в пуле процессов.
+    :return: (статистика задачи, содержимое JDT, содержимое OJDT, содержимое файла отклоненных строк,
+        содержимое сводных JDT и OJDT или None)"""
+    return await run_in_pool(convert_buffer, report_type, data, summary, None, owner)
+
+
+async def run_batch_conversion(report_type, files, summary=JOURNAL_MODE == 'summary', owner=None):
+    """Создает общие JDT и OJDT отчеты по нескольким файлам одного типа.
+    Файлы читаются параллельно в пуле процессов, затем объединяются,
+    и отчеты генерируются один раз со сквозной нумерацией.
+    Отклоненные строки указываются с именем исходного файла и номером строки в нем.
+    :param files: Список пар (имя файла, содержимое исходного CSV файла bytes).
+    :return: (статистика задачи, содержимое JDT, содержимое OJDT, содержимое файла отклоненных строк,
+        содержимое сводных JDT и OJDT или None)"""
+    frames = await asyncio.gather(*(run_in_pool(read_batch_file, report_type, data) for _, data in files))
+    sources = [(name, len(frame)) for (name, _), frame in zip(files, frames)]
+    return await run_in_pool(convert_buffer, report_type, merge_frames(frames), summary, sources, owner)
+
+
+def shutdown():
+    """Останавливает пул процессов."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
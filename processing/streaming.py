@@ -0,0 +1,140 @@
+import os
+import shutil
+import logging
+import tempfile
+import pandas as pd
+from processing.reports import REPORT_MODULES
+from processing.dates import FormatDetector
+from processing.loader import COLUMN_DTYPES, read_raw_header, resolve_columns
+from processing.templates import load_template
+from processing.journal import write_header, write_rows
+from processing.metrics import timed
+from config.settings import STREAM_CHUNK_ROWS
+
+# Суммы получают тип, который pandas вывел бы по всему файлу (int64 или float64): вывод типов
+# по отдельной части не должен менять форматирование значений (10 и 10.0).
+# Текстовые колонки читаются с типами из COLUMN_DTYPES
+AMOUNT_COLUMNS = ['Total Fee EUR', 'Reseller\nFee EUR', 'Net\nFee EUR', 'Additionall Fee', 'Fval EUR']
+
+
+def read_chunks(input_file, chunksize, columns):
+    """Читает из исходного файла по частям только нужные колонки с каноническими названиями."""
+    resolved = resolve_columns(read_raw_header(input_file), columns)
+    dtypes = {name: COLUMN_DTYPES[column] for name, column in resolved.items() if column in COLUMN_DTYPES}
+    reader = pd.read_csv(input_file, encoding='utf-8-sig', chunksize=chunksize, usecols=list(resolved), dtype=dtypes)
+    for chunk in reader:
+        yield chunk[list(resolved)].rename(columns=resolved).reset_index(drop=True)
+
+
+def is_integral(values):
+    """Выведет ли pandas для всей колонки целый тип: значения без пропусков и дробной части.
+    Для текстовой колонки (часть значений не числа) - тип после проверки строк, где такие строки
+    отклоняются, а остальные снова становятся числами."""
+    if pd.api.types.is_integer_dtype(values):
+        return True
+    if pd.api.types.is_float_dtype(values):
+        return False
+    numbers = pd.to_numeric(values, errors='coerce')
+    return not values.isna().any() and bool((numbers.dropna() % 1 == 0).all())
+
+
+def scan_file(input_file, date_column, columns, chunksize):
+    """Просматривает колонку дат и суммы всего файла до генерации.
+    Формат дат по одной части определять нельзя: начало отсортированной по дате выгрузки подходит
+    и к D/M, и к M/D. Тип сумм по одной части тоже может отличаться от типа при чтении всего файла.
+    :return: (формат колонки дат, {колонка суммы: 'int64' или 'float64'})"""
+    amounts = [column for column in AMOUNT_COLUMNS if column in columns]
+    detector = FormatDetector()
+    integral = dict.fromkeys(amounts, True)
+    for chunk in read_chunks(input_file, chunksize, [date_column] + amounts):
+        detector.add(chunk[date_column])
+        for column in amounts:
+            integral[column] = integral[column] and is_integral(chunk[column])
+    return detector.result(), {column: 'int64' if whole else 'float64' for column, whole in integral.items()}
+
+
+def cast_amounts(chunk, dtypes):
+    """Приводит числовые суммы части к типам всего файла."""
+    for column, dtype in dtypes.items():
+        if column in chunk.columns and pd.api.types.is_numeric_dtype(chunk[column]) and chunk[column].dtype != dtype:
+            chunk[column] = chunk[column].astype(dtype)
+    return chunk
+
+
+def renumber(spool, offset, handle, chunksize):
+    """Переносит строки из буфера в выходной файл, сдвигая номер в первой колонке на offset."""
+    spool.seek(0)
+    if not spool.read(1):
+        return
+    spool.seek(0)
+    # Текст читается без преобразования типов, поэтому значения переносятся без изменений
+    for chunk in pd.read_csv(spool, header=None, dtype=str, keep_default_na=False, chunksize=chunksize):
+        chunk[0] = (chunk[0].astype(int) + offset).astype(str)
+        chunk.to_csv(handle, index=False, header=False)
+
+
+def stream_reports(report_type, input_file, jdt_output, ojdt_output, chunksize=STREAM_CHUNK_ROWS, timings=None,
+                   row_filter=None, summary=None):
+    """Создает JDT и OJDT отчеты, читая исходный файл по частям.
+    Память не зависит от размера файла: каждая группа строк пишется в свой временный буфер
+    на диске, и в конце буферы склеиваются в исходном порядке групп. Записи Additional Fee
+    нумеруются от 1 и получают итоговые номера (после последней транзакции) при склейке.
+    :param timings: Словарь, в который добавляется время чтения исходного файла (parse).
+    :param row_filter: Функция (часть, формат дат), отбирающая строки каждой части перед генерацией.
+    :param summary: SummaryBuilder, в который добавляются итоги каждой части для сводного журнала.
+    :return: Количество обработанных строк."""
+    module = REPORT_MODULES[report_type]
+    date_column = module.PLAN.date_column
+    spool_dir = os.path.dirname(os.path.abspath(jdt_output))
+    outputs = [
+        (load_template(module.JDT_TEMPLATE), module.JDT_FEE_BLOCKS, jdt_output),
+        (load_template(module.OJDT_TEMPLATE), module.OJDT_FEE_BLOCKS, ojdt_output),
+    ]
+    spools = [[], []]
+
+    total_rows, fee_rows = 0, 0
+    timings = {} if timings is None else timings
+    # Формат дат и типы сумм определяются по всему файлу и используются для всех частей
+    with timed(timings, 'parse'):
+        date_format, amount_dtypes = scan_file(input_file, date_column, module.INPUT_COLUMNS, chunksize)
+    chunks = read_chunks(input_file, chunksize, module.INPUT_COLUMNS)
+    try:
+        while True:
+            with timed(timings, 'parse'):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            if row_filter is not None:
+                chunk = row_filter(chunk, date_format)
+            chunk = cast_amounts(chunk, amount_dtypes)
+            if summary is not None:
+                summary.add(chunk, date_format)
+            journals = module.build_blocks(chunk, first_num=total_rows + 1,
+                                           fee_first_num=fee_rows + 1, date_format=date_format)
+            for (template, _, _), blocks, block_spools in zip(outputs, journals, spools):
+                if not block_spools:
+                    block_spools.extend(tempfile.TemporaryFile('w+', encoding='utf-8', newline='', dir=spool_dir)
+                                        for _ in blocks)
+                for block, spool in zip(blocks, block_spools):
+                    if len(block):
+                        write_rows(block, template, spool)
+            total_rows += len(chunk)
+            if module.OJDT_FEE_BLOCKS:
+                # Каждой записи Additional Fee соответствует один заголовок OJDT
+                fee_rows += len(journals[1][-1])
+            logging.info(f"Потоковая обработка: обработано {total_rows} строк")
+
+        # Склеиваем группы в исходном порядке
+        for (template, fee_blocks, output_file), block_spools in zip(outputs, spools):
+            with open(output_file, 'w', encoding='utf-8', newline='') as handle:
+                write_header(template, handle)
+                for index, spool in enumerate(block_spools):
+                    if index >= len(block_spools) - fee_blocks:
+                        renumber(spool, total_rows, handle, chunksize)
+                    else:
+                        spool.seek(0)
+                        shutil.copyfileobj(spool, handle)
+    finally:
+        for spool in spools[0] + spools[1]:
+            spool.close()
+    return total_rows
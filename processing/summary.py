@@ -0,0 +1,198 @@
+import logging
+import numpy as np
+import pandas as pd
+from processing.dates import normalize_dates
+from processing.journal import write_journal
+from config.settings import BALANCE_TOLERANCE, ROUNDING_ACCOUNT
+
+# Ключи группировки сводного журнала
+GROUP_KEYS = ['date', 'provider']
+
+# Максимальная длина LineMemo и Memo в SAP
+MEMO_LIMIT = 50
+
+
+def check_rounding_account():
+    """Проверяет, что задан счет разницы округления (ROUNDING_ACCOUNT).
+    Счета по умолчанию нет: он должен существовать в плане счетов SAP."""
+    if not ROUNDING_ACCOUNT:
+        raise ValueError("Не задан счет разницы округления ROUNDING_ACCOUNT: "
+                         "без него сводный журнал не строится")
+
+
+def format_memo(count, first_order, last_order):
+    """Описание группы: число заказов и диапазон номеров."""
+    orders = first_order if first_order == last_order else f"{first_order} - {last_order}"
+    return f"Orders: {count} ({orders})"[:MEMO_LIMIT]
+
+
+class SummaryBuilder:
+    """Сводный журнал: одна проводка на дату и Payment Provider.
+    Итоги считаются group-by по частям файла (add) и складываются при записи (write),
+    поэтому сводный журнал строится и при потоковой обработке.
+    Строки проводки - те же строки правил проводок (PostingPlan), суммы по группе.
+    В каждом наборе проводок разница дебета и кредита (округление Reseller/Net Fee
+    до десятых в выгрузке) проводится отдельной строкой на счет ROUNDING_ACCOUNT,
+    суммы строк правил проводок не меняются.
+    FC-колонки не заполняются: в одной группе бывают транзакции в разных валютах."""
+
+    def __init__(self, plan):
+        check_rounding_account()
+        self.plan = plan
+        self.parts = [[] for _ in plan.entries]
+
+    def add(self, df, date_format=None):
+        """Добавляет итоги части файла по группам для каждого набора проводок."""
+        if not len(df):
+            return
+        dates, _ = normalize_dates(df[self.plan.date_column], dayfirst_fallback=self.plan.dayfirst_fallback,
+                                   date_format=date_format)
+        keys = pd.DataFrame({'date': dates, 'provider': df['Payment Provider'].to_numpy(dtype=object),
+                             'order': df['Order'].astype(str).to_numpy(dtype=object)})
+        for index, (_, condition) in enumerate(self.plan.entries):
+            frame = keys.copy()
+            for number, (entry, _, debit, credit, account) in enumerate(self.plan.lines):
+                if entry != index:
+                    continue
+                frame[f'amount{number}'] = pd.to_numeric(df[debit or credit]).to_numpy()
+                frame[f'account{number}'] = account(df)
+            if condition is not None:
+                frame = frame[condition(df)]
+            self.parts[index].append(self.aggregate(frame))
+
+    @staticmethod
+    def aggregate(frame):
+        """Итоги по группам: число строк, первый и последний номер заказа, суммы и счет строки."""
+        functions = {'order': ['size', 'min', 'max']}
+        for column in frame.columns:
+            if column.startswith('amount'):
+                functions[column] = 'sum'
+            elif column.startswith('account'):
+                functions[column] = 'first'
+        grouped = frame.groupby(GROUP_KEYS, sort=False, dropna=False).agg(functions)
+        grouped.columns = ['count', 'first_order', 'last_order'] + list(grouped.columns[3:].get_level_values(0))
+        return grouped
+
+    def combine(self, index):
+        """Складывает итоги частей файла для набора проводок."""
+        parts = self.parts[index]
+        if not parts:
+            return None
+        totals = pd.concat(parts)
+        functions = {'count': 'sum', 'first_order': 'min', 'last_order': 'max'}
+        for column in totals.columns:
+            if column.startswith('amount'):
+                functions[column] = 'sum'
+            elif column.startswith('account'):
+                functions[column] = 'first'
+        totals = totals.groupby(level=GROUP_KEYS, sort=False, dropna=False).agg(functions)
+        amounts = [column for column in totals.columns if column.startswith('amount')]
+        totals[amounts] = totals[amounts].round(2)
+        return totals
+
+    def balance(self, index, totals):
+        """Считает разницу дебета и кредита набора по группам (колонка rounding).
+        Разница больше допустимого округления (BALANCE_TOLERANCE на заказ) - ошибка: такие суммы
+        не должны проводиться на счет округления."""
+        debit = [f'amount{n}' for n, (entry, _, d, _, _) in enumerate(self.plan.lines) if entry == index and d]
+        credit = [f'amount{n}' for n, (entry, _, _, c, _) in enumerate(self.plan.lines) if entry == index and c]
+        if not (debit and credit):
+            return
+        difference = (totals[debit].sum(axis=1) - totals[credit].sum(axis=1)).round(2)
+        limit = totals['count'] * BALANCE_TOLERANCE + 0.01
+        excess = difference.abs() > limit
+        if excess.any():
+            date, provider = difference[excess].index[0]
+            raise ValueError(f"Разница дебета и кредита сводной проводки {date} {provider} "
+                             f"({difference[excess].iloc[0]}) больше допустимого округления")
+        totals['rounding'] = difference
+        if (difference != 0).any():
+            logging.info(f"Сводный журнал, набор {index}: разница округления {difference.sum():.2f} "
+                         f"в {int((difference != 0).sum())} проводках отнесена на счет {ROUNDING_ACCOUNT}")
+
+    @staticmethod
+    def lines_frame(totals, numbers, order, debit, credit, accounts):
+        """Строки JDT по группам итогов: одна строка на проводку с суммой в Debit или Credit.
+        :param order: Порядок строки внутри проводки."""
+        size = len(totals)
+        memo = [format_memo(*values) for values in
+                zip(totals['count'], totals['first_order'], totals['last_order'])]
+        dates = totals.index.get_level_values('date').to_numpy(dtype=object)
+        return pd.DataFrame({
+            'ParentKey': numbers.reindex(totals.index).to_numpy(),
+            'JdtNum': numbers.reindex(totals.index).to_numpy(),
+            'order': np.full(size, order),
+            'Debit': np.asarray(debit, dtype=object),
+            'Credit': np.asarray(credit, dtype=object),
+            'DueDate': dates,
+            'ShortName': np.asarray(accounts, dtype=object),
+            'LineMemo': np.array(memo, dtype=object),
+            'ReferenceDate1': dates,
+            'Reference1': totals.index.get_level_values('provider').to_numpy(dtype=object),
+            'Reference2': [f"{first} - {last}" for first, last in zip(totals['first_order'], totals['last_order'])],
+            'TaxDate': dates,
+        })
+
+    def build(self):
+        """Строит сводные JDT и OJDT.
+        :return: (DataFrame строк JDT, DataFrame заголовков OJDT)"""
+        entries = []
+        for index in range(len(self.plan.entries)):
+            totals = self.combine(index)
+            if totals is not None:
+                self.balance(index, totals)
+            entries.append(totals)
+        if entries[0] is None:
+            return pd.DataFrame(), pd.DataFrame()
+
+        # Номера проводок - по группам первого набора (транзакций), отсортированным по дате и провайдеру
+        groups = entries[0].sort_index(na_position='last')
+        numbers = pd.Series(np.arange(1, len(groups) + 1), index=groups.index)
+
+        lines = []
+        for number, (entry, _, debit, credit, _) in enumerate(self.plan.lines):
+            totals = entries[entry]
+            if totals is None:
+                continue
+            amount = totals[f'amount{number}']
+            # Строки без суммы (например, группы без Additional Fee) не создаются
+            totals = totals[amount.notna() & (amount != 0)]
+            amount = totals[f'amount{number}'].to_numpy(dtype=object)
+            empty = np.full(len(totals), '', dtype=object)
+            lines.append(self.lines_frame(totals, numbers, number, amount if debit else empty,
+                                          amount if credit else empty, totals[f'account{number}']))
+        # Разница округления - последней строкой проводки: дебет при избытке кредита, кредит при избытке дебета
+        for index, totals in enumerate(entries):
+            if totals is None or 'rounding' not in totals:
+                continue
+            totals = totals[totals['rounding'] != 0]
+            rounding = totals['rounding'].to_numpy(dtype=object)
+            lines.append(self.lines_frame(totals, numbers, len(self.plan.lines) + index,
+                                          np.where(rounding < 0, -rounding, ''), np.where(rounding > 0, rounding, ''),
+                                          np.full(len(totals), ROUNDING_ACCOUNT, dtype=object)))
+        jdt_df = pd.concat(lines, ignore_index=True).sort_values(['JdtNum', 'order'], kind='stable')
+        # Первая строка проводки без LineNum, следующие - 1, 2, ... как в детальном журнале
+        line_numbers = jdt_df.groupby('JdtNum').cumcount()
+        jdt_df.insert(2, 'LineNum', np.where(line_numbers == 0, '', line_numbers.astype(str)).astype(object))
+        jdt_df = jdt_df.drop(columns='order').reset_index(drop=True)
+
+        dates = groups.index.get_level_values('date').to_numpy(dtype=object)
+        ojdt_df = pd.DataFrame({
+            'JdtNum': numbers.to_numpy(),
+            'ReferenceDate': dates,
+            'Memo': [format_memo(*values) for values in
+                     zip(groups['count'], groups['first_order'], groups['last_order'])],
+            'Reference': groups.index.get_level_values('provider').to_numpy(dtype=object),
+            'Reference2': [f"{first} - {last}" for first, last in zip(groups['first_order'], groups['last_order'])],
+            'TaxDate': dates,
+            'DueDate': dates,
+        })
+        return jdt_df, ojdt_df
+
+    def write(self, jdt_template, ojdt_template, jdt_output, ojdt_output):
+        """Записывает сводные JDT и OJDT по шаблонам отчета.
+        :return: Количество проводок (групп)."""
+        jdt_df, ojdt_df = self.build()
+        write_journal(jdt_df, jdt_template, jdt_output)
+        write_journal(ojdt_df, ojdt_template, ojdt_output)
+        return len(ojdt_df)
@@ -0,0 +1,44 @@
+import os
+import logging
+import pandas as pd
+from config.settings import TEMPLATES_DIR
+
+# Шаблоны отчетов
+JDT_COMPLETED = os.path.join(TEMPLATES_DIR, 'jdt_completed.csv')
+OJDT_COMPLETED = os.path.join(TEMPLATES_DIR, 'ojdt_completed.csv')
+JDT_PAYD = os.path.join(TEMPLATES_DIR, 'jdt_template.csv')
+OJDT_PAYD = os.path.join(TEMPLATES_DIR, 'ojdt_template.csv')
+
+ALL_TEMPLATES = [JDT_COMPLETED, OJDT_COMPLETED, JDT_PAYD, OJDT_PAYD]
+
+_cache = {}
+
+
+class Template:
+    """Шаблон отчета: названия колонок и заранее отрисованные две строки заголовков."""
+
+    def __init__(self, path):
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Шаблон не найден: {path}")
+        # Читаем шаблон и сохраняем только первую строку
+        template_df = pd.read_csv(path, nrows=1)
+        self.path = path
+        self.columns = list(template_df.columns)
+        self.positions = {column: index for index, column in enumerate(self.columns)}
+        # Заголовки отрисовываются тем же to_csv, что и раньше, поэтому совпадают побайтно
+        self.header = template_df.to_csv(index=False)
+
+
+def load_template(path):
+    """Возвращает шаблон из кэша, читая его с диска только при первом обращении."""
+    template = _cache.get(path)
+    if template is None:
+        template = _cache[path] = Template(path)
+    return template
+
+
+def preload_templates():
+    """Загружает все шаблоны заранее (при запуске бота и процессов пула)."""
+    for path in ALL_TEMPLATES:
+        load_template(path)
+    logging.info(f"Загружено шаблонов: {len(_cache)}")
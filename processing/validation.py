@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+from config import mappings
+from processing import completed, payd
+from processing.dates import unparsed_mask
+from processing.loader import resolve_columns
+from processing.rules import get_plan
+from processing.journal import write_text
+from config.settings import BALANCE_TOLERANCE
+
+# Правила проверки по типу отчета; колонка дат и ее формат берутся из правил проводок (get_plan)
+RULES = {
+    'completed': {
+        'columns': completed.INPUT_COLUMNS,
+        # Суммы, без которых проводка не создается, и суммы, которые могут быть пустыми
+        'amounts': ['Total Fee EUR', 'Reseller\nFee EUR', 'Net\nFee EUR'],
+        'optional_amounts': ['Additionall Fee'],
+        # Total Fee EUR должен совпадать с Reseller Fee + Net Fee
+        'balance': ('Total Fee EUR', ['Reseller\nFee EUR', 'Net\nFee EUR']),
+    },
+    'payd': {
+        'columns': payd.INPUT_COLUMNS,
+        'amounts': ['Fval EUR'],
+        'optional_amounts': [],
+        'balance': None,
+    },
+}
+
+# Служебные колонки файла отклоненных строк
+FILE_COLUMN = 'File'
+ROW_COLUMN = 'Row'
+REASON_COLUMN = 'Reason'
+
+
+def check_columns(report_type, columns):
+    """Проверяет, что в файле есть все колонки, нужные для генерации.
+    Без них файл не обрабатывается целиком, поэтому ошибка возникает до генерации."""
+    missing = [column for column in RULES[report_type]['columns'] if column not in columns]
+    if missing:
+        names = ", ".join(repr(column.replace('\n', ' ')) for column in missing)
+        raise ValueError(f"В файле нет обязательных колонок: {names}")
+
+
+def check_header(report_type, header):
+    """Проверяет обязательные колонки по строке заголовков, до чтения всего файла."""
+    check_columns(report_type, resolve_columns(header, RULES[report_type]['columns']).values())
+
+
+def find_problems(report_type, df, date_format=None):
+    """Проверяет строки по колонкам целиком, без обхода строк.
+    :param date_format: Формат колонки дат, определенный по всему файлу (при обработке по частям).
+    :return: (список пар (маска строк, причина), {колонка: суммы как числа})"""
+    rules = RULES[report_type]
+    plan = get_plan(report_type)
+    problems, numbers = [], {}
+
+    for column in rules['amounts'] + rules['optional_amounts']:
+        values = df[column]
+        present = values.notna().to_numpy()
+        numbers[column] = pd.to_numeric(values, errors='coerce')
+        problems.append((present & numbers[column].isna().to_numpy(), f"{column} - не число"))
+        if column in rules['amounts']:
+            problems.append((~present, f"{column} - пустое значение"))
+
+    # Провайдер должен быть в каждой таблице счетов, которую используют правила проводок
+    providers = df['Payment Provider']
+    for name in plan.mappings:
+        problems.append((~providers.isin(list(getattr(mappings, name))).to_numpy(),
+                         "Payment Provider - нет счета в config.mappings"))
+
+    dates = df[plan.date_column]
+    problems.append((dates.isna().to_numpy(), f"{plan.date_column} - пустая дата"))
+    problems.append((unparsed_mask(dates, dayfirst_fallback=plan.dayfirst_fallback, date_format=date_format),
+                     f"{plan.date_column} - неизвестный формат даты"))
+
+    if rules['balance'] is not None:
+        total, parts = rules['balance']
+        difference = (numbers[total] - sum(numbers[part] for part in parts)).abs()
+        # Небольшое расхождение - округление Reseller/Net Fee до десятых в выгрузке
+        problems.append(((difference > BALANCE_TOLERANCE + 1e-9).to_numpy(),
+                         f"{total} не равен {' + '.join(parts)}"))
+
+    # Одинаковые причины (например, по двум таблицам счетов) объединяются
+    merged = {}
+    for mask, reason in problems:
+        merged[reason] = merged[reason] | mask if reason in merged else mask
+    return [(mask, reason) for reason, mask in merged.items()], numbers
+
+
+def validate(report_type, df, first_row=1, date_format=None):
+    """Отделяет строки, которые нельзя провести, до генерации отчетов.
+    :param first_row: Номер первой строки df в исходном файле (для потоковой обработки по частям).
+    :param date_format: Формат колонки дат, определенный по всему файлу (для потоковой обработки по частям).
+    :return: (DataFrame строк для генерации, DataFrame отклоненных строк с номером и причиной)"""
+    check_columns(report_type, df.columns)
+    columns = RULES[report_type]['columns']
+    problems, numbers = find_problems(report_type, df, date_format)
+
+    rejected = np.zeros(len(df), dtype=bool)
+    for mask, _ in problems:
+        rejected |= mask
+    positions = np.flatnonzero(rejected)
+    # Причины собираются только для отклоненных строк
+    reasons = ["; ".join(reason.replace('\n', ' ') for mask, reason in problems if mask[position])
+               for position in positions]
+    rejects = df.iloc[positions][columns].reset_index(drop=True)
+    rejects.insert(0, REASON_COLUMN, reasons)
+    rejects.insert(0, ROW_COLUMN, positions + first_row)
+
+    clean = df[~rejected].reset_index(drop=True) if len(positions) else df
+    if len(positions):
+        # Суммы, прочитанные как текст из-за отклоненных строк, снова становятся числами
+        for column in numbers:
+            if pd.api.types.is_string_dtype(clean[column]):
+                clean[column] = pd.to_numeric(clean[column])
+    return clean, rejects
+
+
+def attach_sources(rejects, sources):
+    """Заменяет сквозные номера строк пакета номерами строк в исходных файлах и добавляет имя файла.
+    :param sources: Список пар (имя файла, число строк) в порядке объединения файлов."""
+    ends = np.cumsum([rows for _, rows in sources])
+    starts = ends - [rows for _, rows in sources]
+    positions = rejects[ROW_COLUMN].to_numpy()
+    # Файл строки - первый, на котором сквозной номер не превышает конец файла
+    index = np.searchsorted(ends, positions)
+    rejects = rejects.copy()
+    rejects[ROW_COLUMN] = positions - starts[index]
+    rejects.insert(0, FILE_COLUMN, np.array([name for name, _ in sources], dtype=object)[index])
+    return rejects
+
+
+def write_rejects(rejects, output):
+    """Записывает отклоненные строки в CSV (путь или файловый объект)."""
+    write_text(output, rejects.to_csv(index=False, lineterminator='\n'))
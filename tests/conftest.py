@@ -0,0 +1,39 @@
+import os
+import sys
+import tempfile
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Настройки читаются при импорте config.settings: журналы и архивы тестов - во временной директории
+STATE_DIR = tempfile.mkdtemp(prefix='tests-')
+os.environ.update({
+    'LEDGER_PATH': os.path.join(STATE_DIR, 'ledger.sqlite3'),
+    'JOBS_PATH': os.path.join(STATE_DIR, 'jobs.sqlite3'),
+    'CACHE_DIR': os.path.join(STATE_DIR, 'cache'),
+    'JOURNAL_ARCHIVE_DIR': os.path.join(STATE_DIR, 'journal_archive'),
+    # Счета по умолчанию нет: в тестах - условный счет разницы округления
+    'ROUNDING_ACCOUNT': '799999',
+})
+
+# Образец выгрузки COMPLETED: в нем есть колонки и PAYD, и COMPLETED отчетов
+SAMPLE_FILE = os.path.join(ROOT, 'templates', 'completed.csv')
+
+
+@pytest.fixture
+def sample():
+    """Образец выгрузки без преобразования значений."""
+    return pd.read_csv(SAMPLE_FILE, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+
+
+def write_report(df, path):
+    """Записывает выгрузку в CSV так же, как ее отдает платформа."""
+    df.to_csv(path, index=False, encoding='utf-8')
+    return str(path)
+
+
+def read_journal(path):
+    """Строки JDT или OJDT без второй строки заголовков DTW."""
+    return pd.read_csv(path, skiprows=[1], dtype=str, keep_default_na=False)
@@ -0,0 +1,255 @@
+# Локальный Service Layer SAP Business One для тестов проведения отчетов (tests/test_sap.py)
+# и ручной проверки без сервера SAP:
+#     python tests/fake_sap.py --port 50000
+#     SAP_ENABLED=1 SAP_URL=http://127.0.0.1:50000/b1s/v1 python main.py
+#     python -m bot.sap jdt.csv ojdt.csv --url http://127.0.0.1:50000/b1s/v1
+#     python tests/fake_sap.py --fail-rate 0.3 --delay 0.5   # часть пакетов создается, но ответ теряется
+#
+# Поддерживаются Login/Logout, GET JournalEntries ($select, $filter по startswith и eq, страницы
+# с odata.nextLink) и POST $batch с changeset: проводки пакета создаются все или ни одной.
+# Проводки хранятся в памяти; как и в SAP, одинаковый Reference3 не запрещен - дубли видны в /Stats.
+import re
+import json
+import uuid
+import random
+import asyncio
+import argparse
+from urllib.parse import quote
+from aiohttp import web
+
+PREFIX = '/b1s/v1'
+
+# Сколько проводок на странице, если клиент не прислал Prefer: odata.maxpagesize (как в SAP)
+DEFAULT_PAGE_SIZE = 20
+
+
+def sap_error(code, text):
+    """Тело ошибки в формате Service Layer (OData v3)."""
+    return {"error": {"code": code, "message": {"lang": "en-us", "value": text}}}
+
+
+def split_parts(body, boundary):
+    """Части multipart: текст каждой части без разделителей."""
+    parts = []
+    for chunk in body.split(f"--{boundary}")[1:]:
+        if chunk.startswith('--'):
+            break
+        parts.append(chunk.strip('\r\n'))
+    return parts
+
+
+def split_message(text):
+    """Разделяет заголовки и тело: (список строк заголовков, тело)."""
+    parts = re.split(r'\r?\n\r?\n', text, maxsplit=1)
+    return parts[0].splitlines(), parts[1] if len(parts) > 1 else ''
+
+
+def header_boundary(headers):
+    """boundary из заголовка Content-Type: multipart/mixed или None."""
+    for line in headers:
+        match = re.match(r'content-type:\s*multipart/mixed;\s*boundary=(\S+)', line, re.I)
+        if match:
+            return match.group(1)
+    return None
+
+
+def response_part(status, reason, payload, content_id=None):
+    """Ответ на один запрос внутри ответа $batch."""
+    lines = ["Content-Type: application/http", "Content-Transfer-Encoding: binary"]
+    if content_id is not None:
+        lines.append(f"Content-ID: {content_id}")
+    lines += ["", f"HTTP/1.1 {status} {reason}", "Content-Type: application/json;odata=minimalmetadata;charset=utf-8",
+              "", json.dumps(payload, ensure_ascii=False)]
+    return "\r\n".join(lines)
+
+
+def validate_entry(entry):
+    """Проверки SAP, без которых проводка не создается. :return: Текст ошибки или None."""
+    lines = entry.get('JournalEntryLines') or []
+    if len(lines) < 2:
+        return "Journal entry must contain at least two lines"
+    if any(not (line.get('AccountCode') or line.get('ShortName')) for line in lines):
+        return "Enter G/L account or business partner code"
+    debit = round(sum(line.get('Debit', 0) for line in lines), 2)
+    credit = round(sum(line.get('Credit', 0) for line in lines), 2)
+    if debit != credit:
+        return f"Unbalanced transaction (debit {debit}, credit {credit})"
+    if len(entry.get('Reference3', '')) > 27:
+        return "Value too long in property 'Reference3' of 'JournalEntry'"
+    return None
+
+
+class FakeServiceLayer:
+    """Состояние локального Service Layer: сессии и созданные проводки в памяти.
+    :param fail_rate: Доля пакетов, которые создаются, но отвечают 503 (потерянный ответ).
+    :param delay: Задержка обработки $batch в секундах (медленный SAP, проверка параллельности)."""
+
+    def __init__(self, fail_rate=0.0, delay=0.0, seed=None):
+        self.fail_rate = fail_rate
+        self.delay = delay
+        self.random = random.Random(seed)
+        self.sessions = set()
+        self.entries = []
+        self.batches = 0
+        self.failed_batches = 0
+        self.connections = set()
+        self.active = 0
+        self.max_active = 0
+
+    def expire_sessions(self):
+        """Завершает все сессии: следующий запрос клиента получит 401."""
+        self.sessions.clear()
+
+    def duplicates(self):
+        """Количество проводок с уже встречавшимся Reference3."""
+        references = [entry.get('Reference3') for entry in self.entries]
+        return len(references) - len(set(references))
+
+    def stats(self):
+        return {'entries': len(self.entries), 'duplicates': self.duplicates(), 'batches': self.batches,
+                'failed_batches': self.failed_batches, 'connections': len(self.connections),
+                'max_concurrent': self.max_active}
+
+    @web.middleware
+    async def middleware(self, request, handler):
+        peer = request.transport.get_extra_info('peername') if request.transport else None
+        self.connections.add(peer)
+        if request.path not in (f"{PREFIX}/Login", f"{PREFIX}/Stats") \
+                and request.cookies.get('B1SESSION') not in self.sessions:
+            return web.json_response(sap_error(301, "Invalid session or session already timeout."), status=401)
+        return await handler(request)
+
+    async def login(self, request):
+        credentials = await request.json()
+        if not credentials.get('UserName'):
+            return web.json_response(sap_error(-304, "Fail to get DB Credentials from SLD"), status=401)
+        session_id = str(uuid.uuid4())
+        self.sessions.add(session_id)
+        response = web.json_response({"odata.metadata": f"{PREFIX}/$metadata#B1Sessions/@Element",
+                                      "SessionId": session_id, "Version": "1000000", "SessionTimeout": 30})
+        response.set_cookie('B1SESSION', session_id, path=PREFIX)
+        return response
+
+    async def logout(self, request):
+        self.sessions.discard(request.cookies.get('B1SESSION'))
+        return web.Response(status=204)
+
+    async def stats_handler(self, request):
+        return web.json_response(self.stats())
+
+    async def journal_entries(self, request):
+        """GET JournalEntries: $filter (startswith и eq через or), $select, $skip, страницы."""
+        condition = request.query.get('$filter', '')
+        found = self.entries
+        match = re.fullmatch(r"\s*startswith\((\w+),\s*'([^']*)'\)\s*", condition)
+        if match:
+            field, prefix = match.groups()
+            found = [entry for entry in found if str(entry.get(field, '')).startswith(prefix)]
+        elif condition:
+            terms = re.findall(r"(\w+) eq '([^']*)'", condition)
+            if not terms:
+                return web.json_response(sap_error(-1000, f"Unsupported filter: {condition}"), status=400)
+            found = [entry for entry in found if any(str(entry.get(field)) == value for field, value in terms)]
+
+        page_size = DEFAULT_PAGE_SIZE
+        match = re.search(r'odata\.maxpagesize=(\d+)', request.headers.get('Prefer', ''))
+        if match:
+            page_size = int(match.group(1)) or len(found) or 1
+        skip = int(request.query.get('$skip', 0))
+        page = found[skip:skip + page_size]
+        select = [field for field in request.query.get('$select', '').split(',') if field]
+        if select:
+            page = [{field: entry.get(field) for field in select} for entry in page]
+        data = {"odata.metadata": f"{PREFIX}/$metadata#JournalEntries", "value": page}
+        if skip + page_size < len(found):
+            query = {key: value for key, value in request.query.items() if key != '$skip'}
+            query['$skip'] = str(skip + page_size)
+            data["odata.nextLink"] = "JournalEntries?" + "&".join(f"{key}={quote(value, safe='$,')}"
+                                                                  for key, value in query.items())
+        return web.json_response(data)
+
+    async def batch(self, request):
+        """POST $batch: каждый changeset создает все свои проводки или ни одной."""
+        boundary = header_boundary([f"Content-Type: {request.headers.get('Content-Type', '')}"])
+        if boundary is None:
+            return web.json_response(sap_error(-1000, "Batch request must be multipart/mixed"), status=400)
+        body = await request.text()
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            self.batches += 1
+            responses, committed = [], False
+            for part in split_parts(body, boundary):
+                headers, content = split_message(part)
+                changeset = header_boundary(headers)
+                if changeset is None:
+                    responses.append(response_part(400, "Bad Request", sap_error(-1000, "Only changesets are supported")))
+                    continue
+                requests = []
+                for request_part in split_parts(content, changeset):
+                    part_headers, http_request = split_message(request_part)
+                    request_lines, payload = split_message(http_request)
+                    content_id = next((line.split(':', 1)[1].strip() for line in part_headers
+                                       if line.lower().startswith('content-id')), None)
+                    method, path = request_lines[0].split()[:2]
+                    requests.append((method, path, payload, content_id))
+                error = None
+                for method, path, payload, _ in requests:
+                    if method != 'POST' or not path.endswith('/JournalEntries'):
+                        error = f"Unsupported request in changeset: {method} {path}"
+                    else:
+                        error = validate_entry(json.loads(payload))
+                    if error:
+                        break
+                if error:
+                    # Changeset откатывается целиком: в ответе одна ошибка
+                    responses.append(response_part(400, "Bad Request", sap_error(-5002, error)))
+                    continue
+                created = []
+                for _, _, payload, content_id in requests:
+                    entry = json.loads(payload)
+                    entry['JdtNum'] = len(self.entries) + 1
+                    self.entries.append(entry)
+                    created.append(response_part(201, "Created", entry, content_id))
+                committed = True
+                changeset_id = f"changesetresponse_{uuid.uuid4().hex}"
+                responses.append(f"Content-Type: multipart/mixed;boundary={changeset_id}\r\n\r\n"
+                                 + "".join(f"--{changeset_id}\r\n{item}\r\n" for item in created)
+                                 + f"--{changeset_id}--")
+            if committed and self.random.random() < self.fail_rate:
+                # Проводки созданы, но клиент ответа не получит
+                self.failed_batches += 1
+                return web.json_response(sap_error(-1, "Service Unavailable"), status=503)
+            batch_id = f"batchresponse_{uuid.uuid4().hex}"
+            text = "".join(f"--{batch_id}\r\n{item}\r\n" for item in responses) + f"--{batch_id}--\r\n"
+            return web.Response(body=text.encode('utf-8'), status=202,
+                                headers={'Content-Type': f'multipart/mixed;boundary={batch_id}'})
+        finally:
+            self.active -= 1
+
+    def create_app(self):
+        app = web.Application(middlewares=[self.middleware], client_max_size=256 * 1024 * 1024)
+        app.router.add_post(f"{PREFIX}/Login", self.login)
+        app.router.add_post(f"{PREFIX}/Logout", self.logout)
+        app.router.add_get(f"{PREFIX}/JournalEntries", self.journal_entries)
+        app.router.add_post(f"{PREFIX}/$batch", self.batch)
+        app.router.add_get(f"{PREFIX}/Stats", self.stats_handler)
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный Service Layer SAP для проверки проведения отчетов')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=50000)
+    parser.add_argument('--fail-rate', type=float, default=0.0,
+                        help='Доля пакетов, которые создаются, но отвечают ошибкой 503')
+    parser.add_argument('--delay', type=float, default=0.0, help='Задержка обработки $batch в секундах')
+    args = parser.parse_args()
+    server = FakeServiceLayer(fail_rate=args.fail_rate, delay=args.delay)
+    web.run_app(server.create_app(), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import asyncio
+import io
+import pandas as pd
+import pytest
+from processing import runner
+from processing.validation import FILE_COLUMN, ROW_COLUMN, REASON_COLUMN, find_problems
+from processing.rules import get_plan
+from conftest import read_journal
+
+
+def to_bytes(df):
+    return df.to_csv(index=False).encode('utf-8')
+
+
+@pytest.fixture
+def in_process(monkeypatch):
+    """Пул процессов не нужен: файлы пакета читаются и обрабатываются в текущем процессе."""
+    async def run_here(func, *args):
+        return func(*args)
+
+    monkeypatch.setattr(runner, 'run_in_pool', run_here)
+
+
+def test_batch_rejects_point_to_source_file_rows(sample, in_process):
+    first, second = sample.iloc[:30].copy(), sample.iloc[30:60].copy()
+    first.loc[first.index[4], 'Total Fee EUR'] = 'x'
+    second.loc[second.index[11], 'Completed'] = ''
+    files = [('first.csv', to_bytes(first)), ('second.csv', to_bytes(second))]
+
+    stats, *_, rejects, _ = asyncio.run(runner.run_batch_conversion('completed', files, summary=False))
+    rejected = pd.read_csv(io.BytesIO(rejects), dtype=str, keep_default_na=False)
+    assert stats['rejected'] == 2
+    assert rejected[[FILE_COLUMN, ROW_COLUMN]].values.tolist() == [['first.csv', '5'], ['second.csv', '12']]
+    assert rejected[REASON_COLUMN].iloc[1] == 'Completed - пустая дата'
+
+
+def test_batch_reads_each_file_in_its_own_date_format(sample, in_process):
+    # Одна выгрузка D/M, другая M/D: 05/02 и 02/05 - одна и та же дата 5 февраля
+    day_first, month_first = sample.iloc[:20].copy(), sample.iloc[20:40].copy()
+    day_first['Completed'] = ['13/02/2025 10:00:00'] + ['05/02/2025 10:00:00'] * 19
+    month_first['Completed'] = ['02/13/2025 10:00:00'] + ['02/05/2025 10:00:00'] * 19
+    files = [('day_first.csv', to_bytes(day_first)), ('month_first.csv', to_bytes(month_first))]
+
+    stats, jdt, *_ = asyncio.run(runner.run_batch_conversion('completed', files, summary=False))
+    assert stats['rejected'] == 0
+    assert set(read_journal(io.BytesIO(jdt))['DueDate']) == {'20250213', '20250205'}
+
+
+def test_date_checks_follow_posting_rules(sample, monkeypatch):
+    # Проверка дат берет колонку из правил проводок, а не из собственной копии
+    plan = get_plan('completed')
+    monkeypatch.setattr(plan, 'date_column', 'Paid')
+    sample.loc[0, 'Paid'] = None
+    problems, _ = find_problems('completed', sample)
+    reasons = {reason for mask, reason in problems if mask[0]}
+    assert 'Paid - пустая дата' in reasons
@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+from processing.dates import detect_column_format, normalize_dates, unparsed_mask, FormatDetector
+from processing.runner import convert_file
+from processing.streaming import stream_reports
+from conftest import write_report, read_journal
+
+
+def january_export(size=6378):
+    """Выгрузка PAYD за январь в M/D/YY, отсортированная по дате: первые дни подходят и к D/M."""
+    moments = pd.Timestamp('2025-01-01') + pd.to_timedelta(np.linspace(0, 31 * 24 * 3600 - 60, size), unit='s')
+    return pd.Series([f"{m.month}/{m.day}/{m:%y %H:%M}" for m in moments])
+
+
+def test_sorted_month_first_column_is_not_read_day_first():
+    dates = january_export()
+    assert detect_column_format(dates) == '%m/%d/%y %H:%M'
+    formatted, report = normalize_dates(dates, dayfirst_fallback=True)
+    assert set(report) == {'%m/%d/%y %H:%M'}
+    assert all(value.startswith('202501') for value in formatted)
+
+
+def test_column_never_mixes_day_and_month_order():
+    # 13/02/2025 подходит только к D/M, а колонка - M/D: значение не читается как 13 февраля
+    dates = pd.Series(['1/31/25 19:50', '2/01/25 10:00', '05/02/2025', '13/02/2025'])
+    formatted, report = normalize_dates(dates, dayfirst_fallback=True)
+    assert list(formatted[:3]) == ['20250131', '20250201', '20250502']
+    assert formatted[3] == '13/02/2025'
+    assert list(unparsed_mask(dates, dayfirst_fallback=True)) == [False, False, False, True]
+
+
+def test_detector_by_parts_matches_whole_column():
+    dates = january_export()
+    detector = FormatDetector()
+    for start in range(0, len(dates), 500):
+        detector.add(dates[start:start + 500])
+    assert detector.result() == detect_column_format(dates)
+
+
+def test_streaming_uses_format_of_whole_file(sample, tmp_path):
+    dates = january_export(len(sample))
+    sample['Paid'] = dates.to_numpy()
+    source = write_report(sample, tmp_path / 'payd.csv')
+    for streaming in (False, True):
+        jdt, ojdt = tmp_path / f'jdt_{streaming}.csv', tmp_path / f'ojdt_{streaming}.csv'
+        stats = convert_file('payd', source, str(jdt), str(ojdt), streaming=streaming, incremental=False)
+        assert stats['rejected'] == 0
+        assert read_journal(ojdt)['ReferenceDate'].str.startswith('202501').all()
+    # Первые части файла содержат только дни 1-12
+    ojdt = tmp_path / 'ojdt_parts.csv'
+    stream_reports('payd', source, str(tmp_path / 'jdt_parts.csv'), str(ojdt), chunksize=100)
+    assert read_journal(ojdt)['ReferenceDate'].str.startswith('202501').all()
@@ -0,0 +1,68 @@
+import asyncio
+from types import SimpleNamespace
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter
+from aiogram.methods import SendDocument
+import bot.handlers as handlers
+
+METHOD = SendDocument(chat_id=1, document='file')
+
+
+class FakeMessage:
+    """Сообщение пользователя: запоминает ответы бота."""
+    def __init__(self):
+        self.chat = SimpleNamespace(id=1)
+        self.answers = []
+
+    async def answer(self, text, **kwargs):
+        self.answers.append(text)
+
+
+class FlakyBot:
+    """Бот, у которого первые отправки файла завершаются переданными ошибками."""
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.attempts = 0
+
+    async def send_document(self, chat_id, document):
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'sent'
+
+    async def send_message(self, chat_id, text):
+        pass
+
+
+def deliver(bot, monkeypatch):
+    """Отправляет файл без реального ожидания, возвращает результат и паузы между попытками."""
+    delays = []
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(handlers.asyncio, 'sleep', sleep)
+    result = asyncio.run(handlers.send_file_with_retry(FakeMessage(), b'data', 'jdt.csv', bot))
+    return result, delays
+
+
+def test_network_errors_are_retried_with_backoff(monkeypatch):
+    bot = FlakyBot([TelegramNetworkError(METHOD, 'timeout'), TelegramNetworkError(METHOD, 'timeout')])
+    result, delays = deliver(bot, monkeypatch)
+    assert result == 'sent'
+    assert bot.attempts == 3
+    assert delays == [2, 4]
+
+
+def test_flood_control_waits_as_requested(monkeypatch):
+    bot = FlakyBot([TelegramRetryAfter(METHOD, 'flood', retry_after=7)])
+    result, delays = deliver(bot, monkeypatch)
+    assert result == 'sent'
+    assert delays == [7]
+
+
+def test_gives_up_after_all_attempts(monkeypatch):
+    bot = FlakyBot([TelegramNetworkError(METHOD, 'timeout')] * 3)
+    result, delays = deliver(bot, monkeypatch)
+    assert result is False
+    assert bot.attempts == 3
+    assert delays == [2, 4]
@@ -0,0 +1,62 @@
+import asyncio
+from aiogram import Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.types import Update
+from bot.handlers import router
+from bot.fake_update import build_update
+from processing.journal_archive import JournalArchive, format_found
+from processing.runner import convert_buffer
+from config.settings import ADMIN_ID
+
+# Роутер можно подключить только к одному диспетчеру
+DISPATCHER = Dispatcher()
+DISPATCHER.include_router(router)
+
+
+class RecordingSession(BaseSession):
+    """Сессия без сети: запоминает запросы бота к Telegram."""
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append(method)
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b''
+
+    async def close(self):
+        pass
+
+
+def replies_to(text, user_id):
+    """Тексты ответов бота на сообщение пользователя user_id."""
+    session = RecordingSession()
+    bot = Bot('42:TEST', session=session)
+    update = Update.model_validate(build_update(text, user_id=user_id), context={'bot': bot})
+    asyncio.run(DISPATCHER.feed_update(bot, update))
+    return [request.text for request in session.requests]
+
+
+def test_find_is_answered_for_admin():
+    replies = replies_to('/find BE194612', ADMIN_ID)
+    assert len(replies) == 1
+
+
+def test_find_is_ignored_for_other_users():
+    assert replies_to('/find BE194612', ADMIN_ID + 1) == []
+
+
+def test_found_line_without_amounts_is_formatted(sample, tmp_path):
+    # Строка с пустыми Debit и Credit (нулевая сумма) не должна ломать ответ /find
+    _, jdt, *_ = convert_buffer('completed', sample.iloc[:3].to_csv(index=False).encode('utf-8'))
+    lines = jdt.decode('utf-8').split('\n')
+    fields = lines[2].split(',')
+    fields[4] = fields[5] = ''
+    lines[2] = ','.join(fields)
+    archive = JournalArchive(str(tmp_path))
+    archive.add('\n'.join(lines).encode('utf-8'), report_type='completed')
+
+    rows = archive.find(sample['Order'].iloc[0])
+    assert any(row['debit'] is None and row['credit'] is None for row in rows)
+    assert 'Кт 0.00' in format_found(rows)
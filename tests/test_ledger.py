@@ -0,0 +1,102 @@
+import asyncio
+import multiprocessing
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+import pytest
+import bot.handlers as handlers
+from processing import runner
+from conftest import write_report, read_journal
+
+
+def convert(input_file, jdt_output, ojdt_output, streaming=False):
+    """Инкрементальная конвертация в процессе пула, как у convert.py -w и у бота."""
+    return runner.convert_file('completed', input_file, jdt_output, ojdt_output, streaming=streaming,
+                               incremental=True)
+
+
+@pytest.fixture
+def ledger_path(tmp_path, monkeypatch):
+    """Отдельный журнал заказов для теста; процессы пула наследуют его через fork."""
+    path = str(tmp_path / 'ledger.sqlite3')
+    monkeypatch.setattr(runner, 'LEDGER_PATH', path)
+    monkeypatch.setattr(handlers, 'LEDGER_PATH', path)
+    return path
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_concurrent_conversions_post_each_order_once(sample, tmp_path, ledger_path, streaming):
+    files = [write_report(sample, tmp_path / f'export_{i}.csv') for i in range(2)]
+    outputs = [(str(tmp_path / f'jdt_{i}.csv'), str(tmp_path / f'ojdt_{i}.csv')) for i in range(2)]
+    with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context('fork')) as pool:
+        futures = [pool.submit(convert, source, *paths, streaming) for source, paths in zip(files, outputs)]
+        stats = [future.result() for future in futures]
+
+    # Заказ попадает в отчеты только одной из задач, вторая его пропускает
+    orders = [set(read_journal(ojdt)['Reference2']) - {''} for _, ojdt in outputs]
+    assert orders[0] | orders[1] and not orders[0] & orders[1]
+    assert sum(stat['skipped'] for stat in stats) + sum(stat['rejected'] for stat in stats) == len(sample)
+
+
+def test_failed_conversion_releases_claimed_orders(sample, tmp_path, ledger_path):
+    source = write_report(sample, tmp_path / 'export.csv')
+    missing = str(tmp_path / 'missing' / 'jdt.csv')
+    with pytest.raises(OSError):
+        runner.convert_file('completed', source, missing, missing, incremental=True)
+
+    stats = runner.convert_file('completed', source, str(tmp_path / 'jdt.csv'), str(tmp_path / 'ojdt.csv'),
+                                incremental=True)
+    assert stats['skipped'] == 0
+    assert stats['rows'] > 0
+
+
+class DeliveryBot:
+    """Бот, который отправляет файлы или отклоняет все отправки."""
+    def __init__(self, fail):
+        self.fail = fail
+
+    async def send_document(self, chat_id, document):
+        if self.fail:
+            raise ValueError('file is too big')
+        return SimpleNamespace(document=SimpleNamespace(file_id=f'id-{document.filename}'))
+
+    async def send_message(self, chat_id, text):
+        pass
+
+
+def test_resumed_job_gets_its_undelivered_orders_back(sample, tmp_path, ledger_path, monkeypatch):
+    monkeypatch.setattr(handlers, 'INCREMENTAL_MODE', True)
+    source = write_report(sample, tmp_path / 'export.csv')
+    message = SimpleNamespace(chat=SimpleNamespace(id=1), message_id=10)
+    owner = handlers.claims_owner(message)
+
+    def run(owner):
+        jdt, ojdt = str(tmp_path / 'jdt.csv'), str(tmp_path / 'ojdt.csv')
+        stats = runner.convert_file('completed', source, jdt, ojdt, incremental=True, owner=owner)
+        return stats, [('jdt.csv', jdt), ('ojdt.csv', ojdt)]
+
+    # Отчеты созданы, но не доставлены: заказы остаются за задачей
+    first, outputs = run(owner)
+    orders = set(read_journal(outputs[1][1])['Reference2'])
+    with pytest.raises(RuntimeError):
+        asyncio.run(handlers.deliver_new_reports(message, DeliveryBot(fail=True), outputs))
+    assert run('1:11')[0]['skipped'] == first['rows'] - first['rejected']
+
+    # Задача после перезапуска получает свои заказы обратно, а после доставки они проведены
+    resumed, outputs = run(owner)
+    assert resumed['skipped'] == 0
+    assert set(read_journal(outputs[1][1])['Reference2']) == orders
+    asyncio.run(handlers.deliver_new_reports(message, DeliveryBot(fail=False), outputs))
+    assert run(owner)[0]['skipped'] == first['rows'] - first['rejected']
+
+
+def test_failed_job_releases_its_orders(sample, tmp_path, ledger_path, monkeypatch):
+    monkeypatch.setattr(handlers, 'INCREMENTAL_MODE', True)
+    source = write_report(sample, tmp_path / 'export.csv')
+    message = SimpleNamespace(chat=SimpleNamespace(id=1), message_id=10)
+    runner.convert_file('completed', source, str(tmp_path / 'jdt.csv'), str(tmp_path / 'ojdt.csv'),
+                        incremental=True, owner=handlers.claims_owner(message))
+    handlers.release_claims(message)
+
+    stats = runner.convert_file('completed', source, str(tmp_path / 'jdt.csv'), str(tmp_path / 'ojdt.csv'),
+                                incremental=True, owner='1:11')
+    assert stats['skipped'] == 0
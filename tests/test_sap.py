@@ -0,0 +1,112 @@
+import asyncio
+import contextlib
+import pytest
+from aiohttp import web
+from bot import sap
+from processing.runner import convert_buffer
+from config.settings import ROUNDING_ACCOUNT, BALANCE_TOLERANCE
+from fake_sap import FakeServiceLayer
+
+
+@pytest.fixture
+def journals(sample):
+    """Сводные JDT и OJDT образца."""
+    _, _, _, _, summary = convert_buffer('completed', sample.to_csv(index=False).encode('utf-8'), summary=True)
+    return summary
+
+
+@pytest.fixture
+def detail_journals(sample):
+    """Детальные JDT и OJDT образца - их бот проводит в SAP по умолчанию. В части проводок
+    Total Fee отличается от Reseller + Net Fee на округление до десятых."""
+    _, jdt, ojdt, _, _ = convert_buffer('completed', sample.to_csv(index=False).encode('utf-8'))
+    return jdt, ojdt
+
+
+@contextlib.asynccontextmanager
+async def service_layer(server):
+    """Запускает локальный Service Layer на свободном порту, возвращает его адрес."""
+    runner = web.AppRunner(server.create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}/b1s/v1"
+    finally:
+        await runner.cleanup()
+
+
+def test_batches_create_each_entry_once(journals):
+    server = FakeServiceLayer()
+
+    async def push_twice():
+        async with service_layer(server) as url:
+            first = await sap.push_journals(*journals, url=url, user='manager', batch_size=20)
+            second = await sap.push_journals(*journals, url=url, user='manager', batch_size=20)
+        return first, second
+
+    first, second = asyncio.run(push_twice())
+    assert first['posted'] == first['entries'] == len(server.entries) > 0
+    assert server.batches == -(-first['entries'] // 20)
+    # Повторная отправка тех же файлов находит проводки по Reference3 и ничего не создает
+    assert second['posted'] == 0 and second['existing'] == first['entries']
+    assert server.duplicates() == 0
+
+
+def test_detail_entries_with_rounding_differences_are_created(detail_journals):
+    server = FakeServiceLayer()
+
+    async def push():
+        async with service_layer(server) as url:
+            return await sap.push_journals(*detail_journals, url=url, user='manager')
+
+    stats = asyncio.run(push())
+    assert stats['failed'] == 0, stats['errors'][:3]
+    assert stats['posted'] == stats['entries'] == len(server.entries)
+    # Разница округления - одной отдельной строкой, не больше допустимого расхождения
+    rounding = [[line for line in entry['JournalEntryLines'] if line['ShortName'] == ROUNDING_ACCOUNT]
+                for entry in server.entries]
+    assert any(rounding)
+    assert all(len(lines) <= 1 for lines in rounding)
+    assert all(line.get('Debit', line.get('Credit')) <= BALANCE_TOLERANCE for lines in rounding for line in lines)
+
+
+def test_lost_responses_and_expired_session_are_retried_without_duplicates(journals):
+    # Часть пакетов создается, но ответ теряется; сессия истекает до первого пакета
+    server = FakeServiceLayer(fail_rate=0.3, seed=1)
+    tag = sap.journal_tag(*journals)
+    entries = sap.build_entries(*journals, tag)
+
+    async def push():
+        async with service_layer(server) as url:
+            async with sap.ServiceLayer(url=url, user='manager', concurrency=4) as client:
+                server.expire_sessions()
+                return await sap.push_entries(client, entries, tag, batch_size=10, max_retries=10,
+                                              retry_delay=0.01)
+
+    stats = asyncio.run(push())
+    assert server.failed_batches > 0
+    assert stats['failed'] == 0
+    assert stats['posted'] + stats['existing'] == len(entries) == len(server.entries)
+    assert server.duplicates() == 0
+
+
+def test_rejected_entry_does_not_block_its_batch(journals):
+    jdt, ojdt = journals
+    lines = jdt.decode('utf-8').split('\n')
+    # Первая строка первой проводки (после двух строк заголовков) - дебет; проводка становится несбалансированной
+    fields = lines[2].split(',')
+    fields[4] = str(float(fields[4]) + 1)
+    lines[2] = ','.join(fields)
+    server = FakeServiceLayer()
+
+    async def push():
+        async with service_layer(server) as url:
+            return await sap.push_journals('\n'.join(lines).encode('utf-8'), ojdt, url=url, user='manager',
+                                           batch_size=20)
+
+    stats = asyncio.run(push())
+    assert stats['failed'] == 1
+    assert stats['posted'] == stats['entries'] - 1 == len(server.entries)
+    assert 'Unbalanced' in stats['errors'][0]
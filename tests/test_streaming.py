@@ -0,0 +1,50 @@
+import filecmp
+import pytest
+from processing import completed, payd
+from processing.streaming import stream_reports
+from conftest import write_report
+
+MODULES = {'completed': completed, 'payd': payd}
+
+
+def integer_amounts(sample):
+    """Выгрузка, где все суммы - целые числа: pandas читает их как int64."""
+    sample['Total Fee EUR'] = '10'
+    sample['Reseller\nFee EUR'] = '3'
+    sample['Net\nFee EUR'] = '7'
+    sample['Additionall Fee'] = '2'
+    sample['Fval EUR'] = '100'
+    return sample
+
+
+def compare_modes(report_type, source, tmp_path, chunksize=100):
+    """Отчеты потоковой обработки по частям и обработки в памяти совпадают побайтно."""
+    memory = [str(tmp_path / f'{report_type}_memory_{name}.csv') for name in ('jdt', 'ojdt')]
+    parts = [str(tmp_path / f'{report_type}_parts_{name}.csv') for name in ('jdt', 'ojdt')]
+    MODULES[report_type].write_reports(source, *memory)
+    stream_reports(report_type, source, *parts, chunksize=chunksize)
+    return [filecmp.cmp(a, b, shallow=False) for a, b in zip(memory, parts)]
+
+
+@pytest.mark.parametrize('report_type', ['completed', 'payd'])
+def test_integer_amounts_are_written_the_same_way(sample, tmp_path, report_type):
+    source = write_report(integer_amounts(sample), tmp_path / 'input.csv')
+    assert compare_modes(report_type, source, tmp_path) == [True, True]
+    with open(tmp_path / f'{report_type}_parts_jdt.csv') as handle:
+        assert '.0,' not in handle.read()
+
+
+@pytest.mark.parametrize('report_type', ['completed', 'payd'])
+def test_fraction_in_one_part_makes_whole_column_float(sample, tmp_path, report_type):
+    sample = integer_amounts(sample)
+    # Дробная сумма только в последней части файла
+    last = len(sample) - 1
+    sample.loc[last, ['Total Fee EUR', 'Reseller\nFee EUR', 'Fval EUR']] = ['10.5', '3.5', '100.5']
+    source = write_report(sample, tmp_path / 'input.csv')
+    assert compare_modes(report_type, source, tmp_path) == [True, True]
+
+
+@pytest.mark.parametrize('report_type', ['completed', 'payd'])
+def test_sample_export(sample, tmp_path, report_type):
+    source = write_report(sample, tmp_path / 'input.csv')
+    assert compare_modes(report_type, source, tmp_path) == [True, True]
@@ -0,0 +1,52 @@
+import io
+import pandas as pd
+import pytest
+from config import mappings
+from processing import completed, summary
+from processing.runner import convert_buffer
+from processing.summary import SummaryBuilder
+from config.settings import ROUNDING_ACCOUNT
+from conftest import read_journal
+
+
+def amounts(journal, column):
+    return pd.to_numeric(journal[column].replace('', None)).fillna(0)
+
+
+def test_rounding_difference_goes_to_rounding_account(sample, caplog):
+    # Reseller/Net Fee округлены до десятых: в каждом заказе 0.05 не хватает до Total Fee
+    sample = sample.iloc[:20].copy()
+    sample['Payment Provider'] = sample['Payment Provider'].iloc[0]
+    sample['Completed'] = sample['Completed'].iloc[0]
+    sample['Total Fee EUR'], sample['Reseller\nFee EUR'], sample['Net\nFee EUR'] = '10.05', '3', '7'
+    sample['Additionall Fee'] = '0'
+    data = sample.to_csv(index=False).encode('utf-8')
+
+    with caplog.at_level('INFO'):
+        stats, *_, (summary_jdt, _) = convert_buffer('completed', data, summary=True)
+    journal = read_journal(io.BytesIO(summary_jdt))
+    debit, credit = amounts(journal, 'Debit'), amounts(journal, 'Credit')
+    assert stats['entries'] == 1
+    assert debit.sum() == pytest.approx(credit.sum())
+    # Суммы Net Fee проводятся как в выгрузке, разница - отдельной строкой
+    net_fee = journal['ShortName'] == mappings.SPECIAL_MAPPINGS['net_fee_cc_apm']
+    rounding = journal['ShortName'] == ROUNDING_ACCOUNT
+    assert credit[net_fee].sum() == pytest.approx(140)
+    assert credit[rounding].sum() == pytest.approx(1.0)
+    assert f"разница округления 1.00 в 1 проводках отнесена на счет {ROUNDING_ACCOUNT}" in caplog.text
+
+
+def test_rounding_difference_over_tolerance_is_an_error(sample):
+    sample = sample.iloc[:2].copy()
+    sample['Total Fee EUR'], sample['Reseller\nFee EUR'], sample['Net\nFee EUR'] = '10', '3', '5'
+    sample['Additionall Fee'] = '0'
+    builder = SummaryBuilder(completed.PLAN)
+    builder.add(sample)
+    with pytest.raises(ValueError, match='округления'):
+        builder.build()
+
+
+def test_summary_needs_rounding_account(monkeypatch):
+    monkeypatch.setattr(summary, 'ROUNDING_ACCOUNT', '')
+    with pytest.raises(ValueError, match='ROUNDING_ACCOUNT'):
+        SummaryBuilder(completed.PLAN)